@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Control de admisión del servidor RPC
+
+Una sobrecarga no debe convertirse en colas que crecen sin límite y
+latencias de minutos, sino en rechazos rápidos que el cliente pueda
+reintentar más tarde. El servidor aplica tres mecanismos:
+
+- Capacidad por prioridad: `PriorityScheduler(capacity=...)` rechaza las
+  solicitudes que no caben en su nivel.
+- Límite por cliente: `ClientRateLimiter` mantiene un token bucket por
+  `client_id`, de modo que un solo cliente no puede ocupar toda la cola.
+- Plazos: una solicitud con `deadline_ms` que sigue en cola pasado ese
+  plazo se descarta al desencolarla, sin procesarla (el cliente ya ha
+  dejado de esperar la respuesta).
+
+Los rechazos por capacidad o por límite se responden de inmediato con
+`busy_response`: `{"status": "error", "error": "busy", "reason": ...,
+"retry_after": segundos}`. Los clientes de `cliente.py` reintentan tras
+`retry_after` más un retroceso exponencial aleatorio.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+BUSY = "busy"  # Código de error de una solicitud rechazada por sobrecarga
+DEADLINE_EXCEEDED = "deadline_exceeded"  # Código de error de una solicitud caducada
+MIN_RETRY_AFTER = 0.01  # Segundos mínimos que se piden al cliente antes de reintentar
+MAX_RETRY_AFTER = 5.0  # Segundos máximos que se piden al cliente antes de reintentar
+MAX_TRACKED_CLIENTS = 10_000  # Token buckets en memoria (se olvidan los menos recientes)
+
+
+def clamp_retry_after(seconds: float) -> float:
+    """Acota la espera sugerida al cliente"""
+    return round(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, seconds)), 3)
+
+
+def busy_response(reason: str, retry_after: float, message: str) -> Dict:
+    """Respuesta estructurada de una solicitud rechazada por sobrecarga"""
+    return {"status": "error", "error": BUSY, "reason": reason,
+            "retry_after": clamp_retry_after(retry_after), "message": message}
+
+
+class ServerBusy(Exception):
+    """
+    Rechazo por sobrecarga detectado al procesar una solicitud
+    
+    El servidor lo responde con `busy_response` en lugar de un error
+    genérico, para que el cliente reintente tras `retry_after`.
+    """
+    
+    def __init__(self, reason: str, retry_after: float, message: str):
+        super().__init__(reason, retry_after, message)  # `args` completos: se puede serializar
+        self.reason = reason
+        self.retry_after = retry_after
+        self.message = message
+    
+    def __str__(self) -> str:
+        return self.message
+    
+    def response(self) -> Dict:
+        return busy_response(self.reason, self.retry_after, self.message)
+
+
+def deadline_response(waited: float) -> Dict:
+    """Respuesta de una solicitud descartada por superar su plazo en cola"""
+    return {"status": "error", "error": DEADLINE_EXCEEDED,
+            "message": f"Plazo vencido tras {waited * 1e3:.0f} ms en cola"}
+
+
+def parse_rate(text: str) -> Tuple[float, float]:
+    """Convierte "TASA[:RÁFAGA]" en (tasa, ráfaga); la ráfaga por defecto es la tasa"""
+    rate, _, burst = text.partition(":")
+    rate = float(rate)
+    burst = float(burst) if burst else max(rate, 1.0)
+    if rate <= 0 or burst < 1:
+        raise ValueError("La tasa debe ser positiva y la ráfaga al menos 1")
+    return rate, burst
+
+
+class TokenBucket:
+    """Token bucket: `rate` solicitudes por segundo con ráfagas de hasta `burst`"""
+    
+    __slots__ = ("rate", "burst", "tokens", "updated")
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def take(self, now: float) -> float:
+        """
+        Consume un token si hay
+        
+        Returns:
+            0 si se admitió, o los segundos hasta que haya un token
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ClientRateLimiter:
+    """Un token bucket por cliente, thread-safe"""
+    
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 max_clients: int = MAX_TRACKED_CLIENTS):
+        """
+        Args:
+            rate: Solicitudes por segundo admitidas a cada cliente
+            burst: Solicitudes admitidas de golpe (por defecto, `rate`)
+            max_clients: Clientes con bucket en memoria; al superarlo se
+                olvida el menos reciente (vuelve con el bucket lleno)
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._buckets)
+    
+    def acquire(self, client: str) -> float:
+        """
+        Admite una solicitud de `client` si le quedan tokens
+        
+        Returns:
+            0 si se admitió, o los segundos que debe esperar el cliente
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            return bucket.take(now)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Pool de workers que crece y decrece con la carga de la cola
+
+El servidor atendía la cola con un número fijo de workers que, además,
+despertaban cada segundo aunque no hubiera trabajo. `WorkerPool`:
+
+- Arranca con `min_workers` workers generales, que atienden cualquier
+  prioridad en el orden que decida el planificador.
+- Un thread de control revisa la cola cada `interval` segundos y añade
+  workers (hasta `max_workers`) cuando hay al menos `scale_up_depth`
+  solicitudes en cola o la más antigua lleva `scale_up_wait` segundos
+  esperando: uno por cada `scale_up_depth` solicitudes en cola.
+- Un worker general que pasa `idle_timeout` segundos sin trabajo termina
+  si hay más de `min_workers`; los que quedan en el mínimo esperan en la
+  cola sin límite de tiempo y solo se despiertan cuando llega trabajo.
+- Con `reserved = {prioridad: n}` se arrancan además `n` workers que solo
+  atienden esa prioridad y no se retiran nunca: una ráfaga de inserciones
+  lentas puede ocupar todos los workers generales, pero no los reservados
+  a las consultas.
+
+Con `max_workers == min_workers` (lo predeterminado) el pool es fijo y no
+se arranca el thread de control.
+
+Cada decisión de escalado se registra en la traza (`[POOL] ...`), en las
+métricas (`rpc_workers`, `rpc_workers_busy`, `rpc_worker_scaling_total`)
+y en el historial que devuelve `status()` (incluido en `stats`).
+"""
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from metricas import MetricsRegistry
+from planificador import Entry, SchedulerQueue
+
+SCALE_UP_DEPTH = 20  # Solicitudes en cola que justifican un worker más
+SCALE_UP_WAIT = 0.5  # Segundos de espera de la más antigua que justifican un worker más
+IDLE_TIMEOUT = 10.0  # Segundos sin trabajo tras los que se retira un worker sobrante
+SCALE_INTERVAL = 0.25  # Segundos entre revisiones del thread de control
+DECISION_HISTORY = 50  # Decisiones de escalado recientes que se conservan
+
+
+def parse_reserved(text: str) -> Dict[int, int]:
+    """Convierte "PRIORIDAD:N[,PRIORIDAD:N]" en {prioridad: workers reservados}"""
+    reserved = {int(priority): int(count) for priority, count in
+                (pair.split(":") for pair in text.split(","))}
+    if any(count < 0 for count in reserved.values()):
+        raise ValueError("El número de workers reservados no puede ser negativo")
+    return {priority: count for priority, count in reserved.items() if count}
+
+
+class WorkerPool:
+    """Workers que atienden una `SchedulerQueue`, con autoescalado y reservas por prioridad"""
+    
+    def __init__(self, work_queue: SchedulerQueue, handle: Callable[[Entry], None],
+                 min_workers: int, max_workers: Optional[int] = None,
+                 reserved: Optional[Dict[int, int]] = None,
+                 scale_up_depth: int = SCALE_UP_DEPTH, scale_up_wait: float = SCALE_UP_WAIT,
+                 idle_timeout: float = IDLE_TIMEOUT, interval: float = SCALE_INTERVAL,
+                 metrics: Optional[MetricsRegistry] = None,
+                 log: Callable[[str], None] = print):
+        """
+        Args:
+            work_queue: Cola de la que se desencolan las solicitudes
+            handle: Procesa una entrada desencolada (y responde al cliente)
+            min_workers: Workers generales siempre activos
+            max_workers: Máximo de workers generales (None: `min_workers`)
+            reserved: Workers adicionales dedicados a cada prioridad
+            scale_up_depth: Solicitudes en cola que disparan el crecimiento
+            scale_up_wait: Segundos de espera que disparan el crecimiento
+            idle_timeout: Segundos sin trabajo tras los que se retira un worker
+            interval: Segundos entre revisiones del thread de control
+            metrics: Registro donde publicar el estado del pool
+            log: Función para las trazas
+        """
+        if min_workers < 1:
+            raise ValueError("Se necesita al menos un worker")
+        self.queue = work_queue
+        self.handle = handle
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers or min_workers)
+        self.reserved = dict(reserved or {})
+        unknown = set(self.reserved) - set(work_queue.scheduler.priorities)
+        if unknown:
+            raise ValueError(f"Prioridades desconocidas en la reserva: {sorted(unknown)}")
+        self.scale_up_depth = max(1, scale_up_depth)
+        self.scale_up_wait = scale_up_wait
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self._log = log
+        self.size = 0  # Workers generales vivos
+        self.busy = 0  # Workers (generales o reservados) procesando una solicitud
+        self.scale_ups = 0
+        self.scale_downs = 0
+        self.decisions: Deque[Dict] = deque(maxlen=DECISION_HISTORY)
+        self.running = False
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._names = itertools.count(1)
+        self._scaled: Dict[str, Callable[[float], None]] = {}
+        if metrics is not None:
+            metrics.gauge("rpc_workers", "Workers activos", function=lambda: self.size,
+                          kind="general")
+            metrics.gauge("rpc_workers", "Workers activos",
+                          function=lambda: sum(self.reserved.values()), kind="reserved")
+            metrics.gauge("rpc_workers_busy", "Workers procesando una solicitud",
+                          function=lambda: self.busy)
+            self._scaled = {
+                direction: metrics.counter("rpc_worker_scaling_total",
+                                           "Workers añadidos o retirados por el autoescalado",
+                                           direction=direction).inc
+                for direction in ("up", "down")
+            }
+    
+    @property
+    def total(self) -> int:
+        """Workers generales y reservados"""
+        return self.size + sum(self.reserved.values())
+    
+    def start(self):
+        """Arranca los workers mínimos, los reservados y, si procede, el control"""
+        self.running = True
+        with self._lock:
+            self._spawn(self.min_workers)
+        for priority, count in self.reserved.items():
+            for _ in range(count):
+                self._start_thread(self._reserved_worker, f"worker-p{priority}", priority)
+        if self.max_workers > self.min_workers:
+            self._start_thread(self._control, "pool-control")
+        reserved = f", reservados {self.reserved}" if self.reserved else ""
+        self._log(f"[POOL] {self.min_workers} workers (mínimo {self.min_workers}, "
+                  f"máximo {self.max_workers}{reserved})")
+    
+    def stop(self):
+        """Detiene el control y despierta a los workers para que terminen"""
+        self.running = False
+        self._stopped.set()
+        self.queue.close()
+    
+    def status(self) -> Dict:
+        """Estado del pool y decisiones de escalado recientes"""
+        with self._lock:
+            return {"workers": self.size, "busy": self.busy, "min": self.min_workers,
+                    "max": self.max_workers,
+                    "reserved": {str(p): n for p, n in self.reserved.items()},
+                    "scale_ups": self.scale_ups, "scale_downs": self.scale_downs,
+                    "decisions": list(self.decisions)}
+    
+    def _start_thread(self, target: Callable, name: str, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True,
+                                  name=f"{name}-{next(self._names)}")
+        thread.start()
+    
+    def _spawn(self, count: int):
+        """Arranca `count` workers generales (con `_lock` tomado)"""
+        self.size += count
+        for _ in range(count):
+            self._start_thread(self._worker, "worker")
+    
+    def _record(self, direction: str, count: int, reason: str, depth: int, wait: float):
+        """Registra una decisión de escalado (con `_lock` tomado)"""
+        if direction == "up":
+            self.scale_ups += count
+        else:
+            self.scale_downs += count
+        self.decisions.append({"ts": time.time(), "direction": direction, "count": count,
+                               "workers": self.size, "reason": reason, "depth": depth,
+                               "wait_ms": round(wait * 1e3, 3)})
+        if direction in self._scaled:
+            self._scaled[direction](count)
+        sign = "+" if direction == "up" else "-"
+        self._log(f"[POOL] {sign}{count} worker(s) -> {self.size} ({reason}; "
+                  f"cola {depth}, espera {wait * 1e3:.0f} ms)")
+    
+    def _control(self):
+        """Añade workers mientras la cola supere los umbrales"""
+        while not self._stopped.wait(self.interval):
+            depth, wait = self.queue.load()
+            if depth >= self.scale_up_depth:
+                reason = f"cola >= {self.scale_up_depth}"
+            elif depth and wait >= self.scale_up_wait:
+                reason = f"espera >= {self.scale_up_wait * 1e3:.0f} ms"
+            else:
+                continue
+            with self._lock:
+                count = min(self.max_workers - self.size,
+                            max(1, depth // self.scale_up_depth))
+                if count > 0 and self.running:
+                    self._spawn(count)
+                    self._record("up", count, reason, depth, wait)
+    
+    def _run(self, entry: Entry):
+        with self._lock:
+            self.busy += 1
+        try:
+            self.handle(entry)
+        except Exception as e:
+            self._log(f"[ERROR] Error en worker thread: {e}")
+        finally:
+            with self._lock:
+                self.busy -= 1
+    
+    def _worker(self):
+        """Worker general: cualquier prioridad; se retira si sobra tras `idle_timeout`"""
+        while self.running:
+            # En el mínimo no hay nada que retirar: esperar sin despertar
+            timeout = self.idle_timeout if self.size > self.min_workers else None
+            try:
+                entry = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                with self._lock:
+                    if not self.running:
+                        break
+                    if self.size > self.min_workers:
+                        self.size -= 1
+                        self._record("down", 1, f"{self.idle_timeout:g}s sin trabajo",
+                                     *self.queue.load())
+                        return
+                continue
+            self._run(entry)
+        with self._lock:
+            self.size -= 1
+    
+    def _reserved_worker(self, priority: int):
+        """Worker reservado: solo atiende `priority` y no se retira"""
+        while self.running:
+            try:
+                entry = self.queue.get(priority=priority)
+            except queue.Empty:
+                continue
+            self._run(entry)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Arnés local de varios servidores con el cliente de cluster
+
+Lanza N procesos servidor.py en puertos consecutivos (cada uno con su
+propio XML en un directorio temporal) y mide el throughput agregado de un
+ClusterRPCClient que inserta y consulta productos contra 1, 2, 4...
+nodos. Después muestra qué fracción de claves cambia de dueño al agregar
+un nodo al anillo y comprueba el failover matando uno de los nodos.
+
+El throughput agregado solo crece con los nodos si la máquina tiene
+núcleos libres para ellos.
+
+Uso:
+    python3 bench_cluster.py [segundos] [nodos1 nodos2 ...]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import List
+
+from cluster import ClusterRPCClient, ConsistentHashRing
+
+DEFAULT_NODES = [1, 2, 4]
+DEFAULT_DURATION = 5.0
+BASE_PORT = 9300
+NUM_THREADS = 8
+WINDOW = 32  # Solicitudes en curso por thread
+SERVER_WORKERS = 4
+
+
+def start_nodes(tmp_dir: str, count: int) -> List[subprocess.Popen]:
+    """Lanza `count` servidores y espera a que acepten conexiones"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servidor.py")
+    processes = []
+    for i in range(count):
+        processes.append(subprocess.Popen(
+            [sys.executable, script, "--silencioso", "--retardo", "0",
+             "--workers", str(SERVER_WORKERS), "--host", "127.0.0.1",
+             "--puerto", str(BASE_PORT + i), "--xml", os.path.join(tmp_dir, f"nodo{i}.xml")],
+            stdout=subprocess.DEVNULL))
+    probe = ClusterRPCClient(node_names(count), "SONDA", health_interval=None,
+                             connect_timeout=0.5)
+    deadline = time.time() + 30
+    for node in probe.ring.nodes:
+        while not probe.ping(node):
+            if time.time() > deadline:
+                raise RuntimeError(f"El nodo {node} no arrancó")
+            time.sleep(0.1)
+    probe.close()
+    return processes
+
+
+def stop_nodes(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+def node_names(count: int) -> List[str]:
+    return [f"127.0.0.1:{BASE_PORT + i}" for i in range(count)]
+
+
+def measure(client: ClusterRPCClient, duration: float, prefix: str) -> dict:
+    """Inserciones y consultas concurrentes durante `duration` segundos"""
+    stop = threading.Event()
+    done = [0] * NUM_THREADS
+    errors = [0] * NUM_THREADS
+    
+    def worker(thread: int):
+        i = 0
+        in_flight = []
+        while not stop.is_set():
+            while len(in_flight) < WINDOW:
+                product_id = f"{prefix}-{thread}-{i // 2}"
+                if i % 2 == 0:
+                    in_flight.append(client.insert_async(product_id, "Producto", 1.5))
+                else:
+                    in_flight.append(client.query_async(product_id))
+                i += 1
+            future = in_flight.pop(0)
+            try:
+                future.result()
+                done[thread] += 1
+            except Exception:
+                errors[thread] += 1
+        for future in in_flight:
+            try:
+                future.result()
+            except Exception:
+                pass
+    
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(NUM_THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {"ops": sum(done) / elapsed, "errors": sum(errors)}
+
+
+def key_movement(num_nodes: int, num_keys: int = 100_000) -> float:
+    """Fracción de claves que cambian de dueño al pasar de N a N+1 nodos"""
+    before = ConsistentHashRing(node_names(num_nodes))
+    after = ConsistentHashRing(node_names(num_nodes + 1))
+    moved = sum(1 for k in range(num_keys) if before.owner(f"K{k}") != after.owner(f"K{k}"))
+    return moved / num_keys
+
+
+def failover(tmp_dir: str, duration: float):
+    """Mata un nodo a mitad de la carga y comprueba que el cliente sigue operando"""
+    processes = start_nodes(tmp_dir, 3)
+    client = ClusterRPCClient(node_names(3), "FAILOVER", health_interval=0.5)
+    try:
+        threading.Timer(duration / 2, processes[1].kill).start()
+        result = measure(client, duration, "FAIL")
+        print(f"[BENCH] Failover: 3 nodos, uno muerto a los {duration / 2:.1f}s -> "
+              f"{result['ops']:.0f} ops/s, {result['errors']} errores, "
+              f"nodos vivos: {client.alive_nodes}")
+    finally:
+        client.close()
+        stop_nodes(processes)
+
+
+def main():
+    """Función principal del arnés"""
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DURATION
+    node_counts = [int(arg) for arg in sys.argv[2:]] or DEFAULT_NODES
+    
+    print(f"[BENCH] {NUM_THREADS} threads x {WINDOW} solicitudes en curso, "
+          f"{os.cpu_count()} núcleos")
+    print(f"{'Nodos':>6} {'ops/s':>10} {'Errores':>8} {'Claves movidas al agregar uno':>31}")
+    print("-" * 58)
+    for count in node_counts:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            processes = start_nodes(tmp_dir, count)
+            client = ClusterRPCClient(node_names(count), f"BENCH-{count}")
+            try:
+                result = measure(client, duration, f"N{count}")
+            finally:
+                client.close()
+                stop_nodes(processes)
+        print(f"{count:>6} {result['ops']:>10.0f} {result['errors']:>8} "
+              f"{key_movement(count):>30.1%}")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        failover(tmp_dir, duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de los códecs del protocolo
+
+Compara el costo de codificar y decodificar, y los bytes en la red, de
+los mensajes más frecuentes (solicitud insert, solicitud query y
+respuesta con posición) con el códec JSON y el binario.
+
+Uso:
+    python3 bench_codec.py [repeticiones]
+"""
+
+import sys
+import timeit
+
+from protocolo import CODECS, FRAME_HEADER
+
+DEFAULT_REPETITIONS = 200_000
+
+MESSAGES = {
+    "insert": {
+        "operation": "insert",
+        "params": {"id": "PROD-CLIENT-1-17", "nombre": "Monitor 42", "precio": 349.99},
+        "client_id": "CLIENT-1",
+    },
+    "query": {
+        "operation": "query",
+        "params": {"id": "PROD-CLIENT-1-17"},
+        "client_id": "CLIENT-1",
+    },
+    "respuesta": {"status": "success", "position": 123456},
+}
+
+
+def main():
+    """Función principal del benchmark"""
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REPETITIONS
+    
+    print(f"[BENCH] {repetitions} repeticiones por medición")
+    print(f"{'Mensaje':<10} {'Códec':<8} {'Codificar (ns)':>15} {'Decodificar (ns)':>17} "
+          f"{'Bytes en red':>13}")
+    print("-" * 67)
+    for name, message in MESSAGES.items():
+        for codec in CODECS.values():
+            encoded = codec.encode(message)
+            assert codec.decode(encoded) == message
+            encode_ns = timeit.timeit(lambda: codec.encode(message),
+                                      number=repetitions) / repetitions * 1e9
+            decode_ns = timeit.timeit(lambda: codec.decode(encoded),
+                                      number=repetitions) / repetitions * 1e9
+            wire_bytes = FRAME_HEADER.size + len(encoded)
+            print(f"{name:<10} {codec.name:<8} {encode_ns:>15.0f} {decode_ns:>17.0f} "
+                  f"{wire_bytes:>13}")
+
+
+if __name__ == "__main__":
+    main()
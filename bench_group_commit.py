@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark de throughput de inserciones con y sin group commit
+
+Lanza 1, 8 y 64 threads que insertan productos concurrentemente sobre un
+ProductManager (sin el retardo simulado) y compara las inserciones por
+segundo cuando cada inserción se persiste por separado (columna
+"individual": lote 1) y cuando se agrupan (columna "agrupado":
+`GROUP_COMMIT_WINDOW` y `GROUP_COMMIT_MAX_BATCH`). Se mide con el diario
+sincronizado a disco (fsync) y sin sincronizar. El servidor solo agrupa
+por defecto con `--sincronizar`; las filas "agrupado" sin fsync
+corresponden a `--lote-grupo` explícito.
+
+Uso:
+    python3 bench_group_commit.py [inserciones_por_cliente] [clientes1 clientes2 ...]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import servidor
+
+DEFAULT_CLIENTS = [1, 8, 64]
+DEFAULT_INSERTS = 200
+
+
+def run(num_clients: int, inserts_per_client: int, window: float, max_batch: int,
+        sync: bool) -> float:
+    """
+    Ejecuta una ronda del benchmark
+    
+    Returns:
+        Inserciones por segundo
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = servidor.ProductManager(os.path.join(tmp_dir, "productos.xml"),
+                                          insertion_delay=0,
+                                          compaction_interval=3600,
+                                          compaction_threshold=1 << 40,
+                                          sync_journal=sync,
+                                          group_commit_window=window,
+                                          group_commit_max_batch=max_batch)
+        barrier = threading.Barrier(num_clients + 1)
+        
+        def client(client_num: int):
+            barrier.wait()
+            for i in range(inserts_per_client):
+                manager.insert_product(f"PROD-{client_num}-{i}", f"Producto {i}", 10.0 + i)
+        
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(num_clients)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        manager.close()
+    return num_clients * inserts_per_client / elapsed
+
+
+def main():
+    """Función principal del benchmark"""
+    inserts_per_client = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_INSERTS
+    clients = [int(arg) for arg in sys.argv[2:]] or DEFAULT_CLIENTS
+    servidor.VERBOSE = False
+    
+    print(f"[BENCH] {inserts_per_client} inserciones por cliente; agrupado: "
+          f"ventana={servidor.GROUP_COMMIT_WINDOW}s, "
+          f"lote máximo={servidor.GROUP_COMMIT_MAX_BATCH} (por defecto con --sincronizar; "
+          f"sin fsync equivale a --lote-grupo {servidor.GROUP_COMMIT_MAX_BATCH})")
+    print(f"{'fsync':>6} {'Clientes':>9} {'Individual (ins/s)':>19} {'Agrupado (ins/s)':>17}")
+    print("-" * 55)
+    for sync in (True, False):
+        for num_clients in clients:
+            single = run(num_clients, inserts_per_client, 0.0, 1, sync)
+            grouped = run(num_clients, inserts_per_client, servidor.GROUP_COMMIT_WINDOW,
+                          servidor.GROUP_COMMIT_MAX_BATCH, sync)
+            print(f"{'sí' if sync else 'no':>6} {num_clients:>9} {single:>19.0f} {grouped:>17.0f}")
+
+
+if __name__ == "__main__":
+    main()
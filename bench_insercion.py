@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark del costo de inserción según el tamaño del catálogo
+
+Para cada tamaño se genera un productos.xml con N productos en un
+directorio temporal, se carga un ProductManager sobre él y se mide el
+costo medio de insertar productos nuevos (sin el retardo simulado).
+Como referencia se mide también lo que costaba reescribir el XML
+completo, que era lo que hacía cada inserción antes del diario. Por
+último se mide el arranque sobre la instantánea compactada, que ya no
+analiza el XML porque usa su índice persistido.
+
+Uso:
+    python3 bench_insercion.py [inserciones] [tamaño1 tamaño2 ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+import servidor
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_INSERTS = 2_000
+
+
+def generate_catalog(xml_file: str, size: int):
+    """Escribe un productos.xml con `size` productos"""
+    with open(xml_file, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='UTF-8'?>\n<productos>\n")
+        for i in range(size):
+            f.write(f'  <producto id="BASE-{i}" nombre="Producto {i}" precio="{i % 1000}.5" />\n')
+        f.write("</productos>\n")
+
+
+def bench_size(size: int, num_inserts: int) -> dict:
+    """Mide carga, inserción y compactación para un tamaño de catálogo"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_file = os.path.join(tmp_dir, "productos.xml")
+        generate_catalog(xml_file, size)
+        
+        start = time.perf_counter()
+        manager = servidor.ProductManager(xml_file, insertion_delay=0,
+                                          compaction_interval=3600,
+                                          compaction_threshold=1 << 40)
+        load_time = time.perf_counter() - start
+        while not manager.records.indexed:
+            time.sleep(0.01)  # Que la reconstrucción del índice no interfiera
+        
+        start = time.perf_counter()
+        for i in range(num_inserts):
+            manager.insert_product(f"NUEVO-{i}", f"Nuevo {i}", 10.0 + i)
+        insert_time = time.perf_counter() - start
+        
+        # Costo de la ruta anterior: una reescritura completa por inserción
+        tree = ET.ElementTree(ET.Element("productos"))
+        for product_id, nombre, precio in manager.entries_since(0, manager.size):
+            ET.SubElement(tree.getroot(), "producto", id=product_id, nombre=nombre, precio=precio)
+        start = time.perf_counter()
+        tree.write(os.path.join(tmp_dir, "reescritura.xml"),
+                   encoding="UTF-8", xml_declaration=True)
+        rewrite_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        manager.compact()
+        compaction_time = time.perf_counter() - start
+        manager.close()
+        
+        start = time.perf_counter()
+        manager = servidor.ProductManager(xml_file, insertion_delay=0,
+                                          compaction_interval=3600,
+                                          compaction_threshold=1 << 40)
+        indexed_load_time = time.perf_counter() - start
+        manager.close()
+        
+        # Verificar que la instantánea compactada contiene todo
+        assert len(ET.parse(xml_file).getroot()) == size + num_inserts
+    
+    return {
+        "size": size,
+        "load_s": load_time,
+        "insert_us": insert_time / num_inserts * 1e6,
+        "rewrite_ms": rewrite_time * 1e3,
+        "compaction_s": compaction_time,
+        "indexed_load_s": indexed_load_time,
+    }
+
+
+def main():
+    """Función principal del benchmark"""
+    num_inserts = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_INSERTS
+    sizes = [int(arg) for arg in sys.argv[2:]] or DEFAULT_SIZES
+    servidor.VERBOSE = False
+    
+    print(f"[BENCH] {num_inserts} inserciones por tamaño de catálogo")
+    print(f"{'Productos':>10} {'Carga (s)':>10} {'Inserción (µs)':>15} "
+          f"{'Reescritura (ms)':>17} {'Compactación (s)':>17} {'Carga con índice (s)':>21}")
+    print("-" * 95)
+    for size in sizes:
+        r = bench_size(size, num_inserts)
+        print(f"{r['size']:>10} {r['load_s']:>10.3f} {r['insert_us']:>15.1f} "
+              f"{r['rewrite_ms']:>17.1f} {r['compaction_s']:>17.3f} "
+              f"{r['indexed_load_s']:>21.3f}")
+
+
+if __name__ == "__main__":
+    main()
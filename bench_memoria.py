@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark de memoria por producto según la representación del catálogo
+
+Para cada tamaño se genera un productos.xml con N productos y se mide con
+tracemalloc la memoria que retiene cada representación de los registros:
+
+- ElementTree: el árbol completo (`ET.parse`), como se cargaba antes
+- Columnas: `RecordStore` con todos los registros en memoria (arranque sin
+  índice persistido, o productos aún no compactados)
+- Índice persistido: `RecordStore` cargado desde `productos.xml.idx`
+  (solo IDs y offsets; los registros se leen del XML bajo demanda)
+
+Aparte se mide el diccionario id -> posición, que es el mismo en todos
+los casos (comparte las cadenas de los IDs con las columnas).
+
+Uso:
+    python3 bench_memoria.py [tamaño1 tamaño2 ...]
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import servidor
+from bench_insercion import generate_catalog
+from indice import RecordStore, load_sidecar, scan_catalog, write_sidecar
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def traced(build) -> tuple:
+    """Ejecuta `build()` y devuelve (resultado, bytes que siguen asignados)"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_size(size: int) -> dict:
+    """Mide las tres representaciones para un tamaño de catálogo"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_file = os.path.join(tmp_dir, "productos.xml")
+        generate_catalog(xml_file, size)
+        
+        tree, tree_bytes = traced(lambda: ET.parse(xml_file))
+        del tree
+        
+        columns, column_bytes = traced(lambda: RecordStore.from_xml(xml_file))
+        _, index_bytes = traced(lambda: servidor.ProductManager._build_index(columns.ids))
+        del columns
+        
+        write_sidecar(xml_file, scan_catalog(xml_file))
+        lazy, lazy_bytes = traced(lambda: RecordStore.from_sidecar(xml_file,
+                                                                   load_sidecar(xml_file)))
+        lazy.close()
+    
+    return {
+        "size": size,
+        "tree": tree_bytes / size,
+        "columns": column_bytes / size,
+        "lazy": lazy_bytes / size,
+        "index": index_bytes / size,
+    }
+
+
+def main():
+    """Función principal del benchmark"""
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    
+    print("[BENCH] Bytes por producto retenidos por cada representación")
+    print(f"{'Productos':>10} {'ElementTree':>12} {'Columnas':>10} "
+          f"{'Índice persistido':>18} {'Dict id->pos':>13}")
+    print("-" * 67)
+    for size in sizes:
+        r = bench_size(size)
+        print(f"{r['size']:>10} {r['tree']:>12.0f} {r['columns']:>10.0f} "
+              f"{r['lazy']:>18.0f} {r['index']:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
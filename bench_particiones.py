@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark de throughput del catálogo en un proceso y repartido en particiones
+
+Para cada configuración (un solo ProductManager, o ShardedProductManager
+con 1, 2, 4... particiones) se precarga el catálogo y varios threads
+lanzan durante unos segundos consultas por lotes (`query_products`) e
+inserciones individuales, sin el retardo simulado. El throughput de las
+particiones solo puede crecer si la máquina tiene al menos tantos núcleos
+como particiones.
+
+Uso:
+    python3 bench_particiones.py [segundos] [particiones1 particiones2 ...]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import servidor
+from particiones import ShardedProductManager
+
+DEFAULT_SHARDS = [1, 2, 4]
+DEFAULT_DURATION = 3.0
+NUM_THREADS = 16
+NUM_KEYS = 100_000
+BATCH_SIZE = 1_000
+
+
+def measure(manager, duration: float, operation) -> float:
+    """Ejecuta `operation(thread, i)` desde NUM_THREADS threads; devuelve operaciones/s"""
+    stop = threading.Event()
+    counts = [0] * NUM_THREADS
+    
+    def worker(thread: int):
+        i = 0
+        while not stop.is_set():
+            counts[thread] += operation(thread, i)
+            i += 1
+    
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(NUM_THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def run(num_shards: int, duration: float) -> dict:
+    """Mide una configuración (0 particiones = un solo proceso)"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_file = os.path.join(tmp_dir, "productos.xml")
+        options = dict(insertion_delay=0, compaction_interval=3600,
+                       compaction_threshold=1 << 40)
+        if num_shards:
+            manager = ShardedProductManager(xml_file, num_shards, verbose=False, **options)
+        else:
+            manager = servidor.ProductManager(xml_file, **options)
+        manager.insert_products([(f"BENCH-{k}", f"Producto {k}", 1.0) for k in range(NUM_KEYS)])
+        ids = [f"BENCH-{k}" for k in range(NUM_KEYS)]
+        
+        def query_batch(thread: int, i: int) -> int:
+            offset = (thread * 7919 + i * BATCH_SIZE) % (NUM_KEYS - BATCH_SIZE)
+            manager.query_products(ids[offset:offset + BATCH_SIZE])
+            return BATCH_SIZE
+        
+        def insert(thread: int, i: int) -> int:
+            manager.insert_product(f"NUEVO-{thread}-{i}", "Nuevo", 2.0)
+            return 1
+        
+        result = {
+            "queries": measure(manager, duration, query_batch),
+            "inserts": measure(manager, duration, insert),
+        }
+        manager.close()
+    return result
+
+
+def main():
+    """Función principal del benchmark"""
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DURATION
+    shard_counts = [int(arg) for arg in sys.argv[2:]] or DEFAULT_SHARDS
+    servidor.VERBOSE = False
+    
+    print(f"[BENCH] {NUM_THREADS} threads, {NUM_KEYS} productos, {os.cpu_count()} núcleos")
+    print(f"{'Particiones':>15} {'Consultas/s':>14} {'Inserciones/s':>14}")
+    print("-" * 45)
+    for num_shards in [0] + shard_counts:
+        r = run(num_shards, duration)
+        label = str(num_shards) if num_shards else "sin particionar"
+        print(f"{label:>15} {r['queries']:>14.0f} {r['inserts']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la espera de consultas bajo una carga dominada por inserciones
+
+Simula el servidor con un SchedulerQueue y unos workers que "procesan"
+cada solicitud durmiendo su tiempo de servicio. Las inserciones llegan
+más rápido de lo que los workers pueden atenderlas, de modo que la cola
+crece sin parar; con prioridad estricta las consultas quedan detrás de
+todas las inserciones. Se compara la espera en cola de las consultas con
+prioridad estricta, con envejecimiento y con reparto ponderado.
+
+Uso:
+    python3 bench_planificador.py [segundos_por_escenario]
+"""
+
+import queue
+import sys
+import threading
+import time
+
+import servidor
+from benchmark import percentile
+from planificador import PriorityScheduler, SchedulerQueue
+
+DEFAULT_DURATION = 5.0
+NUM_WORKERS = 3
+INSERT_SERVICE = 0.005  # Segundos de servicio por inserción
+QUERY_SERVICE = 0.001  # Segundos de servicio por consulta
+INSERT_RATE = 1000  # Inserciones por segundo (capacidad: ~600/s)
+QUERY_RATE = 50  # Consultas por segundo
+
+SCENARIOS = [
+    ("estricta", {"max_wait": None}),
+    ("envejecimiento 0.2s", {"max_wait": 0.2}),
+    ("pesos 1:4,2:1", {"weights": {servidor.PRIORITY_INSERT: 4, servidor.PRIORITY_QUERY: 1}}),
+]
+
+
+def run(duration: float, **scheduler_options) -> dict:
+    """Ejecuta un escenario y devuelve las esperas por prioridad"""
+    requests = SchedulerQueue(PriorityScheduler(
+        (servidor.PRIORITY_INSERT, servidor.PRIORITY_QUERY), **scheduler_options))
+    waits = {servidor.PRIORITY_INSERT: [], servidor.PRIORITY_QUERY: []}
+    lock = threading.Lock()
+    stop = threading.Event()
+    
+    def worker():
+        while not stop.is_set():
+            try:
+                priority, service, enqueued = requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            with lock:
+                waits[priority].append(time.perf_counter() - enqueued)
+            time.sleep(service)
+    
+    def producer(priority: int, rate: float, service: float):
+        interval = 1.0 / rate
+        next_time = time.perf_counter()
+        while not stop.is_set():
+            requests.put(priority, service)
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    
+    threads = [threading.Thread(target=worker) for _ in range(NUM_WORKERS)]
+    threads.append(threading.Thread(target=producer, args=(
+        servidor.PRIORITY_INSERT, INSERT_RATE, INSERT_SERVICE)))
+    threads.append(threading.Thread(target=producer, args=(
+        servidor.PRIORITY_QUERY, QUERY_RATE, QUERY_SERVICE)))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    
+    queries_sent = int(duration * QUERY_RATE)
+    query_waits = sorted(waits[servidor.PRIORITY_QUERY])
+    return {
+        "inserts": len(waits[servidor.PRIORITY_INSERT]),
+        "queries": len(query_waits),
+        "queries_sent": queries_sent,
+        "p50_ms": percentile(query_waits, 0.50) * 1e3,
+        "p99_ms": percentile(query_waits, 0.99) * 1e3,
+        "max_ms": query_waits[-1] * 1e3 if query_waits else 0.0,
+    }
+
+
+def main():
+    """Función principal del benchmark"""
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DURATION
+    
+    print(f"[BENCH] {NUM_WORKERS} workers, {INSERT_RATE} ins/s ({INSERT_SERVICE * 1e3:.0f}ms), "
+          f"{QUERY_RATE} cons/s ({QUERY_SERVICE * 1e3:.0f}ms), {duration:.0f}s por escenario")
+    print(f"{'Planificación':>20} {'Inserciones':>12} {'Consultas':>12} "
+          f"{'p50 (ms)':>10} {'p99 (ms)':>10} {'máx (ms)':>10}")
+    print("-" * 79)
+    for name, options in SCENARIOS:
+        r = run(duration, **options)
+        print(f"{name:>20} {r['inserts']:>12} {r['queries']:>6}/{r['queries_sent']:<5} "
+              f"{r['p50_ms']:>10.1f} {r['p99_ms']:>10.1f} {r['max_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
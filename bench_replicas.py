@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Throughput de consultas con un primario y 0, 1, 2... réplicas de lectura
+
+Lanza un servidor primario y N réplicas (`--replica-de`) en puertos
+consecutivos, precarga el catálogo en el primario y mide con
+ReplicaSetClient cuántas consultas por segundo se atienden mientras un
+thread sigue insertando. Con 0 réplicas las consultas van al primario.
+Al final muestra el retraso de cada réplica tras la carga.
+
+Las consultas solo escalan con las réplicas si la máquina tiene núcleos
+libres para ellas.
+
+Uso:
+    python3 bench_replicas.py [segundos] [réplicas1 réplicas2 ...]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import List
+
+from cluster import ClusterRPCClient
+from replicacion import ReplicaSetClient
+
+DEFAULT_REPLICAS = [0, 1, 2]
+DEFAULT_DURATION = 5.0
+BASE_PORT = 9400
+NUM_THREADS = 8
+WINDOW = 32  # Consultas en curso por thread
+NUM_KEYS = 20_000
+SERVER_WORKERS = 4
+
+
+def start_servers(tmp_dir: str, num_replicas: int) -> List[subprocess.Popen]:
+    """Lanza el primario y sus réplicas y espera a que acepten conexiones"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servidor.py")
+    processes = []
+    for i in range(num_replicas + 1):
+        command = [sys.executable, script, "--silencioso", "--retardo", "0",
+                   "--workers", str(SERVER_WORKERS), "--host", "127.0.0.1",
+                   "--puerto", str(BASE_PORT + i), "--xml", os.path.join(tmp_dir, f"nodo{i}.xml")]
+        if i > 0:
+            command += ["--replica-de", f"127.0.0.1:{BASE_PORT}"]
+        processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL))
+    probe = ClusterRPCClient(server_names(num_replicas + 1), "SONDA", health_interval=None,
+                             connect_timeout=0.5)
+    deadline = time.time() + 30
+    for node in probe.ring.nodes:
+        while not probe.ping(node):
+            if time.time() > deadline:
+                raise RuntimeError(f"El servidor {node} no arrancó")
+            time.sleep(0.1)
+    probe.close()
+    return processes
+
+
+def stop_servers(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+def server_names(count: int) -> List[str]:
+    return [f"127.0.0.1:{BASE_PORT + i}" for i in range(count)]
+
+
+def measure(client: ReplicaSetClient, duration: float) -> dict:
+    """Consultas concurrentes durante `duration` segundos con un thread insertando"""
+    stop = threading.Event()
+    done = [0] * NUM_THREADS
+    errors = [0] * NUM_THREADS
+    
+    def reader(thread: int):
+        i = thread
+        in_flight = []
+        while not stop.is_set():
+            while len(in_flight) < WINDOW:
+                in_flight.append(client.query_async(f"BENCH-{i % NUM_KEYS}"))
+                i += 7919
+            try:
+                in_flight.pop(0).result()
+                done[thread] += 1
+            except Exception:
+                errors[thread] += 1
+        for future in in_flight:
+            try:
+                future.result()
+            except Exception:
+                pass
+    
+    def writer():
+        i = 0
+        while not stop.is_set():
+            client.insert_product(f"NUEVO-{i}", "Nuevo", 2.0)
+            i += 1
+    
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(NUM_THREADS)]
+    threads.append(threading.Thread(target=writer))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {"queries": sum(done) / elapsed, "errors": sum(errors)}
+
+
+def main():
+    """Función principal del benchmark"""
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DURATION
+    replica_counts = [int(arg) for arg in sys.argv[2:]] or DEFAULT_REPLICAS
+    
+    print(f"[BENCH] {NUM_THREADS} threads x {WINDOW} consultas en curso, "
+          f"{NUM_KEYS} productos, {os.cpu_count()} núcleos")
+    print(f"{'Réplicas':>9} {'Consultas/s':>12} {'Errores':>8} {'Retraso máx. (entradas)':>24}")
+    print("-" * 56)
+    for count in replica_counts:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            processes = start_servers(tmp_dir, count)
+            names = server_names(count + 1)
+            client = ReplicaSetClient(names[0], names[1:], f"BENCH-{count}")
+            try:
+                client.insert_many([(f"BENCH-{k}", f"Producto {k}", 1.0)
+                                    for k in range(NUM_KEYS)])
+                result = measure(client, duration)
+                lag = max((status.get("lag_entries", 0)
+                           for status in client.replication_status()[1:]), default=0)
+            finally:
+                client.close()
+                stop_servers(processes)
+        print(f"{count:>9} {result['queries']:>12.0f} {result['errors']:>8} {lag:>24}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Generador de carga para medir la capacidad del servidor RPC
+
+Envía solicitudes insert/query con una mezcla, concurrencia y
+distribución de claves configurables, en uno de dos modos:
+
+- cerrado: N clientes concurrentes; cada uno envía la siguiente
+  solicitud al recibir la respuesta de la anterior
+- abierto: las solicitudes llegan a una tasa fija, respondan o no a
+  tiempo (la latencia se mide desde el instante programado de envío)
+
+Informa throughput y latencias p50/p95/p99/máx por tipo de operación y
+por prioridad, y guarda los resultados en JSON para comparar versiones
+del servidor.
+
+Uso:
+    python3 servidor.py --silencioso --retardo 0 &
+    python3 benchmark.py --modo cerrado --concurrencia 16 --duracion 10 --salida a.json
+    python3 benchmark.py --modo abierto --tasa 2000 --distribucion zipf --salida b.json
+    python3 benchmark.py --comparar a.json b.json
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from cliente import HOST, PORT, RPCClient
+from protocolo import INSERT_OPERATIONS, PRIORITY_INSERT, PRIORITY_QUERY
+
+PRELOAD_KEY = "BENCH-{}"  # IDs de los productos precargados que se consultan
+PRELOAD_BATCH = 10000
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def summarize(latencies: List[float]) -> Dict:
+    """Resume una lista de latencias (segundos) en milisegundos"""
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) * 1e3 if values else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1e3,
+        "p95_ms": percentile(values, 0.95) * 1e3,
+        "p99_ms": percentile(values, 0.99) * 1e3,
+        "max_ms": values[-1] * 1e3 if values else 0.0,
+    }
+
+
+def operation_priority(operation: str) -> int:
+    """Prioridad con la que el servidor encola una operación"""
+    return PRIORITY_INSERT if operation in INSERT_OPERATIONS else PRIORITY_QUERY
+
+
+def key_chooser(distribution: str, num_keys: int, zipf_s: float,
+                rng: random.Random) -> Callable[[], int]:
+    """
+    Construye un generador de índices de clave en [0, num_keys)
+    
+    - uniforme: todas las claves con igual probabilidad
+    - zipf: la clave k con probabilidad proporcional a 1 / (k + 1)^s
+    - caliente: 90% de las consultas sobre el 10% de las claves
+    """
+    if distribution == "uniforme":
+        return lambda: rng.randrange(num_keys)
+    if distribution == "zipf":
+        weights = [1.0 / (k + 1) ** zipf_s for k in range(num_keys)]
+        cumulative = list(itertools.accumulate(weights))
+        total = cumulative[-1]
+        return lambda: bisect.bisect_left(cumulative, rng.random() * total)
+    if distribution == "caliente":
+        hot = max(1, num_keys // 10)
+        return lambda: rng.randrange(hot) if rng.random() < 0.9 else rng.randrange(num_keys)
+    raise ValueError(f"Distribución desconocida: {distribution}")
+
+
+class Recorder:
+    """Acumula latencias y errores por operación desde varios threads"""
+    
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+    
+    def record(self, operation: str, latency: float, response: Optional[Dict]):
+        if response is not None and response.get("status") == "success":
+            self.latencies[operation].append(latency)
+        else:
+            self.errors[operation] += 1
+    
+    def report(self, elapsed: float) -> Dict:
+        """Resultados agregados por operación y por prioridad"""
+        by_priority: Dict[int, List[float]] = defaultdict(list)
+        for operation, values in self.latencies.items():
+            by_priority[operation_priority(operation)].extend(values)
+        completed = sum(len(values) for values in self.latencies.values())
+        return {
+            "elapsed_s": elapsed,
+            "completed": completed,
+            "errors": sum(self.errors.values()),
+            "throughput_rps": completed / elapsed if elapsed else 0.0,
+            "operations": {op: dict(summarize(values), errors=self.errors.get(op, 0))
+                           for op, values in sorted(self.latencies.items())},
+            "priorities": {str(p): summarize(values)
+                           for p, values in sorted(by_priority.items())},
+        }
+
+
+class LoadGenerator:
+    """Genera la carga de un benchmark sobre un RPCClient compartido"""
+    
+    def __init__(self, client: RPCClient, insert_ratio: float,
+                 choose_key: Callable[[], int], rng: random.Random, run_id: str):
+        self.client = client
+        self.insert_ratio = insert_ratio
+        self.choose_key = choose_key
+        self.rng = rng
+        self.run_id = run_id
+        self._counter = itertools.count()
+        self.recorder = Recorder()
+    
+    def next_request(self):
+        """Devuelve la siguiente solicitud (operación, parámetros)"""
+        if self.rng.random() < self.insert_ratio:
+            n = next(self._counter)
+            return "insert", {"id": f"BENCH-{self.run_id}-{n}", "nombre": f"Producto {n}",
+                              "precio": round(self.rng.uniform(10.0, 1000.0), 2)}
+        return "query", {"id": PRELOAD_KEY.format(self.choose_key())}
+    
+    def run_closed(self, concurrency: int, duration: float) -> Dict:
+        """Modo cerrado: `concurrency` clientes con una solicitud en curso cada uno"""
+        deadline = time.perf_counter() + duration
+        
+        def worker():
+            while time.perf_counter() < deadline:
+                operation, params = self.next_request()
+                start = time.perf_counter()
+                try:
+                    response = self.client.call_async(operation, params).result(
+                        timeout=self.client.timeout)
+                except Exception:
+                    response = None
+                self.recorder.record(operation, time.perf_counter() - start, response)
+        
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.recorder.report(time.perf_counter() - start)
+    
+    def run_open(self, rate: float, duration: float) -> Dict:
+        """Modo abierto: llegadas a tasa fija de `rate` solicitudes por segundo"""
+        interval = 1.0 / rate
+        total = int(rate * duration)
+        outstanding = threading.Semaphore(0)
+        start = time.perf_counter()
+        
+        for i in range(total):
+            scheduled = start + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            operation, params = self.next_request()
+            
+            def on_done(future, operation=operation, scheduled=scheduled):
+                try:
+                    response = future.result()
+                except Exception:
+                    response = None
+                self.recorder.record(operation, time.perf_counter() - scheduled, response)
+                outstanding.release()
+            
+            self.client.call_async(operation, params).add_done_callback(on_done)
+        
+        for _ in range(total):
+            outstanding.acquire(timeout=self.client.timeout)
+        return self.recorder.report(time.perf_counter() - start)
+
+
+def preload(client: RPCClient, num_keys: int):
+    """Inserta las claves que consultará el benchmark (las existentes se ignoran)"""
+    products = [(PRELOAD_KEY.format(k), f"Precargado {k}", 1.0) for k in range(num_keys)]
+    for i in range(0, num_keys, PRELOAD_BATCH):
+        client.call_async("insert_many", {"products": [
+            {"id": pid, "nombre": nombre, "precio": precio}
+            for pid, nombre, precio in products[i:i + PRELOAD_BATCH]
+        ]}).result(timeout=client.timeout)
+
+
+def print_report(results: Dict):
+    """Imprime un resumen legible de los resultados"""
+    r = results["results"]
+    print(f"\n[BENCH] {r['completed']} completadas, {r['errors']} errores en "
+          f"{r['elapsed_s']:.2f}s -> {r['throughput_rps']:.0f} sol/s")
+    print(f"{'':<14} {'n':>8} {'media':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'máx':>9}  (ms)")
+    print("-" * 74)
+    rows = [(op, s) for op, s in r["operations"].items()] + \
+        [(f"prioridad {p}", s) for p, s in r["priorities"].items()]
+    for name, s in rows:
+        print(f"{name:<14} {s['count']:>8} {s['mean_ms']:>9.2f} {s['p50_ms']:>9.2f} "
+              f"{s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f} {s['max_ms']:>9.2f}")
+
+
+def compare(base_file: str, new_file: str):
+    """Compara dos archivos de resultados (base -> nuevo)"""
+    with open(base_file, encoding="utf-8") as f:
+        base = json.load(f)["results"]
+    with open(new_file, encoding="utf-8") as f:
+        new = json.load(f)["results"]
+    compare_results(base, new)
+
+
+def compare_results(base: Dict, new: Dict):
+    """Imprime la diferencia de throughput y latencias entre dos resultados"""
+    
+    def delta(old: float, value: float) -> str:
+        return f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+    
+    print(f"{'Métrica':<24} {'base':>12} {'nuevo':>12} {'cambio':>9}")
+    print("-" * 60)
+    print(f"{'throughput (sol/s)':<24} {base['throughput_rps']:>12.0f} "
+          f"{new['throughput_rps']:>12.0f} {delta(base['throughput_rps'], new['throughput_rps']):>9}")
+    groups = [("operations", ""), ("priorities", "prioridad ")]
+    for group, label in groups:
+        for name in sorted(set(base[group]) & set(new[group])):
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "max_ms"):
+                old, value = base[group][name][metric], new[group][name][metric]
+                print(f"{label + name + ' ' + metric:<24} {old:>12.2f} {value:>12.2f} "
+                      f"{delta(old, value):>9}")
+
+
+def main():
+    """Función principal del benchmark"""
+    parser = argparse.ArgumentParser(description="Generador de carga para el servidor RPC")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--puerto", type=int, default=PORT)
+    parser.add_argument("--modo", choices=["cerrado", "abierto"], default="cerrado")
+    parser.add_argument("--concurrencia", type=int, default=8,
+                        help="Clientes concurrentes en modo cerrado")
+    parser.add_argument("--tasa", type=float, default=1000.0,
+                        help="Solicitudes por segundo en modo abierto")
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos de carga")
+    parser.add_argument("--mezcla", type=float, default=0.1,
+                        help="Fracción de inserciones (el resto son consultas)")
+    parser.add_argument("--distribucion", choices=["uniforme", "zipf", "caliente"],
+                        default="uniforme", help="Distribución de claves consultadas")
+    parser.add_argument("--claves", type=int, default=10000,
+                        help="Número de claves precargadas que se consultan")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Exponente de la distribución zipf")
+    parser.add_argument("--conexiones", type=int, default=4, help="Conexiones del pool")
+    parser.add_argument("--codec", default="json", help="Códec preferido (json o binario)")
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--etiqueta", default="", help="Etiqueta libre guardada con los resultados")
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", nargs=2, metavar=("BASE", "NUEVO"),
+                        help="Comparar dos archivos de resultados y salir")
+    args = parser.parse_args()
+    
+    if args.comparar:
+        compare(*args.comparar)
+        return
+    
+    rng = random.Random(args.semilla)
+    client = RPCClient(args.host, args.puerto, "BENCH", max_connections=args.conexiones,
+                       codec=args.codec)
+    try:
+        print(f"[BENCH] Precargando {args.claves} claves...")
+        preload(client, args.claves)
+        
+        run_id = f"{int(time.time() * 1000):x}"
+        generator = LoadGenerator(client, args.mezcla,
+                                  key_chooser(args.distribucion, args.claves, args.zipf_s, rng),
+                                  rng, run_id)
+        print(f"[BENCH] Modo {args.modo} durante {args.duracion}s...")
+        if args.modo == "cerrado":
+            results = generator.run_closed(args.concurrencia, args.duracion)
+        else:
+            results = generator.run_open(args.tasa, args.duracion)
+    finally:
+        client.close()
+    
+    output = {
+        "label": args.etiqueta,
+        "timestamp": time.time(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")},
+        "results": results,
+    }
+    print_report(output)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+        print(f"\n[BENCH] Resultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
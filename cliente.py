@@ -4,28 +4,542 @@ Cliente RPC para operaciones sobre productos
 
 Este cliente se conecta al servidor RPC y realiza múltiples
 operaciones aleatorias de inserción y consulta.
+
+Además de la API bloqueante, `RPCClient` ofrece `insert_async` y
+`query_async`, que devuelven `concurrent.futures.Future`, y
+`AsyncRPCClient` ofrece la misma funcionalidad para código asyncio.
+Ambos multiplexan muchas solicitudes en curso sobre un pool de
+conexiones persistentes.
+
+Si el servidor rechaza una solicitud por sobrecarga (error `busy`), los
+clientes la reintentan hasta `max_retries` veces tras el `retry_after`
+que indica el servidor más un retroceso exponencial aleatorio, para que
+los clientes rechazados a la vez no vuelvan todos a la vez. Con
+`deadline` cada solicitud lleva su plazo (`deadline_ms`) y el servidor la
+descarta si caduca en cola.
+
+Como el servidor solo anexa productos, la posición de un ID no cambia
+una vez asignada: con `cache_size` `RPCClient` guarda en una caché LRU
+las posiciones que ya conoce (de sus inserciones y de las consultas con
+resultado) y las responde sin ir al servidor. La caché se desactiva sola
+si el servidor no anuncia `storage: append_only` en `hello`.
 """
 
+import asyncio
+import heapq
+import itertools
 import socket
-import json
 import random
 import threading
 import time
-from typing import Dict, Optional
+import weakref
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from collections import OrderedDict
+
+from protocolo import (APPEND_ONLY, CODECS, DEFAULT_CODEC, MAX_REQUEST_ID, encode_frame,
+                       read_frame, read_frame_async)
 
 # Constantes
 HOST = "localhost"
 PORT = 8888
+BATCH_SIZE = 10000  # Productos por mensaje en las operaciones por lotes
+RANGE_LIMIT = 100  # Posiciones por página en las consultas por rango y prefijo
+MAX_CONNECTIONS = 4  # Conexiones persistentes por pool
+CONNECT_TIMEOUT = 5.0  # Segundos para establecer una conexión
+REQUEST_TIMEOUT = 60.0  # Segundos de espera de una respuesta en la API bloqueante
+CODEC = "json"  # Códec preferido ("json" o "binario"); se negocia con el servidor
+MAX_RETRIES = 5  # Reintentos de una solicitud rechazada con `busy`
+RETRY_BASE = 0.05  # Segundos del primer retroceso aleatorio
+RETRY_CAP = 2.0  # Máximo del retroceso aleatorio (además de `retry_after`)
+CACHE_SIZE = 1000  # Posiciones en caché del cliente de línea de comandos
+
+
+class ServerBusyError(RuntimeError):
+    """El servidor rechazó la solicitud por sobrecarga y se agotaron los reintentos"""
+    
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def build_request(operation: str, params: Dict, client_id: str) -> Dict:
+    """Construye una solicitud RPC"""
+    return {
+        "operation": operation,
+        "params": params,
+        "client_id": client_id
+    }
+
+
+def _hello_request(codec: str) -> bytes:
+    """Mensaje de negociación de códec (siempre en JSON)"""
+    offered = [codec] if codec == DEFAULT_CODEC.name else [codec, DEFAULT_CODEC.name]
+    return encode_frame(0, DEFAULT_CODEC.encode(
+        {"operation": "hello", "params": {"codecs": offered}}))
+
+
+def _negotiated_codec(response: Dict):
+    """Códec aceptado por el servidor (JSON si no admite la negociación)"""
+    if response.get("status") == "success":
+        return CODECS.get(response.get("codec"), DEFAULT_CODEC)
+    return DEFAULT_CODEC
+
+
+def position_from(response: Dict) -> int:
+    """Extrae la posición de una respuesta o lanza el error del servidor"""
+    if response.get("status") != "success":
+        if _is_busy(response):
+            raise ServerBusyError(response.get("message", "Servidor saturado"),
+                                  response.get("retry_after", 0.0))
+        raise RuntimeError(response.get("message", "Error desconocido"))
+    return response.get("position", -1)
+
+
+def _is_busy(response: Dict) -> bool:
+    """Indica si el servidor rechazó la solicitud por sobrecarga"""
+    return response.get("status") == "error" and response.get("error") == "busy"
+
+
+def _backoff(attempt: int, retry_after: float) -> float:
+    """Espera antes del reintento `attempt` (desde 0): `retry_after` más jitter exponencial"""
+    return retry_after + random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** attempt))
+
+
+class _RetryTimer:
+    """Un único thread que ejecuta los reintentos y vencimientos programados a su hora"""
+    
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Callable[[], None]]] = []
+        self._order = itertools.count()  # Desempate entre reintentos a la misma hora
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+    
+    def schedule(self, delay: float, action: Callable[[], None]):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._order), action))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, action = heapq.heappop(self._heap)
+            try:
+                action()
+            except Exception:
+                pass  # Cada acción entrega sus errores en su propio Future
+
+
+_retry_timer = _RetryTimer()
+
+
+def _done(value: Any) -> Future:
+    """Future ya resuelto con `value`"""
+    future: Future = Future()
+    future.set_result(value)
+    return future
+
+
+class PositionCache:
+    """
+    Caché LRU acotada de ID -> posición, thread-safe
+    
+    Solo es correcta si las posiciones son inmutables (servidor de
+    solo-anexado); no guarda los IDs inexistentes, que pueden insertarse
+    más tarde.
+    """
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._positions: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._positions)
+    
+    def get(self, product_id: str) -> Optional[int]:
+        """Posición en caché de `product_id`, o None (cuenta acierto o fallo)"""
+        with self._lock:
+            position = self._positions.get(product_id)
+            if position is None:
+                self.misses += 1
+                return None
+            self._positions.move_to_end(product_id)
+            self.hits += 1
+            return position
+    
+    def put(self, product_id: str, position: int):
+        with self._lock:
+            self._positions[product_id] = position
+            self._positions.move_to_end(product_id)
+            if len(self._positions) > self.capacity:
+                self._positions.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._positions),
+                "capacity": self.capacity, "hit_ratio": self.hits / lookups if lookups else 0.0}
+
+
+def chain(future: Future, transform: Callable[[Any], Any]) -> Future:
+    """Devuelve un Future con el resultado de `future` transformado"""
+    chained: Future = Future()
+    
+    def on_done(source: Future):
+        try:
+            chained.set_result(transform(source.result()))
+        except Exception as e:
+            chained.set_exception(e)
+    
+    future.add_done_callback(on_done)
+    return chained
+
+
+class PooledConnection:
+    """
+    Conexión persistente compartida por varios threads
+    
+    Las solicitudes se envían enmarcadas bajo un lock de envío y un thread
+    lector resuelve el Future de cada una cuando llega su respuesta, en
+    cualquier orden. Al conectar se negocia el códec con el servidor.
+    """
+    
+    def __init__(self, host: str, port: int, connect_timeout: float = CONNECT_TIMEOUT,
+                 codec: str = CODEC):
+        self._socket = socket.create_connection((host, port), timeout=connect_timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self._socket.sendall(_hello_request(codec))
+            frame = read_frame(self._socket)
+            if frame is None:
+                raise ConnectionError("El servidor cerró la conexión")
+            hello = DEFAULT_CODEC.decode(frame[1])
+            self.codec = _negotiated_codec(hello)
+            self.storage = hello.get("storage")  # Modo de almacenamiento anunciado
+        except Exception:
+            self._socket.close()
+            raise
+        self._socket.settimeout(None)
+        self._send_lock = threading.Lock()  # Evita intercalar mensajes
+        self._state_lock = threading.Lock()  # Protege `closed` y `_pending`
+        self._pending: Dict[int, Future] = {}
+        self._next_id = 0
+        self.closed = False
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+    
+    @property
+    def in_flight(self) -> int:
+        """Número de solicitudes enviadas sin respuesta"""
+        return len(self._pending)
+    
+    def submit(self, request: Dict, timeout: Optional[float] = None) -> Future:
+        """
+        Envía una solicitud y devuelve el Future de su respuesta
+        
+        Con `timeout`, si la respuesta no llega a tiempo la solicitud se
+        olvida y el Future falla con TimeoutError (una respuesta tardía se
+        descarta).
+        """
+        payload = self.codec.encode(request)
+        future: Future = Future()
+        with self._send_lock:
+            with self._state_lock:
+                if self.closed:
+                    raise ConnectionError("La conexión está cerrada")
+                request_id = self._next_id
+                self._next_id = (self._next_id + 1) % (MAX_REQUEST_ID + 1)
+                self._pending[request_id] = future
+            try:
+                self._socket.sendall(encode_frame(request_id, payload))
+            except OSError as e:
+                self._fail(e)
+                raise
+        if timeout is not None:
+            expected = weakref.ref(future)  # El temporizador no retiene respuestas ya leídas
+            _retry_timer.schedule(timeout, lambda: self._expire(request_id, expected))
+        return future
+    
+    def _expire(self, request_id: int, expected: "weakref.ref[Future]"):
+        """Olvida una solicitud cuyo plazo venció sin respuesta"""
+        with self._state_lock:
+            future = self._pending.get(request_id)
+            if future is None or future is not expected():
+                return  # Ya respondida (o el id se reutilizó)
+            del self._pending[request_id]
+        try:
+            future.set_exception(TimeoutError("Sin respuesta del servidor a tiempo"))
+        except InvalidStateError:
+            pass
+    
+    def _read_loop(self):
+        """Thread lector que despacha las respuestas por id"""
+        try:
+            while True:
+                frame = read_frame(self._socket)
+                if frame is None:
+                    raise ConnectionError("El servidor cerró la conexión")
+                request_id, response_data = frame
+                future = self._pending.pop(request_id, None)
+                if future is None:
+                    continue
+                try:
+                    future.set_result(self.codec.decode(response_data))
+                except InvalidStateError:
+                    pass  # Cancelado por quien lo esperaba
+        except Exception as e:
+            self._fail(e)
+    
+    def _fail(self, error: Exception):
+        """Cierra la conexión y propaga el error a las solicitudes en curso"""
+        with self._state_lock:
+            self.closed = True
+            pending, self._pending = self._pending, {}
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+        for future in pending.values():
+            try:
+                future.set_exception(ConnectionError(f"Conexión perdida: {error}"))
+            except InvalidStateError:
+                pass
+    
+    def close(self):
+        """Cierra la conexión; el thread lector falla las solicitudes en curso"""
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones persistentes seguro entre threads
+    
+    Cada solicitud va a la conexión con menos solicitudes en curso; se
+    abre una nueva conexión solo cuando todas están ocupadas y no se ha
+    alcanzado `max_connections`. Las conexiones caídas se descartan. La
+    conexión se abre fuera del lock, con la plaza ya reservada, para que
+    un servidor lento en aceptar no bloquee a los demás usuarios del pool.
+    """
+    
+    def __init__(self, host: str, port: int, max_connections: int = MAX_CONNECTIONS,
+                 connect_timeout: float = CONNECT_TIMEOUT, codec: str = CODEC):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.codec = codec
+        self.storage: Optional[str] = None  # Anunciado por el servidor en la última conexión
+        self._connections: List[PooledConnection] = []
+        self._connecting = 0  # Plazas reservadas por conexiones que se están abriendo
+        self._lock = threading.Condition()
+    
+    def get(self) -> PooledConnection:
+        """Devuelve una conexión para enviar la siguiente solicitud"""
+        with self._lock:
+            while True:
+                self._connections = [c for c in self._connections if not c.closed]
+                best = min(self._connections, key=lambda c: c.in_flight, default=None)
+                if ((best is None or best.in_flight)
+                        and len(self._connections) + self._connecting < self.max_connections):
+                    self._connecting += 1
+                    break
+                if best is not None:
+                    return best
+                self._lock.wait()  # Todas las plazas se están abriendo
+        try:
+            connection = PooledConnection(self.host, self.port, self.connect_timeout, self.codec)
+        except Exception:
+            with self._lock:
+                self._connecting -= 1
+                self._lock.notify_all()
+            raise
+        with self._lock:
+            self._connecting -= 1
+            self._connections.append(connection)
+            self.storage = connection.storage
+            self._lock.notify_all()
+        return connection
+    
+    def submit(self, request: Dict, timeout: Optional[float] = None) -> Future:
+        """
+        Envía una solicitud por el pool; los errores se entregan en el Future
+        
+        Con `timeout` la solicitud sin respuesta se olvida al vencer (ver
+        `PooledConnection.submit`).
+        """
+        try:
+            return self.get().submit(request, timeout)
+        except Exception as e:
+            future: Future = Future()
+            future.set_exception(e)
+            return future
+    
+    def close(self):
+        """Cierra todas las conexiones del pool"""
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
 
 
 class RPCClient:
     """Cliente RPC para comunicación con el servidor"""
     
-    def __init__(self, host: str, port: int, client_id: str):
+    def __init__(self, host: str, port: int, client_id: str,
+                 max_connections: int = MAX_CONNECTIONS,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 timeout: float = REQUEST_TIMEOUT,
+                 codec: str = CODEC,
+                 max_retries: int = MAX_RETRIES,
+                 deadline: Optional[float] = None,
+                 cache_size: int = 0):
+        """
+        Args:
+            max_retries: Reintentos de una solicitud rechazada con `busy`
+            deadline: Segundos tras los que el servidor puede descartar una
+                solicitud que sigue en cola (None: sin plazo)
+            cache_size: Posiciones guardadas en la caché LRU (0: sin caché)
+        """
         self.host = host
         self.port = port
         self.client_id = client_id
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.retries = 0  # Reintentos por `busy` realizados
         self.products_inserted = []  # Lista de IDs de productos insertados por este cliente
+        self.pool = ConnectionPool(host, port, max_connections, connect_timeout, codec)
+        self.cache = PositionCache(cache_size) if cache_size > 0 else None
+    
+    def close(self):
+        """Cierra las conexiones con el servidor"""
+        self.pool.close()
+    
+    def _usable_cache(self) -> Optional[PositionCache]:
+        """
+        La caché de posiciones, si está activa y el servidor es de solo-anexado
+        
+        Antes de la primera conexión no se sabe (None); si el servidor
+        anuncia otro modo de almacenamiento la caché se desactiva.
+        """
+        cache, storage = self.cache, self.pool.storage
+        if cache is None or storage is None:
+            return None
+        if storage != APPEND_ONLY:
+            print(f"[CLIENTE {self.client_id}] Caché de posiciones desactivada: "
+                  f"almacenamiento {storage!r}")
+            self.cache = None
+            return None
+        return cache
+    
+    def _cached(self, product_id: str) -> Optional[int]:
+        """Posición de `product_id` si está en la caché"""
+        cache = self._usable_cache()
+        return cache.get(product_id) if cache is not None else None
+    
+    def _remember(self, product_id: str, position: int) -> int:
+        """Guarda en la caché una posición recibida del servidor"""
+        if position != -1:
+            cache = self._usable_cache()
+            if cache is not None:
+                cache.put(product_id, position)
+        return position
+    
+    def cache_stats(self) -> Optional[Dict]:
+        """Aciertos, fallos y ocupación de la caché de posiciones (None si no hay)"""
+        return self.cache.stats() if self.cache is not None else None
+    
+    def call_async(self, operation: str, params: Dict) -> Future:
+        """
+        Envía una solicitud sin esperar la respuesta
+        
+        Las respuestas `busy` se reintentan con retroceso (ver `_backoff`);
+        si se agotan los reintentos, o el siguiente caería fuera del plazo,
+        el Future entrega la última respuesta `busy`.
+        
+        Returns:
+            Future con la respuesta del servidor como diccionario
+        """
+        request = build_request(operation, params, self.client_id)
+        if self.max_retries <= 0 and self.deadline is None:
+            return self.pool.submit(request, self.timeout)
+        expires = time.monotonic() + self.deadline if self.deadline is not None else None
+        result: Future = Future()
+        
+        def attempt(n: int):
+            if expires is not None:
+                request["deadline_ms"] = max(0, round((expires - time.monotonic()) * 1e3))
+            self.pool.submit(request, self.timeout).add_done_callback(lambda future: on_done(n, future))
+        
+        def on_done(n: int, future: Future):
+            error = future.exception()
+            if error is not None:
+                result.set_exception(error)
+                return
+            response = future.result()
+            if _is_busy(response) and n < self.max_retries:
+                delay = _backoff(n, response.get("retry_after", 0.0))
+                if expires is None or time.monotonic() + delay < expires:
+                    self.retries += 1
+                    _retry_timer.schedule(delay, lambda: attempt(n + 1))
+                    return
+            result.set_result(response)
+        
+        attempt(0)
+        return result
+    
+    def insert_async(self, product_id: str, nombre: str, precio: float) -> Future:
+        """
+        Inserta un producto sin esperar la respuesta
+        
+        Returns:
+            Future con la posición del producto o -1 si ya existe
+        """
+        params = {"id": product_id, "nombre": nombre, "precio": precio}
+        
+        def to_position(response: Dict) -> int:
+            position = position_from(response)
+            if position != -1:
+                self.products_inserted.append(product_id)
+            return self._remember(product_id, position)
+        
+        return chain(self.call_async("insert", params), to_position)
+    
+    def query_async(self, product_id: str, min_position: Optional[int] = None) -> Future:
+        """
+        Consulta un producto sin esperar la respuesta
+        
+        Args:
+            product_id: ID del producto a buscar
+            min_position: En una réplica, esperar a haber aplicado esta
+                posición antes de responder (leer las propias escrituras)
+        
+        Returns:
+            Future con la posición del producto o -1 si no existe
+        """
+        position = self._cached(product_id)
+        if position is not None:
+            return _done(position)
+        params = {"id": product_id}
+        if min_position is not None:
+            params["min_position"] = min_position
+        return chain(self.call_async("query", params),
+                     lambda response: self._remember(product_id, position_from(response)))
     
     def _send_request(self, operation: str, params: Dict) -> Optional[Dict]:
         """
@@ -34,37 +548,39 @@ class RPCClient:
         Args:
             operation: Tipo de operación ("insert" o "query")
             params: Parámetros de la operación
-            
+        
         Returns:
             Respuesta del servidor como diccionario o None si hay error
         """
         try:
-            # Crear socket y conectar
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect((self.host, self.port))
-            
-            # Crear solicitud
-            request = {
-                "operation": operation,
-                "params": params,
-                "client_id": self.client_id
-            }
-            
-            # Enviar solicitud
-            request_data = json.dumps(request).encode('utf-8')
-            client_socket.sendall(request_data)
-            
-            # Recibir respuesta
-            response_data = client_socket.recv(4096)
-            response = json.loads(response_data.decode('utf-8'))
-            
-            client_socket.close()
-            return response
-            
+            return self.call_async(operation, params).result(timeout=self.timeout)
         except Exception as e:
             print(f"[CLIENTE {self.client_id}] Error en solicitud: {e}")
             return None
     
+    def pipeline(self, operations: List[Tuple[str, Dict]]) -> List[Optional[Dict]]:
+        """
+        Envía varias solicitudes sin esperar respuesta entre ellas
+        
+        El servidor puede responderlas en cualquier orden; las respuestas se
+        emparejan por id y se devuelven en el orden de `operations`.
+        
+        Args:
+            operations: Lista de tuplas (operación, parámetros)
+        
+        Returns:
+            Lista de respuestas (None para las que fallaron)
+        """
+        futures = [self.call_async(op, params) for op, params in operations]
+        responses = []
+        for future in futures:
+            try:
+                responses.append(future.result(timeout=self.timeout))
+            except Exception as e:
+                print(f"[CLIENTE {self.client_id}] Error en pipeline: {e}")
+                responses.append(None)
+        return responses
+    
     def insert_product(self, product_id: str, nombre: str, precio: float) -> int:
         """
         Inserta un producto en el servidor
@@ -73,7 +589,7 @@ class RPCClient:
             product_id: ID del producto
             nombre: Nombre del producto
             precio: Precio del producto
-            
+        
         Returns:
             Posición del producto en el XML o -1 si ya existe
         """
@@ -91,6 +607,7 @@ class RPCClient:
             position = response.get("position", -1)
             if position != -1:
                 self.products_inserted.append(product_id)
+            self._remember(product_id, position)
             print(f"[CLIENTE {self.client_id}] INSERT completado: posición={position}")
             return position
         else:
@@ -104,17 +621,23 @@ class RPCClient:
         
         Args:
             product_id: ID del producto a buscar
-            
+        
         Returns:
             Posición del producto en el XML o -1 si no existe
         """
+        position = self._cached(product_id)
+        if position is not None:
+            print(f"[CLIENTE {self.client_id}] QUERY ID={product_id} resuelta en caché: "
+                  f"posición={position}")
+            return position
+        
         print(f"[CLIENTE {self.client_id}] Enviando QUERY: ID={product_id}")
         
         params = {"id": product_id}
         response = self._send_request("query", params)
         
         if response and response.get("status") == "success":
-            position = response.get("position", -1)
+            position = self._remember(product_id, response.get("position", -1))
             print(f"[CLIENTE {self.client_id}] QUERY completado: posición={position}")
             return position
         else:
@@ -122,6 +645,131 @@ class RPCClient:
             print(f"[CLIENTE {self.client_id}] Error en QUERY: {error_msg}")
             return -1
     
+    def _send_batches(self, operation: str, key: str, items: List, batch_size: int,
+                      extra: Optional[Dict] = None) -> List[int]:
+        """
+        Divide una operación por lotes en mensajes y los envía en pipeline
+        
+        Args:
+            extra: Parámetros adicionales para cada mensaje
+        
+        Returns:
+            Lista de posiciones concatenada en el orden de `items`
+            (-1 para los elementos de un lote que falló)
+        """
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        responses = self.pipeline([(operation, {key: batch, **(extra or {})})
+                                   for batch in batches])
+        
+        positions: List[int] = []
+        for batch, response in zip(batches, responses):
+            if response and response.get("status") == "success":
+                positions.extend(response.get("positions", []))
+            else:
+                error_msg = response.get("message", "Error desconocido") if response else "Sin respuesta"
+                print(f"[CLIENTE {self.client_id}] Error en {operation.upper()}: {error_msg}")
+                positions.extend([-1] * len(batch))
+        return positions
+    
+    def insert_many(self, products: List[Tuple[str, str, float]],
+                    batch_size: int = BATCH_SIZE) -> List[int]:
+        """
+        Inserta muchos productos con una solicitud por lote
+        
+        Args:
+            products: Lista de tuplas (id, nombre, precio)
+            batch_size: Productos por mensaje
+        
+        Returns:
+            Posición de cada producto o -1 si ya existía
+        """
+        print(f"[CLIENTE {self.client_id}] Enviando INSERT_MANY: {len(products)} productos")
+        
+        items = [{"id": product_id, "nombre": nombre, "precio": precio}
+                 for product_id, nombre, precio in products]
+        positions = self._send_batches("insert_many", "products", items, batch_size)
+        
+        for (product_id, _, _), position in zip(products, positions):
+            if position != -1:
+                self.products_inserted.append(product_id)
+                self._remember(product_id, position)
+        print(f"[CLIENTE {self.client_id}] INSERT_MANY completado: "
+              f"{sum(1 for p in positions if p != -1)} insertados")
+        return positions
+    
+    def query_many(self, product_ids: List[str], batch_size: int = BATCH_SIZE,
+                   min_position: Optional[int] = None) -> List[int]:
+        """
+        Consulta muchos productos con una solicitud por lote
+        
+        Args:
+            product_ids: IDs de los productos a buscar
+            batch_size: IDs por mensaje
+            min_position: En una réplica, esperar a haber aplicado esta posición
+        
+        Returns:
+            Posición de cada producto o -1 si no existe
+        """
+        product_ids = list(product_ids)
+        positions = [self._cached(product_id) for product_id in product_ids]
+        missing = [product_id for product_id, position in zip(product_ids, positions)
+                   if position is None]
+        hits = len(product_ids) - len(missing)
+        print(f"[CLIENTE {self.client_id}] Enviando QUERY_MANY: {len(missing)} IDs"
+              + (f" ({hits} resueltos en caché)" if hits else ""))
+        extra = {"min_position": min_position} if min_position is not None else None
+        fetched = iter(self._send_batches("query_many", "ids", missing, batch_size, extra)
+                       if missing else [])
+        for i, position in enumerate(positions):
+            if position is None:
+                positions[i] = self._remember(product_ids[i], next(fetched))
+        print(f"[CLIENTE {self.client_id}] QUERY_MANY completado: "
+              f"{sum(1 for p in positions if p != -1)} encontrados")
+        return positions
+    
+    def _query_page(self, operation: str, params: Dict, description: str) -> List[int]:
+        """Envía una consulta paginada y devuelve sus posiciones ([] si falla)"""
+        print(f"[CLIENTE {self.client_id}] Enviando {operation.upper()}: {description}")
+        response = self._send_request(operation, params)
+        if response and response.get("status") == "success":
+            positions = response.get("positions", [])
+            print(f"[CLIENTE {self.client_id}] {operation.upper()} completado: "
+                  f"{len(positions)} posiciones" + (" (hay más)" if response.get("more") else ""))
+            return positions
+        error_msg = response.get("message", "Error desconocido") if response else "Sin respuesta"
+        print(f"[CLIENTE {self.client_id}] Error en {operation.upper()}: {error_msg}")
+        return []
+    
+    def query_price_range(self, min_price: Optional[float] = None,
+                          max_price: Optional[float] = None, offset: int = 0,
+                          limit: int = RANGE_LIMIT) -> List[int]:
+        """
+        Consulta los productos con precio entre `min_price` y `max_price`
+        
+        Args:
+            min_price: Precio mínimo inclusive (None = sin mínimo)
+            max_price: Precio máximo inclusive (None = sin máximo)
+            offset: Resultados que se saltan (paginación)
+            limit: Máximo de posiciones devueltas
+        
+        Returns:
+            Posiciones ordenadas por precio; si hay `limit`, puede haber más
+        """
+        params = {"min": min_price, "max": max_price, "offset": offset, "limit": limit}
+        return self._query_page("query_price_range", params,
+                                f"precio entre {min_price} y {max_price}")
+    
+    def query_name_prefix(self, prefix: str, offset: int = 0,
+                          limit: int = RANGE_LIMIT) -> List[int]:
+        """
+        Consulta los productos cuyo nombre empieza por `prefix`
+        
+        Returns:
+            Posiciones ordenadas por nombre; si hay `limit`, puede haber más
+        """
+        params = {"prefix": prefix, "offset": offset, "limit": limit}
+        return self._query_page("query_name_prefix", params, f"prefijo {prefix!r}")
+    
     def run_random_operations(self, num_operations: int = 10):
         """
         Ejecuta múltiples operaciones aleatorias
@@ -158,6 +806,177 @@ class RPCClient:
         print(f"[CLIENTE {self.client_id}] Completadas todas las operaciones")
 
 
+class _AsyncConnection:
+    """Conexión persistente de AsyncRPCClient con una tarea lectora"""
+    
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, codec):
+        self._reader = reader
+        self._writer = writer
+        self.codec = codec
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self.closed = False
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+    
+    @classmethod
+    async def open(cls, host: str, port: int, connect_timeout: float,
+                   codec: str = CODEC) -> "_AsyncConnection":
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port),
+                                                connect_timeout)
+        try:
+            writer.write(_hello_request(codec))
+            frame = await asyncio.wait_for(read_frame_async(reader), connect_timeout)
+            if frame is None:
+                raise ConnectionError("El servidor cerró la conexión")
+        except Exception:
+            writer.close()
+            raise
+        return cls(reader, writer, _negotiated_codec(DEFAULT_CODEC.decode(frame[1])))
+    
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+    
+    def submit(self, request: Dict) -> asyncio.Future:
+        """Envía una solicitud y devuelve el future de su respuesta"""
+        payload = self.codec.encode(request)
+        if self.closed:
+            raise ConnectionError("La conexión está cerrada")
+        request_id = self._next_id
+        self._next_id = (self._next_id + 1) % (MAX_REQUEST_ID + 1)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        future.add_done_callback(lambda done: self._forget(request_id, done))
+        self._writer.write(encode_frame(request_id, payload))
+        return future
+    
+    def _forget(self, request_id: int, future: asyncio.Future):
+        """Quita de `_pending` una solicitud cancelada (p. ej. por `wait_for`)"""
+        if self._pending.get(request_id) is future:
+            del self._pending[request_id]
+    
+    async def _read_loop(self):
+        try:
+            while True:
+                frame = await read_frame_async(self._reader)
+                if frame is None:
+                    raise ConnectionError("El servidor cerró la conexión")
+                request_id, response_data = frame
+                future = self._pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(self.codec.decode(response_data))
+        except Exception as e:
+            self.closed = True
+            self._writer.close()
+            while self._pending:
+                _, future = self._pending.popitem()
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Conexión perdida: {e}"))
+    
+    async def close(self):
+        self.closed = True
+        self._writer.close()
+        self._reader_task.cancel()
+
+
+class AsyncRPCClient:
+    """
+    Cliente RPC para asyncio con pool de conexiones persistentes
+    
+    Uso:
+        client = AsyncRPCClient(HOST, PORT, "CLIENT-1")
+        posiciones = await asyncio.gather(*(client.query_product(i) for i in ids))
+        await client.close()
+    """
+    
+    def __init__(self, host: str, port: int, client_id: str,
+                 max_connections: int = MAX_CONNECTIONS,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 timeout: Optional[float] = REQUEST_TIMEOUT,
+                 codec: str = CODEC,
+                 max_retries: int = MAX_RETRIES,
+                 deadline: Optional[float] = None):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.codec = codec
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.retries = 0  # Reintentos por `busy` realizados
+        self._connections: List[_AsyncConnection] = []
+        self._connecting = 0  # Plazas reservadas por conexiones que se están abriendo
+        self._lock: Optional[asyncio.Condition] = None  # Se crea dentro del bucle de eventos
+    
+    async def _get_connection(self) -> _AsyncConnection:
+        """
+        Devuelve la conexión menos ocupada, abriendo una nueva si hace falta
+        
+        Como en `ConnectionPool.get`, la conexión se abre fuera del lock con
+        la plaza ya reservada.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Condition()
+        async with self._lock:
+            while True:
+                self._connections = [c for c in self._connections if not c.closed]
+                best = min(self._connections, key=lambda c: c.in_flight, default=None)
+                if ((best is None or best.in_flight)
+                        and len(self._connections) + self._connecting < self.max_connections):
+                    self._connecting += 1
+                    break
+                if best is not None:
+                    return best
+                await self._lock.wait()  # Todas las plazas se están abriendo
+        try:
+            connection = await _AsyncConnection.open(self.host, self.port, self.connect_timeout,
+                                                     self.codec)
+        except BaseException:
+            async with self._lock:
+                self._connecting -= 1
+                self._lock.notify_all()
+            raise
+        async with self._lock:
+            self._connecting -= 1
+            self._connections.append(connection)
+            self._lock.notify_all()
+        return connection
+    
+    async def call(self, operation: str, params: Dict) -> Dict:
+        """Envía una solicitud y espera su respuesta (reintenta las `busy`)"""
+        request = build_request(operation, params, self.client_id)
+        expires = time.monotonic() + self.deadline if self.deadline is not None else None
+        for attempt in itertools.count():
+            if expires is not None:
+                request["deadline_ms"] = max(0, round((expires - time.monotonic()) * 1e3))
+            connection = await self._get_connection()
+            response = await asyncio.wait_for(connection.submit(request), self.timeout)
+            if not _is_busy(response) or attempt >= self.max_retries:
+                return response
+            delay = _backoff(attempt, response.get("retry_after", 0.0))
+            if expires is not None and time.monotonic() + delay >= expires:
+                return response
+            self.retries += 1
+            await asyncio.sleep(delay)
+    
+    async def insert_product(self, product_id: str, nombre: str, precio: float) -> int:
+        """Inserta un producto y devuelve su posición o -1 si ya existe"""
+        params = {"id": product_id, "nombre": nombre, "precio": precio}
+        return position_from(await self.call("insert", params))
+    
+    async def query_product(self, product_id: str) -> int:
+        """Consulta un producto y devuelve su posición o -1 si no existe"""
+        return position_from(await self.call("query", {"id": product_id}))
+    
+    async def close(self):
+        """Cierra todas las conexiones"""
+        for connection in self._connections:
+            await connection.close()
+        self._connections = []
+
+
 def main():
     """Función principal del cliente"""
     import sys
@@ -166,12 +985,18 @@ def main():
     client_id = sys.argv[1] if len(sys.argv) > 1 else "CLIENT-1"
     num_operations = int(sys.argv[2]) if len(sys.argv) > 2 else 10
     
-    client = RPCClient(HOST, PORT, client_id)
+    client = RPCClient(HOST, PORT, client_id, cache_size=CACHE_SIZE)
     
     try:
         client.run_random_operations(num_operations)
+        stats = client.cache_stats()
+        if stats:
+            print(f"[CLIENTE {client_id}] Caché de posiciones: {stats['hits']} aciertos, "
+                  f"{stats['misses']} fallos")
     except KeyboardInterrupt:
         print(f"\n[CLIENTE {client_id}] Cliente detenido")
+    finally:
+        client.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Cliente para varios servidores RPC con hash consistente
+
+Cada ID de producto pertenece a un nodo (`host:puerto`) según un anillo
+de hash consistente con nodos virtuales: cada servidor ocupa
+`vnodes` puntos del anillo y un ID pertenece al primer punto que le
+sigue. Al agregar o quitar un nodo solo cambian de dueño las claves de
+los tramos que ese nodo gana o pierde (~1/N del total).
+
+`ClusterRPCClient` mantiene un `RPCClient` por nodo, comprueba
+periódicamente la salud de cada uno con la operación `ping` y, si un
+nodo no responde, envía sus claves al siguiente nodo vivo del anillo
+(failover). Los nodos no replican datos entre sí: mientras un nodo está
+caído sus productos no se encuentran y las inserciones de esas claves
+quedan en el nodo de respaldo.
+"""
+
+import bisect
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
+
+from cliente import (BATCH_SIZE, CODEC, CONNECT_TIMEOUT, MAX_CONNECTIONS, REQUEST_TIMEOUT,
+                     RPCClient, chain, position_from)
+
+VIRTUAL_NODES = 128  # Puntos del anillo por nodo
+HEALTH_INTERVAL = 1.0  # Segundos entre chequeos de salud
+HEALTH_TIMEOUT = 1.0  # Segundos para considerar caído un nodo que no responde al ping
+
+
+def parse_node(node: str) -> Tuple[str, int]:
+    """Convierte "host:puerto" en (host, puerto)"""
+    host, _, port = node.rpartition(":")
+    return host, int(port)
+
+
+class ConsistentHashRing:
+    """Anillo de hash consistente con nodos virtuales"""
+    
+    def __init__(self, nodes: List[str] = (), vnodes: int = VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self._points: List[int] = []  # Posiciones ordenadas en el anillo
+        self._owners: List[str] = []  # Nodo de cada posición
+        self._preferences: List[Tuple[str, ...]] = []  # Nodos distintos desde cada posición
+        for node in nodes:
+            self.add(node)
+    
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+    
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self._owners))
+    
+    def add(self, node: str):
+        """Agrega los nodos virtuales de un nodo"""
+        if node in self._owners:
+            return
+        for replica in range(self.vnodes):
+            point = self._hash(f"{node}#{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+        self._build_preferences()
+    
+    def remove(self, node: str):
+        """Quita los nodos virtuales de un nodo"""
+        keep = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in keep]
+        self._owners = [o for _, o in keep]
+        self._build_preferences()
+    
+    def _build_preferences(self):
+        """
+        Precalcula, para cada posición del anillo, los nodos distintos que
+        se encuentran al recorrerlo desde ahí, para no recorrerlo en cada
+        solicitud
+        """
+        num_nodes = len(set(self._owners))
+        preferences = []
+        for start in range(len(self._points)):
+            order: List[str] = []
+            offset = start
+            while len(order) < num_nodes:
+                node = self._owners[offset % len(self._owners)]
+                if node not in order:
+                    order.append(node)
+                offset += 1
+            preferences.append(tuple(order))
+        self._preferences = preferences
+    
+    def owners(self, key: str) -> Tuple[str, ...]:
+        """Nodos distintos en orden de preferencia para una clave (el primero es el dueño)"""
+        if not self._points:
+            return ()
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._preferences[index]
+    
+    def owner(self, key: str) -> Optional[str]:
+        owners = self.owners(key)
+        return owners[0] if owners else None
+
+
+class ClusterRPCClient:
+    """
+    Cliente RPC que reparte los productos entre varios servidores
+    
+    Ofrece la misma API que RPCClient para un producto (`insert_async`,
+    `query_async`, `insert_product`, `query_product`) y para lotes
+    (`insert_many`, `query_many`). Las posiciones devueltas son las del
+    nodo dueño de cada producto (ver `owner`).
+    """
+    
+    def __init__(self, nodes: List[str], client_id: str,
+                 vnodes: int = VIRTUAL_NODES,
+                 health_interval: Optional[float] = HEALTH_INTERVAL,
+                 max_connections: int = MAX_CONNECTIONS,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 timeout: float = REQUEST_TIMEOUT,
+                 codec: str = CODEC):
+        """
+        Args:
+            nodes: Nodos del cluster como "host:puerto"
+            client_id: Identificador del cliente
+            vnodes: Puntos del anillo por nodo
+            health_interval: Segundos entre chequeos de salud (None los desactiva)
+        """
+        self.client_id = client_id
+        self.timeout = timeout
+        self.ring = ConsistentHashRing(vnodes=vnodes)
+        self.products_inserted = []
+        self._client_options = dict(max_connections=max_connections,
+                                    connect_timeout=connect_timeout,
+                                    timeout=timeout, codec=codec)
+        self._clients: Dict[str, RPCClient] = {}
+        self._dead = set()  # Nodos que no responden
+        self._lock = threading.Lock()
+        for node in nodes:
+            self.add_node(node)
+        
+        self._closed = threading.Event()
+        self._health_thread = None
+        if health_interval:
+            self._health_thread = threading.Thread(
+                target=self._health_loop, args=(health_interval,), daemon=True)
+            self._health_thread.start()
+    
+    def add_node(self, node: str):
+        """Agrega un nodo al anillo; recibe ~1/N de las claves"""
+        host, port = parse_node(node)
+        with self._lock:
+            if node not in self._clients:
+                self._clients[node] = RPCClient(host, port, self.client_id,
+                                                **self._client_options)
+                self.ring.add(node)
+    
+    def remove_node(self, node: str):
+        """Quita un nodo del anillo; sus claves pasan al siguiente nodo"""
+        with self._lock:
+            client = self._clients.pop(node, None)
+            self.ring.remove(node)
+            self._dead.discard(node)
+        if client is not None:
+            client.close()
+    
+    @property
+    def alive_nodes(self) -> List[str]:
+        with self._lock:
+            return [node for node in self.ring.nodes if node not in self._dead]
+    
+    def owner(self, product_id: str) -> Optional[str]:
+        """Nodo que atiende un producto ahora mismo (el dueño, o su respaldo si está caído)"""
+        candidates = self._candidates(product_id)
+        return candidates[0] if candidates else None
+    
+    def _candidates(self, product_id: str) -> List[str]:
+        """Nodos a probar para un producto: primero los vivos en orden del anillo"""
+        with self._lock:
+            nodes = self.ring.owners(str(product_id))
+            dead = set(self._dead)
+        return [n for n in nodes if n not in dead] + [n for n in nodes if n in dead]
+    
+    def _mark(self, node: str, alive: bool):
+        with self._lock:
+            if node not in self._clients:
+                return
+            if alive and node in self._dead:
+                self._dead.discard(node)
+                print(f"[CLUSTER] Nodo {node} disponible de nuevo")
+            elif not alive and node not in self._dead:
+                self._dead.add(node)
+                print(f"[CLUSTER] Nodo {node} no responde; sus claves pasan al siguiente nodo")
+    
+    def ping(self, node: str, timeout: float = HEALTH_TIMEOUT) -> bool:
+        """Indica si un nodo responde al ping antes de `timeout` segundos"""
+        with self._lock:
+            client = self._clients.get(node)
+        if client is None:
+            return False
+        try:
+            client.call_async("ping", {}).result(timeout=timeout)
+            return True
+        except Exception:
+            return False
+    
+    def _health_loop(self, interval: float):
+        """Thread que hace ping a cada nodo y actualiza los nodos caídos"""
+        while not self._closed.wait(interval):
+            with self._lock:
+                clients = list(self._clients.items())
+            futures = [(node, client.call_async("ping", {})) for node, client in clients]
+            for node, future in futures:
+                try:
+                    future.result(timeout=HEALTH_TIMEOUT)
+                    self._mark(node, True)
+                except Exception:
+                    self._mark(node, False)
+    
+    def _call_with_failover(self, candidates: List[str], operation: str,
+                            params: Dict) -> Future:
+        """
+        Envía una solicitud al primer candidato y, si el nodo no responde
+        (error de conexión), la reenvía al siguiente
+        """
+        result: Future = Future()
+        
+        def attempt(index: int):
+            node = candidates[index]
+            with self._lock:
+                client = self._clients.get(node)
+            if client is None:
+                on_done(index, None)
+                return
+            client.call_async(operation, params).add_done_callback(
+                lambda future: on_done(index, future))
+        
+        def on_done(index: int, future: Optional[Future]):
+            error = ConnectionError("Nodo eliminado del cluster")
+            if future is not None:
+                error = future.exception()
+                if error is None:
+                    result.set_result(future.result())
+                    return
+                if not isinstance(error, OSError):
+                    result.set_exception(error)
+                    return
+                self._mark(candidates[index], False)
+            if index + 1 < len(candidates):
+                attempt(index + 1)
+            else:
+                result.set_exception(error)
+        
+        if not candidates:
+            result.set_exception(ConnectionError("El cluster no tiene nodos"))
+        else:
+            attempt(0)
+        return result
+    
+    def call_async(self, product_id: str, operation: str, params: Dict) -> Future:
+        """Envía una operación sobre un producto a su nodo; Future con la respuesta"""
+        return self._call_with_failover(self._candidates(product_id), operation, params)
+    
+    def insert_async(self, product_id: str, nombre: str, precio: float) -> Future:
+        """Future con la posición del producto en su nodo o -1 si ya existe"""
+        params = {"id": product_id, "nombre": nombre, "precio": precio}
+        
+        def to_position(response: Dict) -> int:
+            position = position_from(response)
+            if position != -1:
+                self.products_inserted.append(product_id)
+            return position
+        
+        return chain(self.call_async(product_id, "insert", params), to_position)
+    
+    def query_async(self, product_id: str) -> Future:
+        """Future con la posición del producto en su nodo o -1 si no existe"""
+        return chain(self.call_async(product_id, "query", {"id": product_id}), position_from)
+    
+    def insert_product(self, product_id: str, nombre: str, precio: float) -> int:
+        return self.insert_async(product_id, nombre, precio).result(timeout=self.timeout)
+    
+    def query_product(self, product_id: str) -> int:
+        return self.query_async(product_id).result(timeout=self.timeout)
+    
+    def _scatter(self, operation: str, key: str, items: List, ids: List[str],
+                 batch_size: int) -> List[int]:
+        """
+        Agrupa un lote por nodo, lo envía en paralelo y recompone el orden
+        
+        Los grupos de un nodo que deja de responder se reparten de nuevo
+        entre los nodos que quedan.
+        """
+        positions = [-1] * len(items)
+        remaining = list(range(len(items)))
+        while remaining:
+            groups: Dict[str, List[int]] = {}
+            for index in remaining:
+                candidates = self._candidates(ids[index])
+                if candidates:
+                    groups.setdefault(candidates[0], []).append(index)
+            remaining = []
+            requests = []
+            for node, indices in groups.items():
+                for start in range(0, len(indices), batch_size):
+                    chunk = indices[start:start + batch_size]
+                    params = {key: [items[i] for i in chunk]}
+                    requests.append((node, chunk, self._call_with_failover([node], operation,
+                                                                           params)))
+            for node, chunk, future in requests:
+                try:
+                    response = future.result(timeout=self.timeout)
+                except FutureTimeout:
+                    print(f"[CLUSTER] Sin respuesta de {node} a {operation.upper()}")
+                    continue
+                except OSError:
+                    if self.alive_nodes:
+                        remaining.extend(chunk)  # El nodo quedó marcado como caído
+                    continue
+                except Exception as e:
+                    print(f"[CLUSTER] Error en {operation.upper()} en {node}: {e}")
+                    continue
+                if response.get("status") == "success":
+                    for index, position in zip(chunk, response.get("positions", [])):
+                        positions[index] = position
+                else:
+                    print(f"[CLUSTER] Error en {operation.upper()} en {node}: "
+                          f"{response.get('message', 'Error desconocido')}")
+        return positions
+    
+    def insert_many(self, products: List[Tuple[str, str, float]],
+                    batch_size: int = BATCH_SIZE) -> List[int]:
+        """Inserta un lote repartido por nodo; posición de cada producto o -1"""
+        items = [{"id": product_id, "nombre": nombre, "precio": precio}
+                 for product_id, nombre, precio in products]
+        positions = self._scatter("insert_many", "products", items,
+                                  [product[0] for product in products], batch_size)
+        for (product_id, _, _), position in zip(products, positions):
+            if position != -1:
+                self.products_inserted.append(product_id)
+        return positions
+    
+    def query_many(self, product_ids: List[str], batch_size: int = BATCH_SIZE) -> List[int]:
+        """Consulta un lote repartido por nodo; posición de cada producto o -1"""
+        product_ids = list(product_ids)
+        return self._scatter("query_many", "ids", product_ids, product_ids, batch_size)
+    
+    def close(self):
+        """Detiene los chequeos de salud y cierra las conexiones con todos los nodos"""
+        self._closed.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            client.close()
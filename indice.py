@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Índice persistido del catálogo y carga diferida de registros
+
+Junto a `productos.xml` se guarda un índice binario (`productos.xml.idx`)
+con el ID y el offset en bytes de cada producto de la instantánea. Con un
+índice válido el servidor arranca sin analizar el XML: construye el
+diccionario id -> posición a partir del índice y lee cada registro del
+XML desde su offset solo cuando alguien lo necesita (replicación,
+compactación...).
+
+Formato del índice (little-endian):
+
+    cabecera   magic (8 bytes), tamaño del XML (uint64),
+               mtime del XML en ns (int64), crc32 del XML (uint32),
+               crc32 de los últimos `TAIL_CHECK_BYTES` del XML (uint32),
+               número de productos N (uint64)
+    offsets    N + 1 uint64: inicio de cada producto y, al final, inicio
+               de la etiqueta de cierre `</productos>`
+    IDs        lista JSON con el ID de cada producto en orden de posición
+    crc32      del contenido anterior (uint32)
+
+El índice solo se usa si el tamaño, la fecha de modificación y el crc32
+del final del XML coinciden con los de la cabecera; si no, está
+desactualizado y el servidor carga el XML completo y lo reconstruye en
+segundo plano. Comprobar solo el final mantiene el arranque independiente
+del tamaño del catálogo; con `verify=True` (`--verificar`) se comprueba
+además el crc32 del XML completo.
+"""
+
+import json
+import os
+import struct
+import sys
+import threading
+import xml.etree.ElementTree as ET
+import zlib
+from array import array
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from xml.parsers import expat
+from xml.sax.saxutils import quoteattr
+
+SIDECAR_SUFFIX = ".idx"  # Índice persistido junto al XML
+SIDECAR_MAGIC = b"RPCIDX02"
+CHUNK_SIZE = 1024 * 1024  # Bytes por lectura al recorrer el XML
+TAIL_CHECK_BYTES = 64 * 1024  # Bytes finales del XML que se comprueban al arrancar
+FIELDS = ("id", "nombre", "precio")  # Atributos de un producto, en orden
+
+_HEADER = struct.Struct("<8sQqIIQ")
+_TRAILER = struct.Struct("<I")
+_XML_HEADER = b"<?xml version='1.0' encoding='UTF-8'?>\n<productos>\n"
+_XML_FOOTER = b"</productos>\n"
+
+
+class Stamp(NamedTuple):
+    """Identifica una versión concreta del XML"""
+    size: int
+    mtime_ns: int
+    crc32: int
+    tail_crc32: int  # crc32 de los últimos `TAIL_CHECK_BYTES`
+
+
+class SidecarIndex(NamedTuple):
+    """Contenido del índice persistido de una instantánea"""
+    stamp: Stamp
+    offsets: array  # N + 1 offsets en bytes (ver el docstring del módulo)
+    ids: List[Optional[str]]
+
+
+def sidecar_file(xml_file: str) -> str:
+    """Ruta del índice persistido de un XML"""
+    return xml_file + SIDECAR_SUFFIX
+
+
+def _little_endian(offsets: array) -> array:
+    if sys.byteorder == "big":
+        offsets = array("Q", offsets)
+        offsets.byteswap()
+    return offsets
+
+
+def file_crc32(path: str) -> int:
+    """crc32 de un archivo completo, leído por bloques"""
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+def tail_crc32(path: str) -> int:
+    """crc32 de los últimos `TAIL_CHECK_BYTES` de un archivo"""
+    with open(path, "rb") as f:
+        f.seek(max(0, os.fstat(f.fileno()).st_size - TAIL_CHECK_BYTES))
+        return zlib.crc32(f.read())
+
+
+def file_stamp(path: str, crc: int) -> Stamp:
+    """Stamp de un archivo del que ya se calculó el crc32 completo"""
+    stat = os.stat(path)
+    return Stamp(stat.st_size, stat.st_mtime_ns, crc, tail_crc32(path))
+
+
+def scan_catalog(xml_file: str) -> SidecarIndex:
+    """
+    Recorre el XML una vez y obtiene el ID y el offset de cada producto
+    
+    Usa expat sin construir elementos, por lo que necesita mucha menos
+    memoria que ElementTree. Como en el catálogo en memoria, cada hijo
+    directo de la raíz ocupa una posición.
+    
+    Raises:
+        expat.ExpatError: Si el XML está mal formado
+    """
+    offsets = array("Q")
+    ids: List[Optional[str]] = []
+    depth = 0
+    parser = expat.ParserCreate()
+    
+    def start_element(tag: str, attrs: dict):
+        nonlocal depth
+        if depth == 1:
+            offsets.append(parser.CurrentByteIndex)
+            ids.append(attrs.get("id"))
+        depth += 1
+    
+    def end_element(tag: str):
+        nonlocal depth
+        depth -= 1
+        if depth == 0:
+            offsets.append(parser.CurrentByteIndex)
+    
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    crc = 0
+    with open(xml_file, "rb") as f:
+        stat = os.fstat(f.fileno())
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            parser.Parse(chunk, False)
+        parser.Parse(b"", True)
+        f.seek(max(0, stat.st_size - TAIL_CHECK_BYTES))
+        tail_crc = zlib.crc32(f.read())
+    return SidecarIndex(Stamp(stat.st_size, stat.st_mtime_ns, crc, tail_crc), offsets, ids)
+
+
+def write_sidecar(xml_file: str, index: SidecarIndex):
+    """Escribe el índice de forma atómica (archivo temporal + reemplazo)"""
+    stamp = index.stamp
+    data = b"".join([
+        _HEADER.pack(SIDECAR_MAGIC, stamp.size, stamp.mtime_ns, stamp.crc32, stamp.tail_crc32,
+                     len(index.ids)),
+        _little_endian(index.offsets).tobytes(),
+        json.dumps(index.ids, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+    ])
+    path = sidecar_file(xml_file)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+        f.write(_TRAILER.pack(zlib.crc32(data)))
+    os.replace(tmp_file, path)
+
+
+def load_sidecar(xml_file: str, verify: bool = False) -> Optional[SidecarIndex]:
+    """
+    Lee el índice persistido si corresponde a la versión actual del XML
+    
+    Args:
+        verify: Comprobar también el crc32 del XML completo (lee todo el archivo)
+    
+    Returns:
+        El índice, o None si no existe, está dañado o está desactualizado
+    """
+    try:
+        with open(sidecar_file(xml_file), "rb") as f:
+            data = f.read()
+        stat = os.stat(xml_file)
+    except OSError:
+        return None
+    if len(data) < _HEADER.size + _TRAILER.size or \
+            zlib.crc32(data[:-_TRAILER.size]) != _TRAILER.unpack(data[-_TRAILER.size:])[0]:
+        return None
+    magic, size, mtime_ns, crc, tail_crc, count = _HEADER.unpack_from(data)
+    if magic != SIDECAR_MAGIC or (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    # La fecha puede coincidir tras una edición rápida: confirmar el final
+    # del contenido (donde escriben las compactaciones) o, con `verify`, todo
+    if tail_crc32(xml_file) != tail_crc or (verify and file_crc32(xml_file) != crc):
+        return None
+    
+    ids_start = _HEADER.size + (count + 1) * 8
+    offsets = array("Q")
+    offsets.frombytes(data[_HEADER.size:ids_start])
+    offsets = _little_endian(offsets)
+    ids = json.loads(data[ids_start:-_TRAILER.size])
+    if len(ids) != count:
+        return None
+    return SidecarIndex(Stamp(size, mtime_ns, crc, tail_crc), offsets, ids)
+
+
+def _record_line(attrs: Iterable[Tuple[str, str]]) -> bytes:
+    """Línea de un producto en una instantánea del XML"""
+    return ("  <producto " + " ".join(f"{k}={quoteattr(v)}" for k, v in attrs) +
+            " />\n").encode("utf-8")
+
+
+def _pack_price(precio) -> Optional[float]:
+    """El precio como float si su texto se recupera exacto con repr(), o None"""
+    try:
+        value = float(precio)
+    except (TypeError, ValueError):
+        return None
+    return value if repr(value) == precio else None
+
+
+class RecordStore:
+    """
+    Registros del catálogo en orden de posición
+    
+    Los `base` primeros son los de la instantánea indexada y se leen del
+    XML bajo demanda a partir de sus offsets; los siguientes (inserciones
+    y entradas del diario) se guardan en memoria por columnas en lugar de
+    un Element por producto:
+    
+    - `ids`: lista con el ID de todas las posiciones (las mismas cadenas
+      que las claves del índice id -> posición, sin duplicarlas)
+    - nombres: un único bytearray UTF-8 con el offset final de cada uno
+    - precios: array de float64; los que no se recuperan exactos con
+      repr() (p. ej. "10.50") se guardan como texto aparte
+    - los productos con atributos distintos de id, nombre y precio
+      conservan su diccionario de atributos aparte
+    
+    Sin instantánea indexada todos los registros están en memoria. No
+    tiene lock propio para las posiciones: el ProductManager lo usa bajo
+    su lock de lectura/escritura.
+    """
+    
+    def __init__(self):
+        self.ids: List[Optional[str]] = []
+        self._offsets = array("Q")  # Vacío si no hay instantánea indexada
+        # Columnas de los registros desde la posición `base`
+        self._names = bytearray()
+        self._name_ends = array("Q")
+        self._prices = array("d")
+        self._raw_prices: Dict[int, str] = {}  # Posición -> precio textual
+        self._attrs: Dict[int, Dict[str, str]] = {}  # Posición -> atributos irregulares
+        self._file: Optional[BinaryIO] = None
+        self._file_lock = threading.Lock()  # Serializa seek + read
+    
+    @classmethod
+    def from_sidecar(cls, xml_file: str, index: SidecarIndex) -> "RecordStore":
+        store = cls()
+        store.ids = index.ids
+        store._offsets = index.offsets
+        store._file = open(xml_file, "rb")
+        return store
+    
+    @classmethod
+    def from_xml(cls, xml_file: str) -> "RecordStore":
+        """
+        Carga en memoria todos los productos de un XML
+        
+        Recorre el documento con expat sin construir el árbol, de modo que
+        el pico de memoria es el de las columnas. Como en el catálogo
+        original, cada hijo directo de la raíz ocupa una posición.
+        """
+        store = cls()
+        depth = 0
+        
+        def start_element(tag: str, attrs: Dict[str, str]):
+            nonlocal depth
+            if depth == 1:
+                store.append_attrs(attrs)
+            depth += 1
+        
+        def end_element(tag: str):
+            nonlocal depth
+            depth -= 1
+        
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        with open(xml_file, "rb") as f:
+            parser.ParseFile(f)
+        return store
+    
+    @property
+    def base(self) -> int:
+        """Registros que se leen del XML indexado"""
+        return max(len(self._offsets) - 1, 0)
+    
+    @property
+    def indexed(self) -> bool:
+        """Hay una instantánea indexada detrás de los primeros registros"""
+        return len(self._offsets) > 0
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def append(self, product_id: str, nombre: str, precio: str):
+        """Agrega un producto al final"""
+        # Lo que puede fallar va antes de tocar ninguna columna
+        name = nombre.encode("utf-8")
+        price = _pack_price(precio)
+        if price is None:
+            self._raw_prices[len(self.ids)] = precio
+            price = 0.0
+        self._names += name
+        self._name_ends.append(len(self._names))
+        self._prices.append(price)
+        self.ids.append(product_id)
+    
+    def append_attrs(self, attrs: Dict[str, str]):
+        """Agrega un producto leído del XML con sus atributos"""
+        if tuple(attrs) == FIELDS:
+            self.append(attrs["id"], attrs["nombre"], attrs["precio"])
+        else:
+            self._attrs[len(self.ids)] = dict(attrs)
+            self.append(attrs.get("id"), "", "")
+    
+    def _tail_attrs(self, position: int) -> List[Tuple[str, str]]:
+        """Atributos de un registro en memoria, en su orden original"""
+        attrs = self._attrs.get(position)
+        if attrs is not None:
+            return list(attrs.items())
+        index = position - self.base
+        start = self._name_ends[index - 1] if index else 0
+        nombre = self._names[start:self._name_ends[index]].decode("utf-8")
+        precio = self._raw_prices.get(position)
+        if precio is None:
+            precio = repr(self._prices[index])
+        return [("id", self.ids[position]), ("nombre", nombre), ("precio", precio)]
+    
+    def _read(self, start: int, end: int) -> bytes:
+        with self._file_lock:
+            self._file.seek(start)
+            return self._file.read(end - start)
+    
+    def _chunks(self, start: int, end: int) -> Iterator[bytes]:
+        while start < end:
+            chunk = self._read(start, min(start + CHUNK_SIZE, end))
+            if not chunk:
+                raise EOFError(f"El XML terminó antes del offset {end}")
+            start += len(chunk)
+            yield chunk
+    
+    def entries(self, start: int, stop: int) -> List[Tuple[str, str, str]]:
+        """Entradas (id, nombre, precio) de las posiciones [start, stop)"""
+        stop = min(stop, len(self.ids))
+        if start >= stop:
+            return []
+        entries: List[Tuple[str, str, str]] = []
+        base = self.base
+        if start < base:
+            # Un solo fragmento contiguo del XML para todo el tramo indexado
+            end = min(stop, base)
+            data = self._read(self._offsets[start], self._offsets[end])
+            entries.extend((p.get("id"), p.get("nombre"), p.get("precio"))
+                           for p in ET.fromstring(b"<productos>" + data + b"</productos>"))
+            start = end
+        for position in range(start, stop):
+            attrs = dict(self._tail_attrs(position))
+            entries.append((attrs.get("id"), attrs.get("nombre"), attrs.get("precio")))
+        return entries
+    
+    def write_snapshot(self, out: BinaryIO, count: int) -> Tuple[array, int]:
+        """
+        Escribe en `out` un XML con los `count` primeros registros
+        
+        El tramo indexado se copia byte a byte del XML actual, sin
+        analizarlo; los registros en memoria se escriben uno por línea.
+        Puede llamarse sin el lock: solo lee registros ya publicados.
+        
+        Returns:
+            (offsets del nuevo XML, crc32 del nuevo XML)
+        """
+        crc = zlib.crc32(_XML_HEADER)
+        out.write(_XML_HEADER)
+        position = len(_XML_HEADER)
+        offsets = array("Q")
+        base = self.base
+        if base:
+            first, last = self._offsets[0], self._offsets[base]
+            shift = position - first
+            offsets.extend(offset + shift for offset in self._offsets[:base])
+            for chunk in self._chunks(first, last):
+                crc = zlib.crc32(chunk, crc)
+                out.write(chunk)
+            position += last - first
+        for record in range(base, count):
+            line = _record_line(self._tail_attrs(record))
+            offsets.append(position)
+            crc = zlib.crc32(line, crc)
+            out.write(line)
+            position += len(line)
+        offsets.append(position)
+        out.write(_XML_FOOTER)
+        return offsets, zlib.crc32(_XML_FOOTER, crc)
+    
+    def rebase(self, xml_file: str, index: SidecarIndex):
+        """
+        Pasa a leer del XML indexado los registros que este contiene
+        
+        Se llama tras escribir o indexar una instantánea; las columnas de
+        los registros que ya están en ella se liberan. Debe llamarse con
+        el lock de escritura tomado.
+        """
+        new_file = open(xml_file, "rb")
+        count = len(index.offsets) - 1
+        dropped = count - self.base
+        with self._file_lock:
+            old_file, self._file = self._file, new_file
+            if dropped > 0:
+                cut = self._name_ends[dropped - 1]
+                del self._names[:cut]
+                self._name_ends = array("Q", (end - cut for end in self._name_ends[dropped:]))
+                del self._prices[:dropped]
+                self._raw_prices = {k: v for k, v in self._raw_prices.items() if k >= count}
+                self._attrs = {k: v for k, v in self._attrs.items() if k >= count}
+            self._offsets = index.offsets
+        if old_file is not None:
+            old_file.close()
+    
+    def close(self):
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
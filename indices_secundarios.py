@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Índices secundarios ordenados del catálogo (precio y nombre)
+
+`SortedIndex` guarda pares (clave, posición) ordenados en bloques de
+hasta `2 * CHUNK_LOAD` elementos, con la clave máxima de cada bloque
+aparte para localizar el bloque con una búsqueda binaria:
+
+- insertar cuesta O(log n) más el desplazamiento dentro de un bloque
+  (nunca el de todo el índice, como pasaría con una sola lista ordenada)
+- una consulta por rango o por prefijo cuesta O(log n) más los
+  elementos que recorre (los saltados por `offset` y los devueltos)
+
+A igual clave los productos quedan en orden de posición, de modo que la
+paginación con offset/limit es estable mientras no haya inserciones.
+Las claves de precio se guardan en arrays de float64.
+"""
+
+import bisect
+from array import array
+from typing import Callable, Iterator, List, Optional, Tuple
+
+CHUNK_LOAD = 512  # Tamaño de referencia de cada bloque
+DEFAULT_RANGE_LIMIT = 100  # Posiciones por página si no se indica `limit`
+MAX_RANGE_LIMIT = 1000  # Máximo de posiciones por página
+
+
+def price_key(precio) -> Optional[float]:
+    """Clave de precio de un producto, o None si el precio no es numérico"""
+    try:
+        value = float(precio)
+    except (TypeError, ValueError):
+        return None
+    return value if value == value else None  # NaN no tiene orden
+
+
+def name_key(nombre) -> Optional[str]:
+    """Clave de nombre de un producto, o None si no tiene"""
+    return nombre if isinstance(nombre, str) else None
+
+
+class SortedIndex:
+    """Pares (clave, posición) ordenados por clave y, a igual clave, por posición"""
+    
+    def __init__(self, typecode: Optional[str] = None):
+        """
+        Args:
+            typecode: Tipo de `array` para las claves ("d" para precios);
+                None guarda las claves en listas
+        """
+        self._typecode = typecode
+        self._keys: List = []  # Un bloque de claves ordenadas por bloque
+        self._positions: List[array] = []
+        self._maxes: List = []  # Última clave de cada bloque
+        self._size = 0
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def _new_keys(self, keys=()):
+        return array(self._typecode, keys) if self._typecode else list(keys)
+    
+    def build(self, items: List[Tuple]):
+        """Reemplaza el contenido por `items` (pares clave, posición) en cualquier orden"""
+        items.sort()
+        self._keys, self._positions, self._maxes = [], [], []
+        for start in range(0, len(items), CHUNK_LOAD):
+            chunk = items[start:start + CHUNK_LOAD]
+            self._keys.append(self._new_keys(key for key, _ in chunk))
+            self._positions.append(array("q", (position for _, position in chunk)))
+            self._maxes.append(chunk[-1][0])
+        self._size = len(items)
+    
+    def insert(self, key, position: int):
+        """
+        Agrega una posición; debe ser mayor que las ya indexadas con la
+        misma clave (el catálogo es de solo-anexado)
+        """
+        if not self._maxes:
+            self._keys.append(self._new_keys([key]))
+            self._positions.append(array("q", [position]))
+            self._maxes.append(key)
+            self._size = 1
+            return
+        chunk = bisect.bisect_right(self._maxes, key)
+        if chunk == len(self._maxes):
+            chunk -= 1
+        keys, positions = self._keys[chunk], self._positions[chunk]
+        i = bisect.bisect_right(keys, key)
+        keys.insert(i, key)
+        positions.insert(i, position)
+        self._maxes[chunk] = keys[-1]
+        self._size += 1
+        if len(keys) > 2 * CHUNK_LOAD:
+            half = len(keys) // 2
+            self._keys[chunk:chunk + 1] = [keys[:half], keys[half:]]
+            self._positions[chunk:chunk + 1] = [positions[:half], positions[half:]]
+            self._maxes[chunk:chunk + 1] = [keys[half - 1], keys[-1]]
+    
+    def _scan(self, low, stop: Callable[[object], bool]) -> Iterator[Tuple]:
+        """Recorre en orden los pares con clave >= `low` hasta que `stop(clave)`"""
+        chunk = bisect.bisect_left(self._maxes, low)
+        if chunk == len(self._maxes):
+            return
+        i = bisect.bisect_left(self._keys[chunk], low)
+        for keys, positions in zip(self._keys[chunk:], self._positions[chunk:]):
+            for j in range(i, len(keys)):
+                key = keys[j]
+                if stop(key):
+                    return
+                yield key, positions[j]
+            i = 0
+    
+    @staticmethod
+    def _page(items: Iterator[Tuple], offset: int, limit: int) -> Tuple[List[Tuple], bool]:
+        page = []
+        for n, item in enumerate(items):
+            if n < offset:
+                continue
+            if len(page) == limit:
+                return page, True
+            page.append(item)
+        return page, False
+    
+    def range(self, low, high, offset: int = 0,
+              limit: int = DEFAULT_RANGE_LIMIT) -> Tuple[List[Tuple], bool]:
+        """
+        Pares con `low <= clave <= high`, en orden
+        
+        Returns:
+            (página de pares (clave, posición), hay más resultados)
+        """
+        return self._page(self._scan(low, lambda key: key > high), offset, limit)
+    
+    def prefix(self, prefix: str, offset: int = 0,
+               limit: int = DEFAULT_RANGE_LIMIT) -> Tuple[List[Tuple], bool]:
+        """Pares cuya clave empieza por `prefix`, en orden (ver `range`)"""
+        return self._page(self._scan(prefix, lambda key: not key.startswith(prefix)),
+                          offset, limit)
+
+
+def page_bounds(offset, limit) -> Tuple[int, int]:
+    """Valida y normaliza offset/limit de una consulta paginada"""
+    offset = int(offset or 0)
+    limit = DEFAULT_RANGE_LIMIT if limit is None else int(limit)
+    if offset < 0 or limit < 0:
+        raise ValueError("offset y limit no pueden ser negativos")
+    return offset, min(limit, MAX_RANGE_LIMIT)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Registro de métricas en proceso para el servidor RPC
+
+Ofrece contadores, gauges e histogramas con etiquetas, pensados para
+quedarse activos en producción: registrar un valor cuesta una
+adquisición de lock y, en los histogramas, una búsqueda binaria sobre
+buckets fijos.
+
+El registro se consulta con la operación RPC `stats` (como diccionario)
+o en texto plano con el formato de exposición de Prometheus a través de
+`start_metrics_server`.
+"""
+
+import bisect
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Límites superiores de los buckets de tiempo (segundos): 10µs .. ~100s
+TIME_BUCKETS = [1e-5 * 2 ** i for i in range(24)]
+# Límites superiores de los buckets de tamaño (p. ej. profundidad de cola)
+SIZE_BUCKETS = [2 ** i for i in range(21)]
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: LabelSet, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """Contador monótono, incrementado explícitamente o leído de una cuenta ajena"""
+    
+    kind = "counter"
+    
+    def __init__(self, function: Optional[Callable[[], float]] = None):
+        self._lock = threading.Lock()
+        self._function = function  # Debe devolver un valor que solo crece
+        self._value = 0
+    
+    @property
+    def value(self) -> float:
+        return self._function() if self._function else self._value
+    
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+    
+    def snapshot(self):
+        return self.value
+    
+    def state(self):
+        return self.value
+    
+    def load(self, state):
+        self._value = state
+    
+    def render(self, name: str, labels: LabelSet) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {self.value}"]
+
+
+class Gauge:
+    """Valor instantáneo, fijado explícitamente o calculado al consultarlo"""
+    
+    kind = "gauge"
+    
+    def __init__(self, function: Optional[Callable[[], float]] = None):
+        self._lock = threading.Lock()
+        self._function = function
+        self._value = 0
+    
+    @property
+    def value(self) -> float:
+        return self._function() if self._function else self._value
+    
+    def set(self, value: float):
+        self._value = value
+    
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+    
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+    
+    def snapshot(self):
+        return self.value
+    
+    def state(self):
+        return self.value
+    
+    def load(self, state):
+        self._value = state
+    
+    def render(self, name: str, labels: LabelSet) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {self.value}"]
+
+
+class Histogram:
+    """Histograma con buckets fijos; estima percentiles a partir de ellos"""
+    
+    kind = "histogram"
+    
+    def __init__(self, buckets: List[float] = TIME_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # El último es +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+    
+    def quantile(self, fraction: float) -> float:
+        """Límite superior del bucket que contiene el percentil pedido"""
+        with self._lock:
+            counts, total, maximum = list(self.counts), self.count, self.max
+        if not total:
+            return 0.0
+        target = fraction * total
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(self.buckets[index], maximum) if index < len(self.buckets) else maximum
+        return maximum
+    
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+    
+    def state(self) -> Tuple:
+        with self._lock:
+            return self.buckets, list(self.counts), self.count, self.sum, self.max
+    
+    def load(self, state: Tuple):
+        _, counts, count, total_sum, maximum = state
+        with self._lock:
+            self.counts, self.count, self.sum, self.max = list(counts), count, total_sum, maximum
+    
+    def render(self, name: str, labels: LabelSet) -> List[str]:
+        with self._lock:
+            counts, total, total_sum = list(self.counts), self.count, self.sum
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ["+Inf"], counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', str(bound)))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total_sum}")
+        lines.append(f"{name}_count{_format_labels(labels)} {total}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Conjunto de métricas identificadas por nombre y etiquetas
+    
+    Las métricas de otro proceso se incorporan con `export` en el origen y
+    `merge` en el destino; un colector (`add_collector`) puede hacerlo
+    justo antes de cada consulta del registro.
+    """
+    
+    _FACTORIES = {"counter": Counter, "gauge": Gauge}
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict[LabelSet, object]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], None]] = []
+    
+    def _get(self, name: str, help_text: str, labels: Dict[str, str], factory):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        family = self._metrics.get(name)
+        metric = family.get(key) if family is not None else None
+        if metric is None:
+            with self._lock:
+                family = self._metrics.setdefault(name, {})
+                self._help.setdefault(name, help_text)
+                metric = family.get(key)
+                if metric is None:
+                    metric = family[key] = factory()
+        return metric
+    
+    def counter(self, name: str, help_text: str = "",
+                function: Optional[Callable[[], float]] = None, **labels) -> Counter:
+        return self._get(name, help_text, labels, lambda: Counter(function))
+    
+    def gauge(self, name: str, help_text: str = "",
+              function: Optional[Callable[[], float]] = None, **labels) -> Gauge:
+        return self._get(name, help_text, labels, lambda: Gauge(function))
+    
+    def histogram(self, name: str, help_text: str = "",
+                  buckets: List[float] = TIME_BUCKETS, **labels) -> Histogram:
+        return self._get(name, help_text, labels, lambda: Histogram(buckets))
+    
+    def add_collector(self, collector: Callable[[], None]):
+        """Registra una función que actualiza métricas antes de cada `snapshot`/`render_text`"""
+        self._collectors.append(collector)
+    
+    def _collect(self):
+        for collector in self._collectors:
+            collector()
+    
+    def export(self) -> List[Tuple[str, str, str, LabelSet, object]]:
+        """Estado de cada métrica como (nombre, ayuda, tipo, etiquetas, estado), serializable"""
+        with self._lock:
+            families = {name: dict(family) for name, family in self._metrics.items()}
+        return [(name, self._help.get(name, ""), metric.kind, labels, metric.state())
+                for name, family in families.items() for labels, metric in family.items()]
+    
+    def merge(self, exported: List[Tuple[str, str, str, LabelSet, object]], **labels):
+        """Copia el estado exportado por otro registro, añadiendo `labels` a cada métrica"""
+        for name, help_text, kind, metric_labels, state in exported:
+            if kind == "histogram":
+                factory = functools.partial(Histogram, state[0])
+            else:
+                factory = self._FACTORIES[kind]
+            metric = self._get(name, help_text, {**dict(metric_labels), **labels}, factory)
+            metric.load(state)
+    
+    def snapshot(self) -> Dict:
+        """Valores actuales como diccionario serializable a JSON"""
+        self._collect()
+        with self._lock:
+            families = {name: dict(family) for name, family in self._metrics.items()}
+        result = {}
+        for name, family in sorted(families.items()):
+            for labels, metric in family.items():
+                key = name + _format_labels(labels)
+                result[key] = metric.snapshot()
+        return result
+    
+    def render_text(self) -> str:
+        """Valores actuales en el formato de texto de Prometheus"""
+        self._collect()
+        with self._lock:
+            families = {name: dict(family) for name, family in self._metrics.items()}
+        lines = []
+        for name, family in sorted(families.items()):
+            kind = next(iter(family.values())).kind
+            if self._help.get(name):
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in family.items():
+                lines.extend(metric.render(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(registry: MetricsRegistry, host: str, port: int) -> ThreadingHTTPServer:
+    """
+    Expone el registro en texto plano por HTTP en un thread en segundo plano
+    
+    Cualquier ruta devuelve todas las métricas (p. ej. `curl host:port/metrics`).
+    """
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass  # Sin una línea por consulta
+    
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
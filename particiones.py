@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+"""
+Particionado del catálogo entre varios procesos (modo `--particiones N`)
+
+Los productos se reparten por hash del ID (crc32, estable entre procesos)
+entre N procesos hijos. Cada uno tiene su propio ProductManager sobre
+`<xml>.shard<i>.xml`, con su diario, su lock y su intérprete (sin GIL
+compartido). El servidor front-end conserva la red, la planificación y
+los workers, y enruta cada operación a su partición con
+`ShardedProductManager`, que expone la misma interfaz que ProductManager.
+
+Posiciones globales: la posición `offset` dentro de la partición `shard`
+se publica como `offset * N + shard`, de modo que es única, estable y
+reversible con `ShardedProductManager.locate`. -1 sigue indicando "no
+existe" / "ya existía".
+
+Entre el front-end y cada partición los mensajes viajan por un Pipe en
+lotes: un thread emisor junta todo lo pendiente en un solo envío, lo que
+amortiza el costo de pickle y de la llamada al sistema cuando hay muchas
+solicitudes en curso.
+"""
+
+import functools
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import xml.etree.ElementTree as ET
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from admision import ServerBusy
+from indice import sidecar_file
+from indices_secundarios import DEFAULT_RANGE_LIMIT, page_bounds
+from metricas import MetricsRegistry
+
+SHARD_SUFFIX = ".shard{}.xml"  # Archivo de cada partición junto al XML original
+SHARD_COUNT_SUFFIX = ".shards"  # Número de particiones con que se repartió el catálogo
+SHARD_WORKERS = 8  # Threads por partición que ejecutan las operaciones
+SHARD_START_TIMEOUT = 60.0  # Segundos para que una partición cargue su catálogo
+SHARD_METRICS_TIMEOUT = 1.0  # Segundos de espera por las métricas de una partición
+SPLIT_SUFFIX = ".repartido"  # Sufijo del XML original (y su diario) una vez repartido
+
+
+def shard_for(product_id: str, num_shards: int) -> int:
+    """Partición que corresponde a un ID de producto"""
+    return zlib.crc32(str(product_id).encode("utf-8")) % num_shards
+
+
+def shard_file(xml_file: str, shard: int) -> str:
+    """Ruta del XML de una partición"""
+    base, _ = os.path.splitext(xml_file)
+    return base + SHARD_SUFFIX.format(shard)
+
+
+def saved_shard_count(xml_file: str) -> int:
+    """Particiones en que está repartido el catálogo (0 si no lo está)"""
+    path = os.path.splitext(xml_file)[0] + SHARD_COUNT_SUFFIX
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    # Particiones creadas antes de guardar el número: contar los archivos
+    count = 0
+    while os.path.exists(shard_file(xml_file, count)):
+        count += 1
+    return count
+
+
+def check_shard_count(xml_file: str, num_shards: int):
+    """
+    Comprueba que el catálogo se abre con el mismo número de particiones
+    con que se repartió, y lo guarda la primera vez en `<base>.shards`
+    
+    Con otro número los IDs irían a particiones distintas: los existentes
+    dejarían de encontrarse y se podrían insertar de nuevo. Con
+    `num_shards = 0` (sin particiones) solo comprueba que el catálogo no
+    esté repartido.
+    
+    Raises:
+        ValueError: Si el número no coincide con el guardado
+    """
+    path = os.path.splitext(xml_file)[0] + SHARD_COUNT_SUFFIX
+    saved = saved_shard_count(xml_file)
+    if saved and not num_shards:
+        raise ValueError(f"El catálogo {xml_file} está repartido en {saved} particiones "
+                         f"(use --particiones {saved})")
+    if saved and saved != num_shards:
+        raise ValueError(f"El catálogo {xml_file} está repartido en {saved} particiones; "
+                         f"no puede abrirse con {num_shards} (use --particiones {saved})")
+    if num_shards and not os.path.exists(path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"{num_shards}\n")
+
+
+def journal_entries(xml_file: str) -> Iterator[Tuple[str, str, str]]:
+    """Entradas válidas del diario sin compactar del XML, en orden de inserción"""
+    import servidor  # Diferido: servidor importa este módulo
+    
+    journal_file = xml_file + servidor.JOURNAL_SUFFIX
+    for path in (journal_file + servidor.COMPACTING_SUFFIX, journal_file):
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if (isinstance(entry, list) and len(entry) == 3
+                        and all(isinstance(field, str) for field in entry)):
+                    yield tuple(entry)
+
+
+def retire_original(xml_file: str) -> List[str]:
+    """
+    Renombra el XML original, su índice y su diario a `<archivo>.repartido`
+    
+    Tras el reparto son una copia desactualizada: así ni el servidor ni
+    las herramientas los leen por error, pero se conservan.
+    
+    Returns:
+        Archivos renombrados
+    """
+    import servidor  # Diferido: servidor importa este módulo
+    
+    journal_file = xml_file + servidor.JOURNAL_SUFFIX
+    retired = []
+    for path in (xml_file, sidecar_file(xml_file), journal_file,
+                 journal_file + servidor.COMPACTING_SUFFIX):
+        if os.path.exists(path):
+            os.replace(path, path + SPLIT_SUFFIX)
+            retired.append(path)
+    return retired
+
+
+def split_catalog(xml_file: str, num_shards: int) -> bool:
+    """
+    Reparte un productos.xml existente entre los archivos de las particiones
+    
+    Solo actúa si todavía no existe ningún archivo de partición, de modo
+    que pasar a modo particionado conserva el catálogo. Las inserciones
+    que siguen en el diario del XML (sin compactar) se reparten también,
+    tras los productos del XML. Las posiciones pasan a ser globales (ver
+    el docstring del módulo).
+    
+    Las particiones se escriben en archivos temporales y se renombran al
+    terminar; después se retira el original (`retire_original`).
+    
+    Returns:
+        True si se repartió el catálogo
+    """
+    files = [shard_file(xml_file, shard) for shard in range(num_shards)]
+    if any(os.path.exists(f) for f in files):
+        if all(os.path.exists(f) for f in files):
+            retire_original(xml_file)  # Un reparto anterior pudo cortarse antes de retirarlo
+        return False
+    journal = journal_entries(xml_file)
+    first = next(journal, None)
+    if first is None and not os.path.exists(xml_file):
+        return False
+    outputs = [open(f + ".tmp", "w", encoding="utf-8") for f in files]
+    
+    def write(producto: ET.Element):
+        out = outputs[shard_for(producto.get("id"), num_shards)]
+        out.write("  " + ET.tostring(producto, encoding="unicode").strip() + "\n")
+    
+    try:
+        for out in outputs:
+            out.write("<?xml version='1.0' encoding='UTF-8'?>\n<productos>\n")
+        seen = set()
+        if os.path.exists(xml_file):
+            for _, producto in ET.iterparse(xml_file):
+                if producto.tag != "producto":
+                    continue
+                seen.add(producto.get("id"))
+                write(producto)
+                producto.clear()
+        for product_id, nombre, precio in itertools.chain([first] if first else [], journal):
+            if product_id not in seen:
+                seen.add(product_id)
+                write(ET.Element("producto", {"id": product_id, "nombre": nombre,
+                                              "precio": precio}))
+        for out in outputs:
+            out.write("</productos>\n")
+    finally:
+        for out in outputs:
+            out.close()
+    for path in files:
+        os.replace(path + ".tmp", path)
+    retire_original(xml_file)
+    return True
+
+
+class _BatchSender:
+    """Thread que envía por un Pipe todos los mensajes pendientes en un solo lote"""
+    
+    def __init__(self, connection, name: str):
+        self._connection = connection
+        self._outgoing: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def send(self, message: Any):
+        self._outgoing.put(message)
+    
+    def stop(self):
+        self._outgoing.put(None)
+        self._thread.join()
+    
+    def _run(self):
+        while True:
+            batch = [self._outgoing.get()]
+            while True:
+                try:
+                    batch.append(self._outgoing.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            batch = [message for message in batch if message is not None]
+            if batch:
+                try:
+                    self._connection.send(batch)
+                except (OSError, EOFError, ValueError):
+                    return
+            if stopping:
+                return
+
+
+def _shard_main(connection, shard: int, xml_file: str, options: Dict, verbose: bool):
+    """
+    Proceso de una partición: ejecuta sobre su ProductManager las
+    operaciones que llegan del front-end y devuelve los resultados
+    """
+    import servidor  # Diferido: servidor importa este módulo
+    
+    servidor.VERBOSE = verbose
+    try:
+        manager = servidor.ProductManager(xml_file, **options)
+    except Exception as e:
+        connection.send([(None, False, f"Partición {shard}: {e}")])
+        return
+    connection.send([(None, True, len(manager.index))])
+    
+    sender = _BatchSender(connection, f"shard{shard}-sender")
+    executor = ThreadPoolExecutor(max_workers=SHARD_WORKERS,
+                                  thread_name_prefix=f"shard{shard}")
+    
+    def execute(call_id: int, method: str, args: tuple):
+        try:
+            # "metrics.export" y similares: métodos de atributos del ProductManager
+            function = functools.reduce(getattr, method.split("."), manager)
+            sender.send((call_id, True, function(*args)))
+        except ServerBusy as e:
+            sender.send((call_id, False, e))  # Se responde `busy` en el front-end
+        except Exception as e:
+            sender.send((call_id, False, str(e)))
+    
+    try:
+        while True:
+            try:
+                batch = connection.recv()
+            except (EOFError, OSError):
+                break
+            if batch is None:
+                break
+            for call_id, method, args in batch:
+                if method.startswith("query"):
+                    execute(call_id, method, args)  # Rápidas: sin cambio de thread
+                else:
+                    executor.submit(execute, call_id, method, args)
+    finally:
+        executor.shutdown(wait=True)
+        manager.close()
+        sender.stop()
+
+
+class _ShardProcess:
+    """Lado del front-end de una partición: proceso hijo, Pipe y llamadas en curso"""
+    
+    def __init__(self, context, shard: int, xml_file: str, options: Dict, verbose: bool):
+        self.shard = shard
+        self._connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_shard_main, name=f"shard{shard}",
+            args=(child_connection, shard, xml_file, options, verbose), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._closed = False
+        self.loaded = 0  # Productos cargados por la partición
+        self._started = threading.Event()
+        self._start_error: Optional[str] = None
+        self._sender = _BatchSender(self._connection, f"shard{shard}-client")
+        self._reader = threading.Thread(target=self._read_loop, name=f"shard{shard}-reader",
+                                        daemon=True)
+        self._reader.start()
+    
+    def wait_started(self, timeout: float):
+        """Espera a que la partición haya cargado su catálogo"""
+        if not self._started.wait(timeout):
+            raise RuntimeError(f"La partición {self.shard} no arrancó en {timeout}s")
+        if self._start_error is not None:
+            raise RuntimeError(self._start_error)
+    
+    def call(self, method: str, *args) -> Future:
+        """Envía una operación a la partición; el resultado llega en el Future"""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                future.set_exception(ConnectionError(f"Partición {self.shard} cerrada"))
+                return future
+            call_id = self._next_id
+            self._next_id += 1
+            self._pending[call_id] = future
+        self._sender.send((call_id, method, args))
+        return future
+    
+    def _read_loop(self):
+        try:
+            while True:
+                for call_id, ok, result in self._connection.recv():
+                    if call_id is None:
+                        if ok:
+                            self.loaded = result
+                        else:
+                            self._start_error = result
+                        self._started.set()
+                        continue
+                    with self._lock:
+                        future = self._pending.pop(call_id, None)
+                    if future is None:
+                        continue
+                    if ok:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(result if isinstance(result, ServerBusy)
+                                             else RuntimeError(result))
+        except (EOFError, OSError):
+            pass
+        self._fail(ConnectionError(f"Partición {self.shard} terminó"))
+    
+    def _fail(self, error: Exception):
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+        if not self._started.is_set():
+            # El hijo murió antes de cargar su catálogo: que el arranque falle
+            self._start_error = f"{error} durante el arranque"
+            self._started.set()
+        for future in pending.values():
+            future.set_exception(error)
+    
+    def close(self):
+        """Pide a la partición que termine y espera a que lo haga"""
+        self._sender.stop()  # Vacía lo pendiente antes del aviso de fin
+        try:
+            self._connection.send(None)  # Ver _shard_main: fin de la entrada
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=SHARD_START_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+        self._connection.close()
+
+
+class ShardedProductManager:
+    """
+    Catálogo repartido entre `num_shards` procesos con la interfaz de ProductManager
+    
+    Las operaciones de un producto van a su partición; las de lote se
+    dividen por partición, se ejecutan en paralelo y se recomponen en el
+    orden original.
+    """
+    
+    def __init__(self, xml_file: str, num_shards: int,
+                 metrics: Optional[MetricsRegistry] = None,
+                 verbose: bool = True, **options):
+        """
+        Args:
+            xml_file: XML original; cada partición usa `<base>.shard<i>.xml`
+            num_shards: Número de procesos partición
+            metrics: Registro donde anotar la latencia de cada partición
+            verbose: Trazas por consola en los procesos hijos
+            **options: Argumentos de ProductManager (insertion_delay, ...)
+        """
+        if num_shards < 1:
+            raise ValueError("Se necesita al menos una partición")
+        self.xml_file = xml_file
+        self.num_shards = num_shards
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._latency = [
+            self.metrics.histogram("shard_call_seconds",
+                                   "Ida y vuelta de una operación a su partición",
+                                   shard=shard)
+            for shard in range(num_shards)
+        ]
+        check_shard_count(xml_file, num_shards)
+        split_catalog(xml_file, num_shards)
+        # spawn: los hijos no heredan los threads ni los locks del front-end
+        context = multiprocessing.get_context("spawn")
+        self._shards = [
+            _ShardProcess(context, shard, shard_file(xml_file, shard), options, verbose)
+            for shard in range(num_shards)
+        ]
+        for shard in self._shards:
+            shard.wait_started(SHARD_START_TIMEOUT)
+        self.metrics.add_collector(self._collect_metrics)
+    
+    def _collect_metrics(self):
+        """
+        Copia al registro del front-end las métricas del ProductManager de
+        cada partición (diario, compactación, locks...) con la etiqueta `shard`
+        """
+        futures = [(shard.shard, shard.call("metrics.export")) for shard in self._shards]
+        for shard, future in futures:
+            try:
+                self.metrics.merge(future.result(SHARD_METRICS_TIMEOUT), shard=shard)
+            except Exception:
+                pass  # Una partición caída o lenta no impide consultar las demás
+    
+    @property
+    def loaded(self) -> int:
+        """Productos cargados entre todas las particiones al arrancar"""
+        return sum(shard.loaded for shard in self._shards)
+    
+    def to_global(self, shard: int, offset: int) -> int:
+        """Posición global de la posición `offset` de una partición"""
+        return -1 if offset == -1 else offset * self.num_shards + shard
+    
+    def locate(self, position: int) -> Tuple[int, int]:
+        """Partición y posición local de una posición global"""
+        return position % self.num_shards, position // self.num_shards
+    
+    def _call(self, shard: int, method: str, *args) -> Future:
+        future = self._shards[shard].call(method, *args)
+        start = time.perf_counter()
+        histogram = self._latency[shard]
+        future.add_done_callback(lambda _: histogram.observe(time.perf_counter() - start))
+        return future
+    
+    def insert_product(self, product_id: str, nombre: str, precio: float) -> int:
+        shard = shard_for(product_id, self.num_shards)
+        offset = self._call(shard, "insert_product", product_id, nombre, precio).result()
+        return self.to_global(shard, offset)
+    
+    def query_product(self, product_id: str) -> int:
+        shard = shard_for(product_id, self.num_shards)
+        offset = self._call(shard, "query_product", product_id).result()
+        return self.to_global(shard, offset)
+    
+    def _scatter(self, method: str, items: List, key) -> List[int]:
+        """Reparte un lote por partición, lo ejecuta en paralelo y recompone el orden"""
+        groups: Dict[int, Tuple[List[int], List]] = {}
+        for index, item in enumerate(items):
+            indices, group = groups.setdefault(shard_for(key(item), self.num_shards), ([], []))
+            indices.append(index)
+            group.append(item)
+        futures = {shard: self._call(shard, method, group)
+                   for shard, (_, group) in groups.items()}
+        positions = [-1] * len(items)
+        for shard, future in futures.items():
+            for index, offset in zip(groups[shard][0], future.result()):
+                positions[index] = self.to_global(shard, offset)
+        return positions
+    
+    def insert_products(self, products: List[Tuple[str, str, float]]) -> List[int]:
+        return self._scatter("insert_products", products, lambda product: product[0])
+    
+    def query_products(self, product_ids: List[str]) -> List[int]:
+        return self._scatter("query_products", product_ids, lambda product_id: product_id)
+    
+    def _merge_pages(self, method: str, offset: int, limit: int, *args) -> Tuple[List[int], bool]:
+        """
+        Pide a cada partición sus `offset + limit` primeros pares (clave,
+        posición) y los mezcla en orden de clave y posición global
+        """
+        futures = {shard: self._call(shard, method, *args, 0, offset + limit)
+                   for shard in range(self.num_shards)}
+        pages = []
+        more = False
+        for shard, future in futures.items():
+            items, shard_more = future.result()
+            more = more or shard_more
+            pages.append([(key, self.to_global(shard, local)) for key, local in items])
+        merged = list(heapq.merge(*pages))
+        more = more or len(merged) > offset + limit
+        return [position for _, position in merged[offset:offset + limit]], more
+    
+    def query_price_range(self, low: Optional[float] = None, high: Optional[float] = None,
+                          offset: int = 0,
+                          limit: int = DEFAULT_RANGE_LIMIT) -> Tuple[List[int], bool]:
+        low = float("-inf") if low is None else float(low)
+        high = float("inf") if high is None else float(high)
+        offset, limit = page_bounds(offset, limit)
+        return self._merge_pages("price_range_items", offset, limit, low, high)
+    
+    def query_name_prefix(self, prefix: str, offset: int = 0,
+                          limit: int = DEFAULT_RANGE_LIMIT) -> Tuple[List[int], bool]:
+        if not isinstance(prefix, str):
+            raise ValueError("El prefijo debe ser una cadena")
+        offset, limit = page_bounds(offset, limit)
+        return self._merge_pages("name_prefix_items", offset, limit, prefix)
+    
+    def close(self):
+        """Detiene todas las particiones (cada una cierra su diario)"""
+        for shard in self._shards:
+            shard.close()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Planificador de solicitudes por prioridad sin inanición
+
+Cada nivel de prioridad tiene su propia cola FIFO, de modo que dentro de
+un nivel las solicitudes se atienden siempre por orden de llegada.
+
+Entre niveles:
+
+- Por defecto se atiende primero el nivel de menor número (prioridad
+  estricta), igual que la cola de prioridades original.
+- Con `weights`, los niveles con trabajo pendiente se reparten los turnos
+  en proporción a su peso (reparto justo ponderado): con pesos
+  {1: 4, 2: 1} se atienden cuatro inserciones por cada consulta mientras
+  haya de ambas.
+- Con `max_wait`, una solicitud que lleva esperando al menos `max_wait`
+  segundos pasa por delante de los niveles más prioritarios
+  (envejecimiento); si hay varias vencidas se atiende primero la del nivel
+  menos prioritario, que es la expuesta a inanición. Así la espera de los
+  niveles bajos queda acotada por `max_wait` más lo que tarde en liberarse
+  un worker aunque los niveles prioritarios estén saturados. (Atender la
+  más antigua de todas convertiría la cola en FIFO global al saturarse y
+  la espera volvería a crecer sin límite.)
+
+Con `capacity` cada nivel admite como máximo ese número de solicitudes
+en cola; `put` rechaza las que no caben con `queue.Full` en lugar de
+dejar crecer la cola (y la espera) sin límite.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+
+Entry = Tuple[int, Any, float]  # (prioridad, elemento, instante de encolado)
+
+
+class PriorityScheduler:
+    """
+    Colas FIFO por prioridad con envejecimiento y pesos opcionales
+    
+    No es thread-safe; `SchedulerQueue` y `AsyncSchedulerQueue` lo
+    envuelven para threads y para asyncio.
+    """
+    
+    def __init__(self, priorities: Iterable[int], max_wait: Optional[float] = None,
+                 weights: Optional[Dict[int, float]] = None,
+                 capacity: Optional[Dict[int, int]] = None):
+        """
+        Args:
+            priorities: Niveles de prioridad (menor número = más prioritario)
+            max_wait: Segundos tras los que una solicitud adelanta a las demás
+                (None desactiva el envejecimiento)
+            weights: Peso de cada nivel para el reparto justo ponderado
+                (None para prioridad estricta)
+            capacity: Máximo de solicitudes en cola por nivel; los niveles
+                que no aparecen (o con 0) no tienen límite
+        """
+        self.priorities = sorted(priorities)
+        self.max_wait = max_wait
+        self.weights = weights
+        if weights is not None:
+            missing = set(self.priorities) - set(weights)
+            if missing or any(weights[p] <= 0 for p in self.priorities):
+                raise ValueError("Se necesita un peso positivo para cada prioridad")
+        self.capacity = {p: n for p, n in (capacity or {}).items() if n > 0}
+        self._queues: Dict[int, Deque[Tuple[float, Any]]] = {p: deque() for p in self.priorities}
+        self._size = 0
+        # Reparto ponderado: cada nivel avanza 1/peso por solicitud atendida
+        self._pass: Dict[int, float] = {p: 0.0 for p in self.priorities}
+        self._virtual_time = 0.0
+        self.aged: Dict[int, int] = {p: 0 for p in self.priorities}  # Atendidas por envejecimiento
+        self.rejected: Dict[int, int] = {p: 0 for p in self.priorities}  # Rechazadas por capacidad
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def depth(self, priority: int) -> int:
+        """Solicitudes en cola en un nivel"""
+        return len(self._queues[priority])
+    
+    def put(self, priority: int, item: Any, enqueued: Optional[float] = None):
+        """
+        Encola un elemento al final de su nivel de prioridad
+        
+        Raises:
+            queue.Full: Si el nivel ya tiene `capacity[priority]` elementos
+        """
+        level = self._queues.get(priority)
+        if level is None:
+            raise ValueError(f"Prioridad desconocida: {priority}")
+        limit = self.capacity.get(priority)
+        if limit is not None and len(level) >= limit:
+            self.rejected[priority] += 1
+            raise queue.Full
+        if not level and self.weights is not None:
+            # Un nivel que vuelve a tener trabajo no acumula turnos atrasados
+            self._pass[priority] = max(self._pass[priority], self._virtual_time)
+        level.append((time.perf_counter() if enqueued is None else enqueued, item))
+        self._size += 1
+    
+    def oldest(self) -> Optional[float]:
+        """Instante de encolado de la solicitud que más lleva esperando (None si no hay)"""
+        return min((level[0][0] for level in self._queues.values() if level), default=None)
+    
+    def get(self, priority: Optional[int] = None) -> Entry:
+        """
+        Desencola el siguiente elemento
+        
+        Args:
+            priority: Desencolar solo de este nivel (None: el que toque)
+        
+        Returns:
+            Tupla (prioridad, elemento, instante de encolado)
+        
+        Raises:
+            IndexError: Si no hay elementos (en el nivel pedido)
+        """
+        if priority is not None:
+            if not self._queues[priority]:
+                raise IndexError(f"Nivel {priority} vacío")
+        elif not self._size:
+            raise IndexError("Planificador vacío")
+        else:
+            priority = self._overdue() if self.max_wait is not None else None
+            if priority is None:
+                priority = self._next_level()
+        enqueued, item = self._queues[priority].popleft()
+        self._size -= 1
+        if self.weights is not None:
+            self._virtual_time = self._pass[priority]
+            self._pass[priority] += 1.0 / self.weights[priority]
+        return priority, item, enqueued
+    
+    def _overdue(self) -> Optional[int]:
+        """Nivel menos prioritario cuya primera solicitud venció `max_wait`, si existe"""
+        deadline = time.perf_counter() - self.max_wait
+        for priority in reversed(self.priorities):
+            level = self._queues[priority]
+            if level and level[0][0] <= deadline:
+                if priority != self._next_level():
+                    self.aged[priority] += 1
+                return priority
+        return None
+    
+    def _next_level(self) -> int:
+        """Nivel a atender sin envejecimiento"""
+        if self.weights is None:
+            return next(p for p in self.priorities if self._queues[p])
+        return min((p for p in self.priorities if self._queues[p]),
+                   key=lambda p: (self._pass[p], p))
+
+
+class SchedulerQueue:
+    """
+    Envoltorio thread-safe con la interfaz de `queue.Queue`
+    
+    Además de `get()` sobre todos los niveles admite `get(priority=p)`,
+    que solo desencola del nivel `p` (workers reservados a una prioridad).
+    Cada nivel tiene su propia condición para no despertar a quien no
+    puede atender la solicitud encolada.
+    """
+    
+    def __init__(self, scheduler: PriorityScheduler):
+        self.scheduler = scheduler
+        lock = threading.Lock()
+        self._cond = threading.Condition(lock)
+        self._level_conds = {p: threading.Condition(lock) for p in scheduler.priorities}
+        self.closed = False
+    
+    def put(self, priority: int, item: Any):
+        """Encola un elemento; lanza `queue.Full` si su nivel está lleno"""
+        with self._cond:
+            self.scheduler.put(priority, item)
+            self._cond.notify()
+            self._level_conds[priority].notify()
+    
+    def get(self, timeout: Optional[float] = None, priority: Optional[int] = None) -> Entry:
+        """
+        Espera y desencola el siguiente elemento
+        
+        Args:
+            timeout: Segundos máximos de espera (None: sin límite)
+            priority: Desencolar solo de este nivel (None: de cualquiera)
+        
+        Raises:
+            queue.Empty: Si no llega ninguno antes de `timeout` o se cerró la cola
+        """
+        if priority is None:
+            cond, pending = self._cond, self.scheduler.__len__
+        else:
+            cond, pending = self._level_conds[priority], lambda: self.scheduler.depth(priority)
+        with cond:
+            if not cond.wait_for(lambda: pending() or self.closed, timeout) or not pending():
+                raise queue.Empty
+            return self.scheduler.get(priority)
+    
+    def get_nowait(self) -> Entry:
+        with self._cond:
+            if not len(self.scheduler):
+                raise queue.Empty
+            return self.scheduler.get()
+    
+    def load(self) -> Tuple[int, float]:
+        """Solicitudes en cola y segundos que lleva esperando la más antigua"""
+        with self._cond:
+            oldest = self.scheduler.oldest()
+            return len(self.scheduler), 0.0 if oldest is None else time.perf_counter() - oldest
+    
+    def close(self):
+        """Despierta a todos los que esperan en `get`, que lanzan `queue.Empty`"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+            for cond in self._level_conds.values():
+                cond.notify_all()
+    
+    def qsize(self) -> int:
+        return len(self.scheduler)
+    
+    def empty(self) -> bool:
+        return not len(self.scheduler)
+
+
+class AsyncSchedulerQueue:
+    """Envoltorio para asyncio; debe usarse desde el bucle de eventos"""
+    
+    def __init__(self, scheduler: PriorityScheduler):
+        self.scheduler = scheduler
+        self._available = asyncio.Semaphore(0)  # Un permiso por elemento encolado
+    
+    def put_nowait(self, priority: int, item: Any):
+        """Encola un elemento; lanza `queue.Full` si su nivel está lleno"""
+        self.scheduler.put(priority, item)
+        self._available.release()
+    
+    async def get(self) -> Entry:
+        await self._available.acquire()
+        return self.scheduler.get()
+    
+    def qsize(self) -> int:
+        return len(self.scheduler)
+    
+    def empty(self) -> bool:
+        return not len(self.scheduler)
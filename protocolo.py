@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Protocolo de mensajes enmarcados compartido por cliente y servidor
+
+Cada mensaje va precedido de una cabecera de 8 bytes (big-endian):
+
+    +----------------------+----------------------+----------------
+    | longitud (uint32)    | id solicitud (uint32)| cuerpo (JSON)
+    +----------------------+----------------------+----------------
+
+Sobre una misma conexión el cliente puede enviar muchas solicitudes sin
+esperar respuesta (pipelining); el servidor responde con el mismo id, por
+lo que las respuestas pueden llegar en cualquier orden.
+
+El formato anterior (un documento JSON por conexión) sigue aceptándose:
+como la longitud nunca supera MAX_FRAME_SIZE, el primer byte de un
+mensaje enmarcado es siempre menor que el de un documento JSON ('{').
+
+El cuerpo se codifica en JSON por defecto. Al abrir la conexión el
+cliente puede enviar una solicitud `hello` con los códecs que admite, en
+orden de preferencia; el servidor responde con el elegido y ambos lo usan
+para el resto de mensajes de esa conexión:
+
+    -> {"operation": "hello", "params": {"codecs": ["binario", "json"]}}
+    <- {"status": "success", "codec": "binario", "storage": "append_only"}
+
+`storage` anuncia el modo de almacenamiento del catálogo: con
+`append_only` la posición de un producto no cambia nunca una vez
+asignada, y el cliente puede guardarla en caché.
+"""
+
+import asyncio
+import json
+import socket
+import struct
+import sys
+from typing import Dict, Iterable, Optional, Tuple
+
+FRAME_HEADER = struct.Struct("!II")  # Longitud del cuerpo, id de solicitud
+MAX_FRAME_SIZE = 64 * 1024 * 1024  # Tamaño máximo del cuerpo de un mensaje
+MAX_REQUEST_ID = 0xFFFFFFFF
+APPEND_ONLY = "append_only"  # Modo de almacenamiento con posiciones inmutables
+PRIORITY_INSERT = 1  # Mayor prioridad (menor número)
+PRIORITY_QUERY = 2   # Menor prioridad (mayor número)
+INSERT_OPERATIONS = {"insert", "insert_many"}  # Operaciones con prioridad de inserción
+
+
+def encode_frame(request_id: int, payload: bytes) -> bytes:
+    """Construye un mensaje enmarcado"""
+    return FRAME_HEADER.pack(len(payload), request_id) + payload
+
+
+def is_legacy(first_byte: bytes) -> bool:
+    """Indica si el primer byte de una conexión corresponde al formato JSON anterior"""
+    return first_byte[0] > (MAX_FRAME_SIZE >> 24)
+
+
+def _check_length(length: int):
+    """Rechaza mensajes que superan el tamaño máximo"""
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Mensaje de {length} bytes supera el máximo de {MAX_FRAME_SIZE}")
+
+
+def set_send_timeout(sock: socket.socket, timeout: float):
+    """
+    Limita cuánto puede bloquear un envío en un socket bloqueante
+    
+    A diferencia de `settimeout`, no afecta a las lecturas: un `sendall`
+    que no progresa en `timeout` segundos falla con `OSError`.
+    """
+    if sys.platform == "win32":
+        value = struct.pack("L", int(timeout * 1000))  # DWORD en milisegundos
+    else:
+        seconds = int(timeout)
+        value = struct.pack("ll", seconds, int((timeout - seconds) * 1e6))  # struct timeval
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, value)
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    """
+    Lee exactamente `size` bytes del socket
+    
+    Returns:
+        Los bytes leídos, o b"" si la conexión se cerró antes del primer byte
+    
+    Raises:
+        ConnectionError: Si la conexión se cierra a mitad de un mensaje
+    """
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1 << 20))
+        if not chunk:
+            if remaining == size:
+                return b""
+            raise ConnectionError("Conexión cerrada a mitad de un mensaje")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(sock: socket.socket) -> Optional[Tuple[int, bytes]]:
+    """
+    Lee un mensaje enmarcado de un socket bloqueante
+    
+    Returns:
+        Tupla (id de solicitud, cuerpo) o None si la conexión se cerró
+    """
+    header = recv_exact(sock, FRAME_HEADER.size)
+    if not header:
+        return None
+    length, request_id = FRAME_HEADER.unpack(header)
+    _check_length(length)
+    payload = recv_exact(sock, length) if length else b""
+    if length and not payload:
+        raise ConnectionError("Conexión cerrada a mitad de un mensaje")
+    return request_id, payload
+
+
+async def read_frame_async(reader: asyncio.StreamReader,
+                           prefix: bytes = b"") -> Optional[Tuple[int, bytes]]:
+    """
+    Lee un mensaje enmarcado de un flujo asyncio
+    
+    Args:
+        reader: Flujo de lectura
+        prefix: Bytes de la cabecera ya leídos (p. ej. para detectar el formato)
+    
+    Returns:
+        Tupla (id de solicitud, cuerpo) o None si la conexión se cerró
+    """
+    try:
+        header = prefix + await reader.readexactly(FRAME_HEADER.size - len(prefix))
+    except asyncio.IncompleteReadError as e:
+        if not e.partial and not prefix:
+            return None
+        raise ConnectionError("Conexión cerrada a mitad de un mensaje")
+    length, request_id = FRAME_HEADER.unpack(header)
+    _check_length(length)
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Conexión cerrada a mitad de un mensaje")
+    return request_id, payload
+
+
+class JSONCodec:
+    """Códec por defecto: un documento JSON por mensaje"""
+    
+    name = "json"
+    
+    @staticmethod
+    def encode(message: Dict) -> bytes:
+        return json.dumps(message).encode('utf-8')
+    
+    @staticmethod
+    def decode(data: bytes) -> Dict:
+        return json.loads(data.decode('utf-8'))
+
+
+class BinaryCodec:
+    """
+    Códec binario compacto para los mensajes frecuentes
+    
+    El primer byte indica el tipo de mensaje. Las solicitudes `query` e
+    `insert` y las respuestas con una posición se empaquetan con `struct`;
+    cualquier otro mensaje se envía como JSON tras el byte de tipo:
+    
+        0x00  JSON genérico
+        0x01  query:   client_id, id
+        0x02  insert:  client_id, id, nombre, precio (float64)
+        0x03  posición: int64
+    
+    Las cadenas van precedidas de su longitud en un uint16.
+    """
+    
+    name = "binario"
+    
+    TAG_JSON = 0
+    TAG_QUERY = 1
+    TAG_INSERT = 2
+    TAG_POSITION = 3
+    
+    _STR_LEN = struct.Struct("!H")
+    _PRICE = struct.Struct("!d")
+    _POSITION = struct.Struct("!Bq")
+    _MAX_STR = 0xFFFF
+    
+    @classmethod
+    def _pack_str(cls, value: str) -> bytes:
+        data = value.encode('utf-8')
+        if len(data) > cls._MAX_STR:
+            raise OverflowError
+        return cls._STR_LEN.pack(len(data)) + data
+    
+    @classmethod
+    def _unpack_str(cls, data: bytes, offset: int) -> Tuple[str, int]:
+        (length,) = cls._STR_LEN.unpack_from(data, offset)
+        offset += 2
+        if offset + length > len(data):
+            raise ValueError("Cadena truncada en el mensaje binario")
+        return data[offset:offset + length].decode('utf-8'), offset + length
+    
+    @classmethod
+    def encode(cls, message: Dict) -> bytes:
+        try:
+            packed = cls._encode_packed(message)
+        except (OverflowError, TypeError, AttributeError):
+            packed = None
+        if packed is not None:
+            return packed
+        return bytes((cls.TAG_JSON,)) + JSONCodec.encode(message)
+    
+    @classmethod
+    def _encode_packed(cls, message: Dict) -> Optional[bytes]:
+        """Empaqueta los mensajes frecuentes; None si no tienen forma conocida"""
+        if len(message) == 2 and message.get("status") == "success" \
+                and type(message.get("position")) is int:
+            return cls._POSITION.pack(cls.TAG_POSITION, message["position"])
+        
+        if len(message) != 3 or type(message.get("client_id")) is not str:
+            return None
+        operation = message.get("operation")
+        params = message.get("params")
+        if operation == "query" and len(params) == 1 and type(params.get("id")) is str:
+            return bytes((cls.TAG_QUERY,)) + cls._pack_str(message["client_id"]) + \
+                cls._pack_str(params["id"])
+        if operation == "insert" and len(params) == 3 and type(params.get("id")) is str \
+                and type(params.get("nombre")) is str and type(params.get("precio")) is float:
+            return bytes((cls.TAG_INSERT,)) + cls._pack_str(message["client_id"]) + \
+                cls._pack_str(params["id"]) + cls._pack_str(params["nombre"]) + \
+                cls._PRICE.pack(params["precio"])
+        return None
+    
+    @classmethod
+    def decode(cls, data: bytes) -> Dict:
+        """
+        Raises:
+            ValueError: Si el mensaje está truncado o mal formado (como
+                JSONCodec), para que se responda con un error de protocolo
+        """
+        try:
+            return cls._decode_packed(data)
+        except (struct.error, IndexError) as e:
+            raise ValueError(f"Mensaje binario truncado o inválido: {e}") from e
+    
+    @classmethod
+    def _decode_packed(cls, data: bytes) -> Dict:
+        tag = data[0]
+        if tag == cls.TAG_POSITION:
+            return {"status": "success", "position": cls._POSITION.unpack(data)[1]}
+        if tag == cls.TAG_QUERY:
+            client_id, offset = cls._unpack_str(data, 1)
+            product_id, _ = cls._unpack_str(data, offset)
+            return {"operation": "query", "params": {"id": product_id}, "client_id": client_id}
+        if tag == cls.TAG_INSERT:
+            client_id, offset = cls._unpack_str(data, 1)
+            product_id, offset = cls._unpack_str(data, offset)
+            nombre, offset = cls._unpack_str(data, offset)
+            (precio,) = cls._PRICE.unpack_from(data, offset)
+            return {"operation": "insert",
+                    "params": {"id": product_id, "nombre": nombre, "precio": precio},
+                    "client_id": client_id}
+        if tag == cls.TAG_JSON:
+            return JSONCodec.decode(data[1:])
+        raise ValueError(f"Tipo de mensaje binario desconocido: {tag}")
+
+
+CODECS = {codec.name: codec for codec in (JSONCodec, BinaryCodec)}
+DEFAULT_CODEC = JSONCodec
+
+
+def choose_codec(offered: Iterable[str]):
+    """Elige el primer códec ofrecido por el cliente que el servidor conoce"""
+    for name in offered:
+        if name in CODECS:
+            return CODECS[name]
+    return DEFAULT_CODEC
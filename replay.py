@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Reproduce contra un servidor el tráfico capturado con `servidor.py --captura`
+
+Cada solicitud capturada se reenvía con su operación, sus parámetros y su
+`client_id` originales (así los límites por cliente se aplican igual).
+Dos modos:
+
+- con tiempos (`--velocidad N`, 1 por defecto): cada solicitud sale en su
+  instante original dividido por N, respondan o no las anteriores, de
+  modo que se conservan los intervalos entre llegadas y la concurrencia
+  que estos producen; la latencia se mide desde el instante programado
+- lo más rápido posible (`--velocidad 0`): bucle cerrado en el orden de
+  la captura con `--concurrencia` solicitudes en curso; por defecto, la
+  concurrencia media original estimada con la ley de Little (suma de las
+  latencias capturadas entre la duración de la captura)
+
+Los resultados tienen el formato de `benchmark.py`, así que se comparan
+con `--comparar`. Con `--servidores` la misma captura se reproduce
+contra cada servidor (p. ej. dos versiones) y se comparan al final.
+
+Uso:
+    python3 servidor.py --captura captura.jsonl
+    python3 replay.py captura.jsonl --velocidad 2 --salida base.json
+    python3 replay.py captura.jsonl --servidores localhost:8888 localhost:8889
+    python3 replay.py --comparar base.json nuevo.json
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+from benchmark import Recorder, compare, compare_results, percentile, print_report
+from cliente import HOST, PORT, REQUEST_TIMEOUT, ConnectionPool, build_request
+from replicacion import parse_address
+
+MAX_CONNECTIONS = 8  # Conexiones del pool con el que se reproduce
+
+
+def load_capture(path: str) -> List[Dict]:
+    """Solicitudes de una captura ordenadas por instante de llegada"""
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and entry.get("operation") and "ts" in entry:
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
+
+
+def capture_summary(entries: List[Dict]) -> Dict:
+    """Duración, tasa, latencias y concurrencia media del tráfico original"""
+    start = entries[0]["ts"]
+    end = max(entry["ts"] + entry.get("latency_ms", 0.0) / 1e3 for entry in entries)
+    duration = max(end - start, 1e-9)
+    latencies = sorted(entry.get("latency_ms", 0.0) for entry in entries)
+    return {
+        "requests": len(entries),
+        "duration_s": duration,
+        "rate_rps": len(entries) / duration,
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+        "concurrency": sum(latencies) / 1e3 / duration,  # Ley de Little
+    }
+
+
+def _request(entry: Dict) -> Dict:
+    return build_request(entry["operation"], entry.get("params", {}), entry.get("client_id"))
+
+
+def replay_timed(pool: ConnectionPool, entries: List[Dict], speed: float,
+                 timeout: float = REQUEST_TIMEOUT) -> Dict:
+    """Reproduce la captura respetando los intervalos entre llegadas divididos por `speed`"""
+    recorder = Recorder()
+    outstanding = threading.Semaphore(0)
+    first = entries[0]["ts"]
+    start = time.perf_counter()
+    
+    for entry in entries:
+        scheduled = start + (entry["ts"] - first) / speed
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        
+        def on_done(future, operation=entry["operation"], scheduled=scheduled):
+            try:
+                response = future.result()
+            except Exception:
+                response = None
+            recorder.record(operation, time.perf_counter() - scheduled, response)
+            outstanding.release()
+        
+        pool.submit(_request(entry), timeout).add_done_callback(on_done)
+    
+    for _ in entries:
+        outstanding.acquire(timeout=timeout)
+    return recorder.report(time.perf_counter() - start)
+
+
+def replay_fast(pool: ConnectionPool, entries: List[Dict], concurrency: int,
+                timeout: float = REQUEST_TIMEOUT) -> Dict:
+    """Reproduce la captura sin pausas con `concurrency` solicitudes en curso"""
+    recorder = Recorder()
+    pending = iter(entries)
+    lock = threading.Lock()
+    
+    def worker():
+        while True:
+            with lock:
+                entry = next(pending, None)
+            if entry is None:
+                return
+            start = time.perf_counter()
+            try:
+                response = pool.submit(_request(entry), timeout).result(timeout=timeout)
+            except Exception:
+                response = None
+            recorder.record(entry["operation"], time.perf_counter() - start, response)
+    
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.perf_counter() - start)
+
+
+def replay(address: str, entries: List[Dict], speed: float, concurrency: int,
+           connections: int = MAX_CONNECTIONS, codec: str = "json") -> Dict:
+    """Reproduce la captura contra el servidor `host:puerto`"""
+    host, port = parse_address(address)
+    pool = ConnectionPool(host, port, connections, codec=codec)
+    try:
+        if speed > 0:
+            return replay_timed(pool, entries, speed)
+        return replay_fast(pool, entries, concurrency)
+    finally:
+        pool.close()
+
+
+def main():
+    """Función principal de la reproducción"""
+    parser = argparse.ArgumentParser(description="Reproduce una captura de tráfico")
+    parser.add_argument("captura", nargs="?", help="Archivo JSONL de `servidor.py --captura`")
+    parser.add_argument("--servidores", nargs="+", default=[f"{HOST}:{PORT}"],
+                        metavar="HOST:PUERTO",
+                        help="Servidores contra los que se reproduce (se comparan entre sí)")
+    parser.add_argument("--velocidad", type=float, default=1.0,
+                        help="Factor de velocidad (2 = el doble de rápido; 0 = sin pausas)")
+    parser.add_argument("--concurrencia", type=int, default=None,
+                        help="Solicitudes en curso con --velocidad 0 (por defecto, la original)")
+    parser.add_argument("--conexiones", type=int, default=MAX_CONNECTIONS,
+                        help="Conexiones del pool")
+    parser.add_argument("--codec", default="json", help="Códec preferido (json o binario)")
+    parser.add_argument("--etiqueta", default="", help="Etiqueta libre guardada con los resultados")
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados "
+                                         "(con varios servidores, uno por servidor: NOMBRE.0.json, ...)")
+    parser.add_argument("--comparar", nargs=2, metavar=("BASE", "NUEVO"),
+                        help="Comparar dos archivos de resultados y salir")
+    args = parser.parse_args()
+    
+    if args.comparar:
+        compare(*args.comparar)
+        return
+    if not args.captura:
+        parser.error("Indique el archivo de captura")
+    if args.velocidad < 0:
+        parser.error("--velocidad no puede ser negativa")
+    
+    entries = load_capture(args.captura)
+    if not entries:
+        print(f"[REPLAY] La captura {args.captura} no tiene solicitudes")
+        return
+    original = capture_summary(entries)
+    concurrency = args.concurrencia or max(1, round(original["concurrency"]))
+    print(f"[REPLAY] {original['requests']} solicitudes en {original['duration_s']:.2f}s "
+          f"({original['rate_rps']:.0f} sol/s, p50 {original['p50_ms']:.2f} ms, "
+          f"p99 {original['p99_ms']:.2f} ms, concurrencia media {original['concurrency']:.1f})")
+    mode = (f"velocidad x{args.velocidad:g}" if args.velocidad > 0
+            else f"sin pausas, {concurrency} en curso")
+    
+    outputs = []
+    for i, address in enumerate(args.servidores):
+        print(f"\n[REPLAY] Reproduciendo contra {address} ({mode})...")
+        results = replay(address, entries, args.velocidad, concurrency,
+                         args.conexiones, args.codec)
+        output = {
+            "label": args.etiqueta or address,
+            "timestamp": time.time(),
+            "config": {"captura": args.captura, "servidor": address,
+                       "velocidad": args.velocidad, "concurrencia": concurrency,
+                       "original": original},
+            "results": results,
+        }
+        print_report(output)
+        outputs.append(output)
+        if args.salida:
+            path = args.salida
+            if len(args.servidores) > 1:
+                root, extension = os.path.splitext(args.salida)
+                path = f"{root}.{i}{extension}"
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(output, f, indent=2)
+            print(f"\n[REPLAY] Resultados guardados en {path}")
+    
+    if len(outputs) > 1:
+        for output in outputs[1:]:
+            print(f"\n[REPLAY] {outputs[0]['label']} -> {output['label']}")
+            compare_results(outputs[0]["results"], output["results"])
+
+
+if __name__ == "__main__":
+    main()
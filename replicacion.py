@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Réplicas de lectura alimentadas por el registro de inserciones del primario
+
+Las posiciones del catálogo son de solo-anexado, así que la posición de
+cada producto sirve de número de secuencia del registro: una réplica con
+N productos tiene aplicadas exactamente las N primeras inserciones del
+primario.
+
+- La réplica abre una conexión enmarcada con el primario y envía
+  `{"operation": "replicate", "params": {"from": N, "last_id": ...}}`.
+  `last_id` es el ID de su último producto y permite detectar una réplica
+  que diverge del primario.
+- El primario responde con una secuencia de mensajes con el mismo id de
+  solicitud (`ReplicationStream`): cada uno lleva las entradas desde
+  `from` y el tamaño del primario (`size`); sin inserciones nuevas envía
+  un latido cada `HEARTBEAT_INTERVAL` segundos.
+- La réplica (`ReplicaFollower`) aplica las entradas en su propio
+  ProductManager, con su diario, y se reconecta sola si pierde la conexión.
+
+El retraso de una réplica se mide en entradas (`size` del primario menos
+las aplicadas) y en segundos desde la última vez que estuvo al día.
+
+Lectura de las propias escrituras: una consulta con
+`params.min_position = P` espera en la réplica (hasta
+`REPLICA_WAIT_TIMEOUT` segundos) a que haya aplicado la posición P. La
+espera no ocupa un worker: la consulta se aparca en `ParkedReads` y el
+thread de replicación la devuelve a la cola al aplicar esa posición.
+`ReplicaSetClient` la usa automáticamente con la última posición
+insertada por el cliente.
+"""
+
+import heapq
+import itertools
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from cliente import RPCClient, chain
+from metricas import MetricsRegistry
+from protocolo import JSONCodec, encode_frame, read_frame
+
+REPLICATION_BATCH = 1000  # Entradas por mensaje de replicación
+HEARTBEAT_INTERVAL = 1.0  # Segundos sin inserciones entre latidos
+RECONNECT_DELAY = 1.0  # Segundos antes de reconectar con el primario
+REPLICA_WAIT_TIMEOUT = 5.0  # Espera máxima de una lectura con `min_position`
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """Convierte "host:puerto" en (host, puerto)"""
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+class ReplicationStream:
+    """
+    Envía a una réplica las entradas del catálogo desde una posición
+    
+    Corre en su propio thread: primero pone al día a la réplica en lotes
+    de `REPLICATION_BATCH` y después le envía cada grupo de inserciones
+    en cuanto se publica.
+    """
+    
+    def __init__(self, manager, start: int, push: Callable[[Dict], bool],
+                 finish: Callable[[], None], address=None,
+                 log: Callable[[str], None] = print):
+        """
+        Args:
+            manager: ProductManager del primario
+            start: Primera posición que falta en la réplica
+            push: Envía un mensaje a la réplica; False si la conexión se cerró
+            finish: Envía la respuesta final de la solicitud
+            address: Dirección de la réplica (para el estado)
+            log: Función para las trazas
+        """
+        self.manager = manager
+        self.sent = start  # Entradas enviadas a la réplica
+        self.address = address
+        self._log = log
+        self._push = push
+        self._finish = finish
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stopped.set()
+    
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+    
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                entries = self.manager.entries_since(self.sent, REPLICATION_BATCH)
+                if not entries and self.manager.wait_for_size(self.sent + 1, HEARTBEAT_INTERVAL):
+                    continue
+                message = {"status": "success", "from": self.sent, "entries": entries,
+                           "size": self.manager.size}
+                if not self._push(message):
+                    break
+                self.sent += len(entries)
+        except Exception as e:
+            self._log(f"[REPLICA] Error enviando a la réplica {self.address}: {e}")
+        finally:
+            self._finish()
+
+
+class ParkedReads:
+    """
+    Lecturas que esperan a que la réplica alcance un tamaño, sin ocupar un worker
+    
+    `park` guarda dos funciones: `ready`, a la que llama `notify` desde el
+    thread de replicación cuando el catálogo alcanza el tamaño pedido, y
+    `expired`, a la que llama un único thread de vencimiento si pasan
+    `timeout` segundos antes. Solo se llama a una de las dos.
+    """
+    
+    def __init__(self, size: Callable[[], int], timeout: float = REPLICA_WAIT_TIMEOUT):
+        """
+        Args:
+            size: Devuelve el tamaño actual del catálogo de la réplica
+            timeout: Segundos que puede esperar una lectura aparcada
+        """
+        self._size = size
+        self.timeout = timeout
+        self._cond = threading.Condition(threading.Lock())
+        self._parked: Dict[int, Tuple[Callable[[], None], Callable[[], None]]] = {}
+        self._by_size: List[Tuple[int, int]] = []  # Montículo (tamaño, secuencia)
+        self._deadlines: Deque[Tuple[float, int]] = deque()  # En orden de llegada
+        self._seq = itertools.count()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._expire, daemon=True)
+    
+    def __len__(self) -> int:
+        return len(self._parked)
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+    
+    def park(self, size: int, ready: Callable[[], None],
+             expired: Callable[[], None]) -> bool:
+        """
+        Aparca una lectura hasta que el catálogo tenga `size` productos
+        
+        Returns:
+            False si ya los tiene: no se aparca y el llamador sigue
+        """
+        with self._cond:
+            # Con el cerrojo tomado: un `notify` posterior ya la verá
+            if self._size() >= size:
+                return False
+            seq = next(self._seq)
+            self._parked[seq] = (ready, expired)
+            heapq.heappush(self._by_size, (size, seq))
+            self._deadlines.append((time.monotonic() + self.timeout, seq))
+            self._cond.notify()
+        return True
+    
+    def notify(self, size: int):
+        """Reanuda las lecturas que esperaban un tamaño <= `size`"""
+        ready = []
+        with self._cond:
+            while self._by_size and self._by_size[0][0] <= size:
+                _, seq = heapq.heappop(self._by_size)
+                callbacks = self._parked.pop(seq, None)
+                if callbacks is not None:
+                    ready.append(callbacks[0])
+        for callback in ready:
+            callback()
+    
+    def _expire(self):
+        """Vence las lecturas que superan `timeout`; el plazo es fijo, así que llegan en orden"""
+        while True:
+            with self._cond:
+                callbacks = None
+                while callbacks is None:
+                    if self._stopped:
+                        return
+                    if not self._deadlines:
+                        self._cond.wait()
+                        continue
+                    deadline, seq = self._deadlines[0]
+                    if seq not in self._parked:  # Ya reanudada
+                        self._deadlines.popleft()
+                        continue
+                    delay = deadline - time.monotonic()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    self._deadlines.popleft()
+                    callbacks = self._parked.pop(seq)
+                if len(self._by_size) > 2 * len(self._parked) + 64:
+                    # Descartar del montículo las vencidas cuyo tamaño no llega
+                    self._by_size = [item for item in self._by_size if item[1] in self._parked]
+                    heapq.heapify(self._by_size)
+            callbacks[1]()
+
+
+class ReplicaFollower:
+    """Mantiene un ProductManager al día con el registro de un primario"""
+    
+    def __init__(self, manager, primary: str, metrics: Optional[MetricsRegistry] = None,
+                 log: Callable[[str], None] = print):
+        """
+        Args:
+            manager: ProductManager local de la réplica
+            primary: Dirección del primario como "host:puerto"
+            metrics: Registro donde publicar el retraso
+            log: Función para las trazas
+        """
+        self.manager = manager
+        self.primary = primary
+        self._log = log
+        self.primary_size = manager.size  # Último tamaño conocido del primario
+        self.connected = False
+        self._caught_up_at = time.monotonic()
+        self._stopped = threading.Event()
+        self._socket: Optional[socket.socket] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.parked = ParkedReads(lambda: manager.size)
+        if metrics is not None:
+            metrics.gauge("replication_parked_reads",
+                          "Lecturas con min_position esperando a la replicación",
+                          function=lambda: len(self.parked))
+            metrics.gauge("replication_lag_entries", "Inserciones del primario sin aplicar",
+                          function=lambda: self.lag_entries)
+            metrics.gauge("replication_lag_seconds",
+                          "Segundos desde que la réplica estuvo al día por última vez",
+                          function=lambda: self.lag_seconds)
+    
+    @property
+    def lag_entries(self) -> int:
+        return max(0, self.primary_size - self.manager.size)
+    
+    @property
+    def lag_seconds(self) -> float:
+        if self.connected and not self.lag_entries:
+            return 0.0
+        return time.monotonic() - self._caught_up_at
+    
+    def status(self) -> Dict:
+        return {
+            "primary": self.primary,
+            "connected": self.connected,
+            "applied": self.manager.size,
+            "primary_size": self.primary_size,
+            "lag_entries": self.lag_entries,
+            "lag_seconds": self.lag_seconds,
+        }
+    
+    def start(self):
+        self.parked.start()
+        self._thread.start()
+    
+    def stop(self):
+        self._stopped.set()
+        self.parked.stop()
+        sock = self._socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._thread.join(timeout=RECONNECT_DELAY + HEARTBEAT_INTERVAL)
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._follow()
+            except Exception as e:
+                if not self._stopped.is_set():
+                    self._log(f"[REPLICA] Replicación desde {self.primary} interrumpida: {e}")
+            self.connected = False
+            self._stopped.wait(RECONNECT_DELAY)
+    
+    def _follow(self):
+        """Sigue el registro del primario hasta que se corte la conexión"""
+        host, port = parse_address(self.primary)
+        sock = socket.create_connection((host, port), timeout=RECONNECT_DELAY * 5)
+        self._socket = sock
+        try:
+            sock.settimeout(HEARTBEAT_INTERVAL * 5)  # Sin latidos: primario caído
+            size = self.manager.size
+            request = {"operation": "replicate",
+                       "params": {"from": size, "last_id": self.manager.id_at(size - 1)}}
+            sock.sendall(encode_frame(1, JSONCodec.encode(request)))
+            while not self._stopped.is_set():
+                frame = read_frame(sock)
+                if frame is None:
+                    raise ConnectionError("El primario cerró la conexión")
+                message = JSONCodec.decode(frame[1])
+                if message.get("status") != "success":
+                    raise RuntimeError(message.get("message", "Error desconocido"))
+                if message.get("end"):
+                    raise ConnectionError("El primario terminó la replicación")
+                if not self.connected:
+                    self.connected = True
+                    self._log(f"[REPLICA] Replicando desde {self.primary} a partir de "
+                              f"la posición {message['from']}")
+                if message["entries"]:
+                    self.manager.apply_replicated(message["from"], message["entries"])
+                    self.parked.notify(self.manager.size)
+                self.primary_size = message["size"]
+                if self.manager.size >= self.primary_size:
+                    self._caught_up_at = time.monotonic()
+        finally:
+            self._socket = None
+            sock.close()
+
+
+class ReplicaSetClient:
+    """
+    Cliente para un primario y sus réplicas
+    
+    Las inserciones van al primario y las consultas se reparten entre las
+    réplicas por turnos. Con `read_your_writes` cada consulta lleva la
+    última posición insertada por este cliente, de modo que la réplica
+    espera a haberla aplicado antes de responder.
+    """
+    
+    def __init__(self, primary: str, replicas: List[str], client_id: str,
+                 read_your_writes: bool = True, **client_options):
+        self.client_id = client_id
+        self.read_your_writes = read_your_writes
+        self.primary = RPCClient(*parse_address(primary), client_id, **client_options)
+        self.replicas = [RPCClient(*parse_address(replica), client_id, **client_options)
+                         for replica in replicas] or [self.primary]
+        self._turn = itertools.cycle(self.replicas)
+        self._lock = threading.Lock()
+        self.last_position = -1  # Última posición insertada por este cliente
+    
+    def _note(self, position: int) -> int:
+        with self._lock:
+            self.last_position = max(self.last_position, position)
+        return position
+    
+    def _next_replica(self) -> RPCClient:
+        with self._lock:
+            return next(self._turn)
+    
+    def _min_position(self) -> Optional[int]:
+        if self.read_your_writes and self.last_position >= 0:
+            return self.last_position
+        return None
+    
+    def insert_async(self, product_id: str, nombre: str, precio: float) -> Future:
+        return chain(self.primary.insert_async(product_id, nombre, precio), self._note)
+    
+    def query_async(self, product_id: str) -> Future:
+        return self._next_replica().query_async(product_id, min_position=self._min_position())
+    
+    def insert_product(self, product_id: str, nombre: str, precio: float) -> int:
+        return self.insert_async(product_id, nombre, precio).result(timeout=self.primary.timeout)
+    
+    def query_product(self, product_id: str) -> int:
+        return self.query_async(product_id).result(timeout=self.primary.timeout)
+    
+    def insert_many(self, products: List[Tuple[str, str, float]]) -> List[int]:
+        positions = self.primary.insert_many(products)
+        self._note(max(positions, default=-1))
+        return positions
+    
+    def query_many(self, product_ids: List[str]) -> List[int]:
+        return self._next_replica().query_many(product_ids, min_position=self._min_position())
+    
+    def replication_status(self) -> List[Dict]:
+        """Estado de replicación del primario y de cada réplica"""
+        clients = [self.primary] + [r for r in self.replicas if r is not self.primary]
+        futures = [client.call_async("replication_status", {}) for client in clients]
+        return [future.result(timeout=self.primary.timeout) for future in futures]
+    
+    def close(self):
+        self.primary.close()
+        for replica in self.replicas:
+            if replica is not self.primary:
+                replica.close()
@@ -7,31 +7,336 @@ sobre productos almacenados en un archivo XML. Las operaciones de
 inserción tienen mayor prioridad que las de consulta.
 """
 
+import argparse
+import asyncio
+import functools
 import socket
 import threading
 import xml.etree.ElementTree as ET
 import json
+import math
 import time
 import queue
-from typing import Dict, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Dict, List, Tuple, Optional
 import os
 
+import trazas
+from admision import (ClientRateLimiter, ServerBusy, busy_response, clamp_retry_after,
+                      deadline_response, parse_rate)
+from autoescalado import SCALE_UP_DEPTH, SCALE_UP_WAIT, WorkerPool, parse_reserved
+from indices_secundarios import (DEFAULT_RANGE_LIMIT, SortedIndex, name_key, page_bounds,
+                                  price_key)
+from indice import (RecordStore, SidecarIndex, file_stamp, load_sidecar, scan_catalog,
+                    sidecar_file, write_sidecar)
+from metricas import SIZE_BUCKETS, Counter, Histogram, MetricsRegistry, start_metrics_server
+from particiones import ShardedProductManager, check_shard_count
+from planificador import AsyncSchedulerQueue, PriorityScheduler, SchedulerQueue
+from replicacion import REPLICA_WAIT_TIMEOUT, ReplicaFollower, ReplicationStream
+from protocolo import (APPEND_ONLY, DEFAULT_CODEC, FRAME_HEADER, INSERT_OPERATIONS,
+                       PRIORITY_INSERT, PRIORITY_QUERY, JSONCodec, choose_codec,
+                       encode_frame, is_legacy, read_frame, read_frame_async,
+                       set_send_timeout)
+
 # Constantes
 XML_FILE = "productos.xml"
 HOST = "localhost"
 PORT = 8888
 INSERTION_DELAY = 3  # Segundos de espera para simular carga en inserciones
-PRIORITY_INSERT = 1  # Mayor prioridad (menor número)
-PRIORITY_QUERY = 2   # Menor prioridad (mayor número)
+MIN_POSITION_OPERATIONS = {"query", "query_many", "query_price_range",
+                           "query_name_prefix"}  # Consultas que admiten `min_position`
+KNOWN_OPERATIONS = INSERT_OPERATIONS | {"query", "query_many", "hello", "stats", "ping",
+                                        "replicate", "replication_status",
+                                        "query_price_range", "query_name_prefix"}
+MAX_QUEUE_WAIT = 1.0  # Segundos tras los que una solicitud adelanta a las más prioritarias
+QUEUE_CAPACITY = 5000  # Solicitudes en cola por prioridad antes de rechazar con `busy`
+ASYNC_BACKLOG = 1024  # Cola de conexiones pendientes en modo asyncio
+SEND_TIMEOUT = 10.0  # Segundos sin poder enviar a un cliente antes de cerrar su conexión
+MAX_IN_FLIGHT = 1024  # Solicitudes sin responder por conexión antes de dejar de leer
+JOURNAL_SUFFIX = ".journal"  # Diario de inserciones junto al XML
+COMPACTING_SUFFIX = ".compactando"  # Diario congelado durante una compactación
+COMPACTION_INTERVAL = 30  # Segundos entre compactaciones programadas
+COMPACTION_THRESHOLD = 1024 * 1024  # Bytes de diario que disparan una compactación
+GROUP_COMMIT_WINDOW = 0.0  # Espera del líder de un grupo (0: agrupa lo que llega mientras escribe)
+GROUP_COMMIT_MAX_BATCH = 128  # Máximo de inserciones por escritura agrupada
+SECONDARY_BUILD_BATCH = 10_000  # Productos leídos por paso al construir los índices secundarios
+SECONDARY_INDEX_RETRY = 0.5  # `retry_after` mínimo de una consulta por rango mientras se construyen
+VERBOSE = True  # Mostrar trazas por consola
+
+
+def log(mensaje: str):
+    """Imprime un mensaje de traza si el modo detallado está activo"""
+    if VERBOSE:
+        print(mensaje)
+
+
+def validate_product(product_id, nombre, precio) -> float:
+    """
+    Comprueba los campos de un producto antes de escribirlo en el diario
+    
+    Como en el formato original, el precio puede llegar como texto
+    numérico; se convierte con `float()`:
+    
+    >>> validate_product("PROD-1", "Laptop", "19.99")
+    19.99
+    >>> validate_product("PROD-1", "Laptop", 5)
+    5
+    
+    Returns:
+        El precio como número (los números se devuelven tal cual)
+    
+    Raises:
+        ValueError: Si el ID o el nombre no son texto o el precio no es
+            un número finito
+    """
+    if not isinstance(product_id, str) or not product_id:
+        raise ValueError(f"ID de producto inválido: {product_id!r}")
+    if not isinstance(nombre, str):
+        raise ValueError(f"Nombre inválido para {product_id}: {nombre!r}")
+    number = precio
+    if isinstance(precio, str):
+        try:
+            number = float(precio)
+        except ValueError:
+            number = None
+    if isinstance(number, bool) or not isinstance(number, (int, float)) or \
+            not math.isfinite(number):
+        raise ValueError(f"Precio inválido para {product_id}: {precio!r}")
+    return number
+
+
+class _LockSide:
+    """
+    Vista de un ReadWriteLock utilizable con la sentencia `with`
+    
+    Si recibe histogramas, registra cuánto se esperó para obtener el lock
+    y cuánto se mantuvo (solo en las adquisiciones con `with`).
+    """
+    
+    __slots__ = ("acquire", "release", "_wait", "_hold", "_local")
+    
+    def __init__(self, acquire, release, wait: Optional[Histogram] = None,
+                 hold: Optional[Histogram] = None):
+        self.acquire = acquire
+        self.release = release
+        self._wait = wait
+        self._hold = hold
+        self._local = threading.local()  # Momento de adquisición por thread
+    
+    def __enter__(self):
+        if self._wait is None:
+            self.acquire()
+            return self
+        start = time.perf_counter()
+        self.acquire()
+        acquired = time.perf_counter()
+        self._wait.observe(acquired - start)
+        trazas.add_time("lock_wait", acquired - start)
+        self._local.acquired = acquired
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._hold is not None:
+            self._hold.observe(time.perf_counter() - self._local.acquired)
+        self.release()
+
+
+class ReadWriteLock:
+    """
+    Lock de lectores-escritor con preferencia a escritores
+    
+    Varios lectores pueden mantener el lock a la vez; un escritor lo obtiene
+    en exclusiva. Cuando hay un escritor esperando, los nuevos lectores
+    esperan detrás de él para que las inserciones no sufran inanición.
+    No es reentrante.
+    
+    Uso:
+        with lock.read: ...
+        with lock.write: ...
+    
+    Con un registro de métricas se miden la espera y la retención del lock
+    por modo (`store_lock_wait_seconds` / `store_lock_hold_seconds`).
+    """
+    
+    def __init__(self, metrics: Optional[MetricsRegistry] = None):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        sides = {}
+        for mode in ("read", "write"):
+            if metrics is None:
+                sides[mode] = (None, None)
+            else:
+                sides[mode] = (
+                    metrics.histogram("store_lock_wait_seconds",
+                                      "Espera para obtener el lock del catálogo", mode=mode),
+                    metrics.histogram("store_lock_hold_seconds",
+                                      "Tiempo con el lock del catálogo tomado", mode=mode),
+                )
+        self.read = _LockSide(self.acquire_read, self.release_read, *sides["read"])
+        self.write = _LockSide(self.acquire_write, self.release_write, *sides["write"])
+    
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+    
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+    
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+    
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+class _PendingInsert:
+    """Inserción individual a la espera de la siguiente escritura agrupada"""
+    
+    __slots__ = ("entry", "position", "error", "lead", "done")
+    
+    def __init__(self, entry: Tuple[str, str, str]):
+        self.entry = entry
+        self.position = -1
+        self.error: Optional[Exception] = None
+        self.lead = False  # Designada para persistir el siguiente grupo
+        self.done = threading.Event()
 
 
 class ProductManager:
-    """Gestiona las operaciones sobre el archivo XML de productos"""
+    """
+    Gestiona las operaciones sobre el archivo XML de productos
     
-    def __init__(self, xml_file: str):
+    Las inserciones se registran en un diario de solo-anexado
+    (``<xml_file>.journal``) y un thread en segundo plano las incorpora
+    periódicamente a una nueva instantánea de ``productos.xml``.
+    
+    Las inserciones individuales concurrentes se agrupan (group commit):
+    la primera en llegar actúa como líder, espera `group_commit_window`
+    segundos, toma hasta `group_commit_max_batch` inserciones pendientes y
+    las persiste con una sola escritura del diario; las demás esperan su
+    posición. Con la ventana por defecto (0) el líder no espera: el grupo
+    son las inserciones que llegaron mientras se escribía el anterior. Por
+    defecto solo se agrupa cuando el diario se sincroniza con fsync (lote
+    `GROUP_COMMIT_MAX_BATCH`); sin fsync el lote es 1, es decir, cada
+    inserción se escribe por separado.
+    
+    Cada instantánea se acompaña de un índice persistido
+    (``<xml_file>.idx``, ver `indice.py`) con el ID y el offset de cada
+    producto. Si es válido, el arranque no analiza el XML y los registros
+    se leen del archivo solo cuando hacen falta; si falta o está
+    desactualizado, se carga el XML completo y el índice se reconstruye en
+    segundo plano. Con `persist_index=False` no se lee ni se escribe, y con
+    `verify_index` se valida contra el crc32 del XML completo en lugar de
+    solo contra su final.
+    
+    Con `secondary_indexes` se mantienen además índices ordenados por
+    precio y por nombre (ver `indices_secundarios.py`) para las consultas
+    por rango de precio y por prefijo de nombre. Se construyen en segundo
+    plano al arrancar y después se actualizan con cada inserción.
+    
+    Los tiempos de lock, de carga y escritura del XML y de escritura del
+    diario se registran en `metrics` (uno propio si no se indica).
+    """
+    
+    def __init__(self, xml_file: str, insertion_delay: float = INSERTION_DELAY,
+                 compaction_interval: float = COMPACTION_INTERVAL,
+                 compaction_threshold: int = COMPACTION_THRESHOLD,
+                 sync_journal: bool = False,
+                 group_commit_window: float = GROUP_COMMIT_WINDOW,
+                 group_commit_max_batch: Optional[int] = None,
+                 metrics: Optional[MetricsRegistry] = None,
+                 persist_index: bool = True,
+                 verify_index: bool = False,
+                 secondary_indexes: bool = True):
         self.xml_file = xml_file
-        self.lock = threading.RLock()  # Reentrant lock para operaciones anidadas
+        self.journal_file = xml_file + JOURNAL_SUFFIX
+        self.compacting_file = self.journal_file + COMPACTING_SUFFIX
+        self.insertion_delay = insertion_delay
+        self.compaction_interval = compaction_interval
+        self.compaction_threshold = compaction_threshold
+        self.sync_journal = sync_journal  # fsync tras cada escritura del diario
+        self.group_commit_window = group_commit_window
+        if group_commit_max_batch is None:
+            # Agrupar solo compensa cuando cada escritura paga un fsync
+            group_commit_max_batch = GROUP_COMMIT_MAX_BATCH if sync_journal else 1
+        self.group_commit_max_batch = group_commit_max_batch
+        self.persist_index = persist_index
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._xml_load_time = self.metrics.histogram(
+            "store_xml_load_seconds", "Carga del XML de productos")
+        self._xml_save_time = self.metrics.histogram(
+            "store_xml_save_seconds", "Escritura de una instantánea del XML")
+        self._journal_write_time = self.metrics.histogram(
+            "store_journal_write_seconds", "Escritura de un grupo en el diario")
+        self.metrics.gauge("store_products", "Productos en el catálogo",
+                           function=lambda: len(self.index))
+        self.lock = ReadWriteLock(self.metrics)  # Consultas en paralelo, inserciones exclusivas
+        self._compaction_lock = threading.Lock()  # Una compactación a la vez
         self._ensure_xml_exists()
+        
+        # Índices por precio y por nombre: solo se actualizan una vez construidos
+        self.by_price = SortedIndex("d")
+        self.by_name = SortedIndex()
+        self._secondary_ready = threading.Event()
+        self._secondary_building = secondary_indexes  # False si no hay o falló la construcción
+        self._secondary_read = 0  # Productos leídos por la construcción
+        self._secondary_started = time.perf_counter()
+        
+        # Las consultas se responden desde memoria mediante el índice
+        # id -> posición; con un índice persistido válido los registros de
+        # la instantánea no se cargan hasta que se necesitan
+        loaded = os.stat(self.xml_file)
+        sidecar = load_sidecar(self.xml_file, verify_index) if persist_index else None
+        if sidecar is not None:
+            self.records = RecordStore.from_sidecar(self.xml_file, sidecar)
+            source = sidecar_file(self.xml_file)
+        else:
+            self.records = self._load_xml()
+            source = self.xml_file
+        self.index: Dict[str, int] = self._build_index(self.records.ids)
+        replayed = self._replay_journal(self.compacting_file) + \
+            self._replay_journal(self.journal_file)
+        log(f"[STORE] {len(self.index)} productos cargados desde {source} "
+            f"({replayed} recuperados del diario)")
+        
+        self._journal = open(self.journal_file, "a", encoding="utf-8")
+        self._journal_size = self._journal.tell()
+        
+        self._closed = threading.Event()
+        self._compaction_requested = threading.Event()
+        self._compaction_thread = threading.Thread(target=self._compaction_loop, daemon=True)
+        self._compaction_thread.start()
+        
+        self._rebuild_thread: Optional[threading.Thread] = None
+        if persist_index and sidecar is None:
+            self._rebuild_thread = threading.Thread(target=self._rebuild_sidecar,
+                                                    args=(loaded,), daemon=True)
+            self._rebuild_thread.start()
+        if secondary_indexes:
+            threading.Thread(target=self._build_secondary_indexes, daemon=True).start()
+        
+        self._commit_mutex = threading.Lock()  # Protege la lista de pendientes
+        self._commit_pending: List[_PendingInsert] = []
+        self._commit_leader = False  # Hay una inserción persistiendo un grupo
+        
+        # Avisa de cada grupo publicado (replicación y lecturas de réplicas)
+        self._size_changed = threading.Condition(threading.Lock())
     
     def _ensure_xml_exists(self):
         """Asegura que el archivo XML existe con la estructura correcta"""
@@ -40,14 +345,325 @@ class ProductManager:
             tree = ET.ElementTree(root)
             tree.write(self.xml_file, encoding="UTF-8", xml_declaration=True)
     
-    def _load_xml(self) -> ET.ElementTree:
-        """Carga el archivo XML en memoria"""
-        tree = ET.parse(self.xml_file)
-        return tree
+    def _load_xml(self) -> RecordStore:
+        """Carga todos los productos del archivo XML en memoria"""
+        start = time.perf_counter()
+        records = RecordStore.from_xml(self.xml_file)
+        self._xml_load_time.observe(time.perf_counter() - start)
+        return records
+    
+    def _save_xml(self, count: int) -> SidecarIndex:
+        """
+        Escribe una instantánea con los `count` primeros productos
+        
+        Se escribe primero a un archivo temporal y luego se reemplaza el XML
+        de forma atómica, de modo que un fallo a mitad nunca deja el archivo
+        truncado. Después se escribe su índice persistido; si se cae entre
+        ambos pasos, el índice queda desactualizado y se reconstruye.
+        
+        Returns:
+            Índice de la nueva instantánea
+        """
+        start = time.perf_counter()
+        tmp_file = self.xml_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            offsets, crc = self.records.write_snapshot(f, count)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.xml_file)
+        sidecar = SidecarIndex(file_stamp(self.xml_file, crc), offsets,
+                               self.records.ids[:count])
+        if self.persist_index:
+            write_sidecar(self.xml_file, sidecar)
+        self._xml_save_time.observe(time.perf_counter() - start)
+        return sidecar
+    
+    def _rebuild_sidecar(self, loaded: os.stat_result):
+        """
+        Thread que reconstruye un índice persistido ausente o desactualizado
+        
+        Recorre el XML sin construir elementos, escribe el índice y libera
+        los registros cargados en memoria, que pasan a leerse del archivo.
+        """
+        try:
+            with self._compaction_lock:
+                if self._closed.is_set() or self.records.indexed:
+                    return  # Una compactación ya escribió una instantánea indexada
+                start = time.perf_counter()
+                sidecar = scan_catalog(self.xml_file)
+                if (sidecar.stamp.size, sidecar.stamp.mtime_ns) != \
+                        (loaded.st_size, loaded.st_mtime_ns):
+                    log(f"[STORE] {self.xml_file} cambió desde el arranque; "
+                        f"no se reconstruye el índice")
+                    return
+                write_sidecar(self.xml_file, sidecar)
+                with self.lock.write:
+                    self.records.rebase(self.xml_file, sidecar)
+                log(f"[STORE] Índice {sidecar_file(self.xml_file)} reconstruido "
+                    f"({len(sidecar.ids)} productos) en {time.perf_counter() - start:.3f}s")
+        except Exception as e:
+            log(f"[ERROR] Error reconstruyendo el índice de {self.xml_file}: {e}")
+    
+    @staticmethod
+    def _build_index(ids: List[Optional[str]]) -> Dict[str, int]:
+        """
+        Construye el índice id -> posición a partir de los IDs en orden
+        
+        Si un ID aparece repetido en el archivo se conserva la primera
+        posición, que es la que devolvía la búsqueda lineal original.
+        """
+        index: Dict[str, int] = {}
+        for idx, product_id in enumerate(ids):
+            index.setdefault(product_id, idx)
+        return index
+    
+    def _append_record(self, entry: Tuple[str, str, str]) -> int:
+        """Agrega un registro (id, nombre, precio) en memoria y devuelve su posición"""
+        self.records.append(*entry)
+        position = len(self.records) - 1
+        self.index[entry[0]] = position
+        if self._secondary_ready.is_set():
+            self._index_secondary(entry, position)
+        return position
+    
+    def _index_secondary(self, entry: Tuple[str, str, str], position: int):
+        """Agrega un producto a los índices por precio y por nombre"""
+        price = price_key(entry[2])
+        if price is not None:
+            self.by_price.insert(price, position)
+        name = name_key(entry[1])
+        if name is not None:
+            self.by_name.insert(name, position)
+    
+    def _build_secondary_indexes(self):
+        """
+        Thread que construye los índices por precio y por nombre
+        
+        Lee el catálogo por tramos bajo el lock de lectura (con el índice
+        persistido, los registros de la instantánea se leen del XML), ordena
+        fuera del lock y, bajo el lock de escritura, agrega lo insertado
+        mientras tanto y publica los índices.
+        """
+        try:
+            start = time.perf_counter()
+            prices: List[Tuple[float, int]] = []
+            names: List[Tuple[str, int]] = []
+            position = 0
+            while not self._closed.is_set():
+                with self.lock.read:
+                    entries = self.records.entries(position, position + SECONDARY_BUILD_BATCH)
+                if not entries:
+                    break
+                for _, nombre, precio in entries:
+                    price = price_key(precio)
+                    if price is not None:
+                        prices.append((price, position))
+                    name = name_key(nombre)
+                    if name is not None:
+                        names.append((name, position))
+                    position += 1
+                self._secondary_read = position
+            by_price, by_name = SortedIndex("d"), SortedIndex()
+            by_price.build(prices)
+            by_name.build(names)
+            del prices, names
+            
+            with self.lock.write:
+                self.by_price, self.by_name = by_price, by_name
+                for entry in self.records.entries(position, len(self.records)):
+                    self._index_secondary(entry, position)
+                    position += 1
+                self._secondary_ready.set()
+            log(f"[STORE] Índices por precio y nombre construidos ({position} productos) "
+                f"en {time.perf_counter() - start:.3f}s")
+        except Exception as e:
+            self._secondary_building = False
+            log(f"[ERROR] Error construyendo los índices secundarios: {e}")
+    
+    def _replay_journal(self, journal_file: str) -> int:
+        """
+        Reaplica las entradas de un diario sobre el catálogo en memoria
+        
+        Las entradas cuyo ID ya está en la instantánea se ignoran, por lo que
+        reaplicar un diario ya compactado es inofensivo. Una línea incompleta
+        (p. ej. por una caída a mitad de escritura) se descarta.
+        
+        Returns:
+            Número de productos recuperados
+        """
+        if not os.path.exists(journal_file):
+            return 0
+        
+        recovered = 0
+        with open(journal_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    product_id, nombre, precio = json.loads(line)
+                    if not all(isinstance(field, str) for field in (product_id, nombre, precio)):
+                        raise TypeError("campos que no son texto")
+                except (ValueError, TypeError):
+                    log(f"[STORE] Entrada de diario inválida descartada en {journal_file}: "
+                        f"{line.strip()[:80]}")
+                    continue
+                if product_id in self.index:
+                    continue
+                self._append_record((product_id, nombre, precio))
+                recovered += 1
+        return recovered
+    
+    def _write_journal(self, entries: List[Tuple[str, str, str]]):
+        """Anexa entradas al diario y las vuelca al sistema operativo"""
+        start = time.perf_counter()
+        data = "".join(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for entry in entries
+        )
+        self._journal.write(data)
+        self._journal.flush()
+        if self.sync_journal:
+            os.fsync(self._journal.fileno())
+        elapsed = time.perf_counter() - start
+        self._journal_write_time.observe(elapsed)
+        trazas.add_time("journal_write", elapsed)
+        self._journal_size += len(data.encode("utf-8"))
+        if self._journal_size >= self.compaction_threshold:
+            self._compaction_requested.set()
+    
+    def _compaction_loop(self):
+        """Thread que compacta el diario por tiempo o por tamaño"""
+        while not self._closed.is_set():
+            self._compaction_requested.wait(timeout=self.compaction_interval)
+            self._compaction_requested.clear()
+            if self._closed.is_set():
+                break
+            try:
+                self.compact()
+            except Exception as e:
+                log(f"[ERROR] Error compactando el diario: {e}")
+    
+    def compact(self):
+        """
+        Incorpora el diario a una nueva instantánea de productos.xml
+        
+        Bajo el lock solo se congela el diario actual y se toma el número
+        de registros; la escritura de la instantánea ocurre fuera del lock
+        para no bloquear inserciones ni consultas. Los registros ya
+        indexados se copian del XML anterior sin analizarlo.
+        """
+        with self._compaction_lock:
+            with self.lock.write:
+                if self._journal_size == 0:
+                    return
+                self._journal.close()
+                if os.path.exists(self.compacting_file):
+                    # Una compactación anterior falló: conservar ambas partes
+                    with open(self.compacting_file, "a", encoding="utf-8") as dst, \
+                            open(self.journal_file, "r", encoding="utf-8") as src:
+                        dst.write(src.read())
+                    os.remove(self.journal_file)
+                else:
+                    os.replace(self.journal_file, self.compacting_file)
+                self._journal = open(self.journal_file, "a", encoding="utf-8")
+                self._journal_size = 0
+                count = len(self.records)
+            
+            start = time.perf_counter()
+            sidecar = self._save_xml(count)
+            with self.lock.write:
+                self.records.rebase(self.xml_file, sidecar)
+            os.remove(self.compacting_file)
+            elapsed = time.perf_counter() - start
+            log(f"[STORE] Instantánea con {count} productos escrita en {elapsed:.3f}s")
+    
+    def close(self):
+        """Detiene la compactación en segundo plano y cierra el diario"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._compaction_requested.set()
+        self._compaction_thread.join()
+        if self._rebuild_thread is not None:
+            self._rebuild_thread.join()
+        with self.lock.write:
+            self._journal.close()
+            self.records.close()
+    
+    def _commit_entries(self, entries: List[Tuple[str, str, str]]) -> List[int]:
+        """
+        Verifica duplicados, persiste y publica un grupo de inserciones
+        
+        Debe llamarse con el lock de escritura tomado.
+        
+        Returns:
+            Posición de cada entrada, o -1 para las que ya existían
+            (incluidas las repetidas dentro del mismo grupo)
+        """
+        positions = []
+        new_entries = []
+        next_position = len(self.records)
+        batch_ids = set()
+        for entry in entries:
+            product_id = entry[0]
+            if product_id in self.index or product_id in batch_ids:
+                positions.append(-1)
+                continue
+            batch_ids.add(product_id)
+            new_entries.append(entry)
+            positions.append(next_position)
+            next_position += 1
+        
+        # Registrar en el diario antes de publicar los productos en memoria
+        if new_entries:
+            self._write_journal(new_entries)
+            for entry in new_entries:
+                self._append_record(entry)
+            with self._size_changed:
+                self._size_changed.notify_all()
+        return positions
     
-    def _save_xml(self, tree: ET.ElementTree):
-        """Guarda el árbol XML al archivo"""
-        tree.write(self.xml_file, encoding="UTF-8", xml_declaration=True)
+    def _group_commit(self, pending: _PendingInsert):
+        """
+        Persiste una inserción individual como parte de un grupo
+        
+        Si no hay un líder activo, esta inserción lo es: reúne el grupo,
+        lo persiste y, si quedan pendientes, cede el liderazgo a la primera
+        de ellas. En caso contrario espera a que un líder la persista.
+        """
+        with self._commit_mutex:
+            self._commit_pending.append(pending)
+            is_leader = not self._commit_leader
+            self._commit_leader = True
+        
+        if not is_leader:
+            pending.done.wait()
+            if not pending.lead:
+                return
+        
+        if self.group_commit_window > 0:
+            time.sleep(self.group_commit_window)  # Dejar llegar más inserciones
+        with self._commit_mutex:
+            group = self._commit_pending[:self.group_commit_max_batch]
+            del self._commit_pending[:self.group_commit_max_batch]
+        
+        try:
+            with self.lock.write:
+                positions = self._commit_entries([p.entry for p in group])
+            for p, position in zip(group, positions):
+                p.position = position
+        except Exception as e:
+            for p in group:
+                p.error = e
+        
+        with self._commit_mutex:
+            if self._commit_pending:
+                successor = self._commit_pending[0]
+                successor.lead = True
+                successor.done.set()
+            else:
+                self._commit_leader = False
+        for p in group:
+            p.lead = False
+            p.done.set()
     
     def insert_product(self, product_id: str, nombre: str, precio: float) -> int:
         """
@@ -57,35 +673,56 @@ class ProductManager:
             product_id: ID del producto
             nombre: Nombre del producto
             precio: Precio del producto
-            
+        
         Returns:
             Posición del producto en el XML (0-indexed) o -1 si ya existe
         """
-        with self.lock:
-            print(f"[INSERT] Iniciando inserción de producto ID: {product_id}")
-            time.sleep(INSERTION_DELAY)  # Simular carga del servidor
-            
-            tree = self._load_xml()
-            root = tree.getroot()
-            
-            # Verificar si el producto ya existe
-            for idx, producto in enumerate(root):
-                if producto.get("id") == product_id:
-                    print(f"[INSERT] Producto {product_id} ya existe en posición {idx}")
-                    return -1
-            
-            # Crear nuevo elemento producto
-            producto = ET.Element("producto")
-            producto.set("id", product_id)
-            producto.set("nombre", nombre)
-            producto.set("precio", str(precio))
-            
-            root.append(producto)
-            position = len(root) - 1
-            
-            self._save_xml(tree)
-            print(f"[INSERT] Producto {product_id} insertado en posición {position}")
-            return position
+        log(f"[INSERT] Iniciando inserción de producto ID: {product_id}")
+        time.sleep(self.insertion_delay)  # Simular carga fuera de la sección crítica
+        trazas.add_time("simulated_load", self.insertion_delay)
+        entry = (product_id, nombre, str(precio))
+        
+        if self.group_commit_max_batch <= 1:
+            with self.lock.write:
+                position = self._commit_entries([entry])[0]
+        else:
+            pending = _PendingInsert(entry)
+            self._group_commit(pending)
+            if pending.error is not None:
+                raise pending.error
+            position = pending.position
+        
+        if position == -1:
+            log(f"[INSERT] Producto {product_id} ya existe")
+        else:
+            log(f"[INSERT] Producto {product_id} insertado en posición {position}")
+        return position
+    
+    def insert_products(self, products: List[Tuple[str, str, float]]) -> List[int]:
+        """
+        Inserta un lote de productos con una sola escritura del diario
+        
+        El lote se aplica bajo una única adquisición del lock de escritura y
+        el retardo simulado se aplica una vez por lote.
+        
+        Args:
+            products: Lista de tuplas (id, nombre, precio)
+        
+        Returns:
+            Posición de cada producto, o -1 para los que ya existían
+            (incluidos los repetidos dentro del mismo lote)
+        """
+        log(f"[INSERT] Iniciando inserción de lote de {len(products)} productos")
+        time.sleep(self.insertion_delay)  # Simular carga fuera de la sección crítica
+        trazas.add_time("simulated_load", self.insertion_delay)
+        
+        entries = [(product_id, nombre, str(precio)) for product_id, nombre, precio in products]
+        with self.lock.write:
+            positions = self._commit_entries(entries)
+        inserted = sum(1 for position in positions if position != -1)
+        log(f"[INSERT] Lote insertado: {inserted} nuevos, "
+            f"{len(products) - inserted} duplicados")
+        return positions
     
     def query_product(self, product_id: str) -> int:
         """
@@ -93,141 +730,1039 @@ class ProductManager:
         
         Args:
             product_id: ID del producto a buscar
-            
+        
         Returns:
             Posición del producto en el XML (0-indexed) o -1 si no existe
         """
-        with self.lock:
-            print(f"[QUERY] Consultando producto ID: {product_id}")
-            tree = self._load_xml()
-            root = tree.getroot()
-            
-            for idx, producto in enumerate(root):
-                if producto.get("id") == product_id:
-                    print(f"[QUERY] Producto {product_id} encontrado en posición {idx}")
-                    return idx
-            
-            print(f"[QUERY] Producto {product_id} no encontrado")
-            return -1
+        log(f"[QUERY] Consultando producto ID: {product_id}")
+        with self.lock.read:
+            position = self.index.get(product_id)
+        
+        if position is not None:
+            log(f"[QUERY] Producto {product_id} encontrado en posición {position}")
+            return position
+        
+        log(f"[QUERY] Producto {product_id} no encontrado")
+        return -1
+    
+    @property
+    def size(self) -> int:
+        """Número de productos; la siguiente inserción ocupará esta posición"""
+        return len(self.records)
+    
+    def wait_for_size(self, size: int, timeout: Optional[float]) -> bool:
+        """
+        Espera a que el catálogo tenga al menos `size` productos
+        
+        Returns:
+            True si se alcanzó antes de `timeout` segundos
+        """
+        with self._size_changed:
+            return self._size_changed.wait_for(lambda: len(self.records) >= size, timeout)
+    
+    def entries_since(self, position: int, limit: int) -> List[Tuple[str, str, str]]:
+        """Entradas (id, nombre, precio) a partir de una posición, en orden"""
+        with self.lock.read:
+            return self.records.entries(position, position + limit)
+    
+    def id_at(self, position: int) -> Optional[str]:
+        """ID del producto en una posición, o None si no existe"""
+        with self.lock.read:
+            if 0 <= position < len(self.records):
+                return self.records.ids[position]
+            return None
+    
+    def apply_replicated(self, position: int, entries: List[Tuple[str, str, str]]):
+        """
+        Aplica entradas recibidas del primario a partir de `position`
+        
+        Se persisten en el diario como cualquier inserción (sin el retardo
+        simulado), de modo que la réplica retoma desde su tamaño al
+        reiniciarse.
+        
+        Raises:
+            ValueError: Si `position` no es el tamaño actual del catálogo
+        """
+        with self.lock.write:
+            if position != len(self.records):
+                raise ValueError(f"Entradas desde la posición {position}, "
+                                 f"pero la réplica tiene {len(self.records)} productos")
+            duplicated = next((e[0] for e in entries if e[0] in self.index), None)
+            if duplicated is not None:
+                raise ValueError(f"El producto {duplicated} ya existe en la réplica")
+            self._commit_entries([tuple(entry) for entry in entries])
+    
+    def _check_secondary(self):
+        """
+        Comprueba que los índices por precio y nombre estén construidos
+        
+        Raises:
+            ServerBusy: Si aún se están construyendo, con el tiempo restante
+                estimado por el ritmo de lectura (al menos
+                `SECONDARY_INDEX_RETRY`: falta además ordenar)
+            RuntimeError: Si no hay índices (desactivados o fallidos)
+        """
+        if self._secondary_ready.is_set():
+            return
+        if not self._secondary_building:
+            raise RuntimeError("Los índices por precio y nombre no están disponibles")
+        read = self._secondary_read
+        elapsed = time.perf_counter() - self._secondary_started
+        remaining = elapsed * (len(self.records) - read) / read if read else 0.0
+        raise ServerBusy("indexing", max(SECONDARY_INDEX_RETRY, remaining),
+                         "Los índices por precio y nombre todavía se están construyendo")
+    
+    def price_range_items(self, low: float, high: float, offset: int,
+                          limit: int) -> Tuple[List[Tuple[float, int]], bool]:
+        """Página de pares (precio, posición) con low <= precio <= high"""
+        self._check_secondary()
+        with self.lock.read:
+            return self.by_price.range(low, high, offset, limit)
+    
+    def name_prefix_items(self, prefix: str, offset: int,
+                          limit: int) -> Tuple[List[Tuple[str, int]], bool]:
+        """Página de pares (nombre, posición) con nombres que empiezan por `prefix`"""
+        self._check_secondary()
+        with self.lock.read:
+            return self.by_name.prefix(prefix, offset, limit)
+    
+    def query_price_range(self, low: Optional[float] = None, high: Optional[float] = None,
+                          offset: int = 0,
+                          limit: int = DEFAULT_RANGE_LIMIT) -> Tuple[List[int], bool]:
+        """
+        Consulta los productos con precio entre `low` y `high` (inclusive)
+        
+        Args:
+            low: Precio mínimo (None = sin mínimo)
+            high: Precio máximo (None = sin máximo)
+            offset: Resultados que se saltan
+            limit: Máximo de posiciones devueltas
+        
+        Returns:
+            (posiciones ordenadas por precio, hay más resultados)
+        """
+        low = float("-inf") if low is None else float(low)
+        high = float("inf") if high is None else float(high)
+        offset, limit = page_bounds(offset, limit)
+        log(f"[QUERY] Consultando precios entre {low} y {high}")
+        items, more = self.price_range_items(low, high, offset, limit)
+        return [position for _, position in items], more
+    
+    def query_name_prefix(self, prefix: str, offset: int = 0,
+                          limit: int = DEFAULT_RANGE_LIMIT) -> Tuple[List[int], bool]:
+        """
+        Consulta los productos cuyo nombre empieza por `prefix`
+        
+        Returns:
+            (posiciones ordenadas por nombre, hay más resultados)
+        """
+        if not isinstance(prefix, str):
+            raise ValueError("El prefijo debe ser una cadena")
+        offset, limit = page_bounds(offset, limit)
+        log(f"[QUERY] Consultando nombres que empiezan por {prefix!r}")
+        items, more = self.name_prefix_items(prefix, offset, limit)
+        return [position for _, position in items], more
+    
+    def query_products(self, product_ids: List[str]) -> List[int]:
+        """
+        Consulta un lote de productos bajo una única adquisición del lock
+        
+        Args:
+            product_ids: IDs de los productos a buscar
+        
+        Returns:
+            Posición de cada producto, o -1 para los que no existen
+        """
+        log(f"[QUERY] Consultando lote de {len(product_ids)} productos")
+        with self.lock.read:
+            return [self.index.get(product_id, -1) for product_id in product_ids]
+
+
+class FramedConnection:
+    """
+    Conexión persistente que responde con mensajes enmarcados
+    
+    Varios workers pueden responder a la vez sobre la misma conexión; el
+    lock evita que sus mensajes se intercalen. La conexión se cierra cuando
+    el cliente dejó de enviar y ya no quedan respuestas pendientes.
+    El códec se negocia con la solicitud `hello` (JSON por defecto).
+    Una solicitud de larga duración (replicación) puede enviar varios
+    mensajes con `push` antes de su respuesta final.
+    
+    Si un envío falla (p. ej. vence el plazo de envío de un cliente que no
+    lee) la conexión queda rota: el resto de respuestas se descartan.
+    En modo asyncio `drain` espera a que el búfer de escritura baje de su
+    límite; si no baja a tiempo la conexión queda rota.
+    """
+    
+    def __init__(self, send: Callable[[bytes], None], close: Callable[[], None],
+                 bytes_out: Optional[Counter] = None,
+                 drain: Optional[Callable[[], Awaitable[None]]] = None):
+        self._send = send
+        self._close = close
+        self._bytes_out = bytes_out
+        self._drain = drain
+        self.codec = DEFAULT_CODEC
+        self._lock = threading.Condition(threading.Lock())
+        self._pending = 0
+        self._reading = True
+        self._closed = False
+        self._broken = False
+        self._on_finish: List[Callable[[], None]] = []
+    
+    def on_finish(self, callback: Callable[[], None]):
+        """Registra una función a llamar cuando el cliente cierre su lado"""
+        self._on_finish.append(callback)
+    
+    def push(self, request_id: int, message: Dict) -> bool:
+        """
+        Envía un mensaje intermedio de una solicitud en curso
+        
+        Returns:
+            False si la conexión ya está cerrada o rota
+        """
+        payload = self.codec.encode(message)
+        with self._lock:
+            return self._write(request_id, payload)
+    
+    async def drain(self):
+        """
+        Espera a que el cliente lea lo ya enviado (modo asyncio)
+        
+        Raises:
+            ConnectionError: Si no lo lee a tiempo; la conexión queda rota
+        """
+        try:
+            await self._drain()
+        except ConnectionError:
+            self._broken = True
+            raise
+    
+    def register(self):
+        """Anota una solicitud pendiente de respuesta"""
+        with self._lock:
+            self._pending += 1
+    
+    def wait_for_room(self, limit: int) -> bool:
+        """
+        Espera a que haya menos de `limit` solicitudes sin responder
+        
+        Solo en modo threads: bloquea el thread lector de la conexión, de
+        modo que un cliente que no lee sus respuestas deja de ser leído.
+        
+        Returns:
+            False si la conexión se rompió y no hay que leer más
+        """
+        with self._lock:
+            self._lock.wait_for(lambda: self._pending < limit or self._broken)
+            return not self._broken
+    
+    def reply(self, request_id: int, response: Dict):
+        """Codifica y envía la respuesta de una solicitud con su id"""
+        payload = self.codec.encode(response)
+        with self._lock:
+            try:
+                self._write(request_id, payload)
+            finally:
+                self._pending -= 1
+                self._lock.notify_all()
+                self._maybe_close()
+    
+    def finish_reading(self):
+        """Indica que el cliente cerró su lado de la conexión"""
+        with self._lock:
+            self._reading = False
+            self._maybe_close()
+        for callback in self._on_finish:
+            callback()
+    
+    def _write(self, request_id: int, payload: bytes) -> bool:
+        """Envía un mensaje (con `_lock` tomado); False si no se pudo"""
+        if self._closed or self._broken:
+            return False
+        try:
+            self._send(encode_frame(request_id, payload))
+        except OSError:
+            self._broken = True
+            self._lock.notify_all()
+            return False
+        if self._bytes_out is not None:
+            self._bytes_out.inc(FRAME_HEADER.size + len(payload))
+        return True
+    
+    def _maybe_close(self):
+        if not self._reading and self._pending == 0 and not self._closed:
+            self._closed = True
+            self._close()
 
 
 class RPCServer:
-    """Servidor RPC asíncrono con sistema de prioridades"""
+    """
+    Servidor RPC asíncrono con sistema de prioridades
+    
+    Las solicitudes se atienden con un `PriorityScheduler`: FIFO dentro de
+    cada prioridad, inserciones antes que consultas y, tras `max_wait`
+    segundos en cola, cualquier solicitud pasa por delante (sin inanición).
+    Con `weights` los niveles se reparten los workers en proporción a su peso.
     
-    def __init__(self, host: str, port: int, xml_file: str):
+    Control de admisión (ver `admision.py`): cada prioridad admite como
+    máximo `capacity[prioridad]` solicitudes en cola y, con `rate_limit`,
+    cada `client_id` tiene un token bucket; lo que no se admite se responde
+    al momento con un error `busy` y `retry_after`. Las solicitudes con
+    `deadline_ms` que caducan en cola se descartan sin procesarlas.
+    
+    Con `tracer` (ver `trazas.py`) se anotan las etapas de una muestra de
+    las solicitudes, desde que se leen hasta que se envía la respuesta.
+    Con `capture` se guarda cada solicitud recibida para reproducirla con
+    `replay.py`.
+    
+    Con `shards` > 0 el catálogo se reparte entre ese número de procesos
+    (ver `particiones.py`); este proceso queda como front-end.
+    
+    Cualquier servidor sin particiones puede actuar de primario: envía sus
+    inserciones a las réplicas que se suscriben con `replicate`. Con
+    `primary` el servidor es una réplica de solo lectura de ese primario
+    (ver `replicacion.py`).
+    
+    Mantiene un registro de métricas (`self.metrics`) con la profundidad de
+    la cola, la espera en cola y el tiempo de servicio por prioridad, los
+    bytes recibidos y enviados y las métricas de ProductManager. Se consulta
+    con la operación `stats` o con `start_metrics_server`.
+    """
+    
+    def __init__(self, host: str, port: int, xml_file: str,
+                 insertion_delay: float = INSERTION_DELAY,
+                 max_wait: Optional[float] = MAX_QUEUE_WAIT,
+                 weights: Optional[Dict[int, float]] = None,
+                 shards: int = 0, primary: Optional[str] = None,
+                 capacity: Optional[Dict[int, int]] = None,
+                 rate_limit: Optional[Tuple[float, float]] = None,
+                 tracer: Optional[trazas.Tracer] = None,
+                 capture: Optional[trazas.RequestCapture] = None,
+                 sync_journal: bool = False,
+                 group_commit_window: float = GROUP_COMMIT_WINDOW,
+                 group_commit_max_batch: Optional[int] = None,
+                 verify_index: bool = False):
+        """
+        Args:
+            capacity: Máximo de solicitudes en cola por prioridad (None:
+                `QUEUE_CAPACITY` en cada una; {} o 0: sin límite)
+            rate_limit: (tasa, ráfaga) de solicitudes por segundo admitidas
+                a cada cliente (None: sin límite)
+            tracer: Destino de las trazas por solicitud (None: sin trazas)
+            capture: Destino de la captura de tráfico (None: sin captura)
+            sync_journal, group_commit_window, group_commit_max_batch:
+                Persistencia del diario (ver ProductManager)
+            verify_index: Validar el índice persistido contra el crc32 del
+                XML completo (ver ProductManager)
+        """
         self.host = host
         self.port = port
-        self.product_manager = ProductManager(xml_file)
-        self.priority_queue = queue.PriorityQueue()
-        self.worker_threads = []
+        self.metrics = MetricsRegistry()
+        store_options = {"sync_journal": sync_journal,
+                         "group_commit_window": group_commit_window,
+                         "group_commit_max_batch": group_commit_max_batch,
+                         "verify_index": verify_index}
+        if shards > 0:
+            self.product_manager = ShardedProductManager(
+                xml_file, shards, metrics=self.metrics, verbose=VERBOSE,
+                insertion_delay=insertion_delay, **store_options)
+            log(f"[SERVER] Catálogo repartido en {shards} particiones "
+                f"({self.product_manager.loaded} productos)")
+        else:
+            check_shard_count(xml_file, 0)  # Un catálogo repartido solo se abre con particiones
+            self.product_manager = ProductManager(xml_file, insertion_delay=insertion_delay,
+                                                  metrics=self.metrics, **store_options)
+        if capacity is None:
+            capacity = {PRIORITY_INSERT: QUEUE_CAPACITY, PRIORITY_QUERY: QUEUE_CAPACITY}
+        self.scheduler = PriorityScheduler((PRIORITY_INSERT, PRIORITY_QUERY),
+                                           max_wait=max_wait, weights=weights,
+                                           capacity=capacity)
+        self.rate_limiter = ClientRateLimiter(*rate_limit) if rate_limit else None
+        self.tracer = tracer
+        self.capture = capture
+        self.num_workers = 1
+        self.priority_queue = SchedulerQueue(self.scheduler)
+        self._async_queue: Optional[AsyncSchedulerQueue] = None
+        self.pool: Optional[WorkerPool] = None
         self.running = False
         self.worker_lock = threading.Lock()
+        # Consultas idénticas en cola: clave -> [(respuesta, traza, instante)] que esperan
+        # el resultado de la primera (ver `_enqueue`)
+        self._flights: Dict[Tuple, List[Tuple[Callable[[Dict], None],
+                                              Optional[trazas.Span], float]]] = {}
+        self._flights_lock = threading.Lock()
+        
+        # Métricas ligadas una sola vez para que registrar sea barato
+        self.metrics.gauge("rpc_queue_depth", "Solicitudes en la cola de prioridades",
+                           function=self._queue_depth)
+        self._depth_at_enqueue = self.metrics.histogram(
+            "rpc_queue_depth_at_enqueue", "Profundidad de la cola al encolar",
+            buckets=SIZE_BUCKETS)
+        self._queue_wait = {
+            priority: self.metrics.histogram(
+                "rpc_queue_wait_seconds", "Tiempo desde que se encola hasta que se atiende",
+                priority=priority)
+            for priority in (PRIORITY_INSERT, PRIORITY_QUERY)
+        }
+        self._service_time = {
+            priority: self.metrics.histogram(
+                "rpc_service_seconds", "Tiempo de procesamiento de una solicitud",
+                priority=priority)
+            for priority in (PRIORITY_INSERT, PRIORITY_QUERY)
+        }
+        for priority in (PRIORITY_INSERT, PRIORITY_QUERY):
+            self.metrics.counter("rpc_scheduler_aged_total",
+                                 "Solicitudes adelantadas por envejecimiento",
+                                 function=functools.partial(self.scheduler.aged.get, priority),
+                                 priority=priority)
+        self._rejected = {
+            (reason, priority): self.metrics.counter(
+                "rpc_rejected_total", "Solicitudes rechazadas o descartadas por sobrecarga",
+                reason=reason, priority=priority)
+            for reason in ("queue_full", "rate_limited", "deadline", "indexing")
+            for priority in (PRIORITY_INSERT, PRIORITY_QUERY)
+        }
+        self._coalesced = self.metrics.counter(
+            "rpc_coalesced_total", "Consultas respondidas con el resultado de otra idéntica en cola")
+        if tracer is not None:
+            self.metrics.counter("rpc_traces_written_total", "Trazas escritas en el archivo",
+                                 function=lambda: tracer.written)
+            self.metrics.counter("rpc_traces_dropped_total",
+                                 "Trazas descartadas por cola de escritura llena",
+                                 function=lambda: tracer.dropped)
+        if capture is not None:
+            self.metrics.counter("rpc_captured_total", "Solicitudes guardadas en la captura",
+                                 function=lambda: capture.written)
+        self._bytes_in = self.metrics.counter("rpc_bytes_received_total", "Bytes recibidos")
+        self._bytes_out = self.metrics.counter("rpc_bytes_sent_total", "Bytes enviados")
+        
+        # Replicación: suscripciones de réplicas (primario) o seguidor (réplica)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._replication_streams: List[ReplicationStream] = []
+        self.metrics.gauge("replication_subscribers", "Réplicas suscritas a este servidor",
+                           function=lambda: len(self._replication_streams))
+        self.follower: Optional[ReplicaFollower] = None
+        if primary is not None:
+            if shards > 0:
+                raise ValueError("Una réplica no puede usar particiones")
+            self.follower = ReplicaFollower(self.product_manager, primary, self.metrics, log)
+    
+    def _queue_depth(self) -> int:
+        """Solicitudes en la cola del modo en ejecución"""
+        return len(self.scheduler)
+    
+    def _count_request(self, operation: Optional[str]):
+        """Cuenta una solicitud recibida por operación"""
+        if operation not in KNOWN_OPERATIONS:
+            operation = "desconocida"  # Acotar los valores de la etiqueta
+        self.metrics.counter("rpc_requests_total", "Solicitudes recibidas por operación",
+                             operation=operation).inc()
+    
+    def _stats_response(self) -> Dict:
+        """Respuesta de la operación `stats`"""
+        stats = {"status": "success", "stats": self.metrics.snapshot()}
+        if self.pool is not None:
+            stats["workers"] = self.pool.status()
+        return stats
+    
+    def _wait_replicated(self, params: Dict):
+        """
+        En una réplica, comprueba que ya se aplicó `params.min_position`
+        (lectura de las propias escrituras)
         
-    def _process_request(self, request_data: bytes, client_address: Tuple[str, int]) -> bytes:
+        No espera: `_park_replica_read` retiene la consulta fuera de la
+        cola hasta que se aplica la posición, así que aquí solo falla si
+        ha vencido el plazo.
+        """
+        min_position = params.get("min_position")
+        if min_position is None or self.follower is None:
+            return
+        if self.product_manager.size <= int(min_position):
+            raise RuntimeError(f"La réplica no alcanzó la posición {min_position} "
+                               f"en {REPLICA_WAIT_TIMEOUT}s")
+    
+    def _park_replica_read(self, put: Callable, entry: Tuple[int, tuple]) -> bool:
+        """
+        En una réplica, aparca una consulta cuyo `min_position` aún no se
+        ha aplicado en lugar de encolarla
+        
+        El thread de replicación la vuelve a encolar con `put` al aplicar
+        la posición; si pasan `REPLICA_WAIT_TIMEOUT` segundos se responde
+        con error sin que haya ocupado un worker.
+        
+        Las aparcadas cuentan para la capacidad de su prioridad junto con
+        las que están en cola.
+        
+        Returns:
+            True si se aparcó
+        
+        Raises:
+            queue.Full: Si la prioridad ya está llena
+        """
+        if self.follower is None:
+            return False
+        priority, (request, client_address, reply, span) = entry
+        params = request.get("params")
+        if request.get("operation") not in MIN_POSITION_OPERATIONS or \
+                not isinstance(params, dict):
+            return False
+        try:
+            min_position = int(params["min_position"])
+        except (KeyError, TypeError, ValueError):
+            return False  # Sin posición, o inválida: el worker responde el error
+        if self.product_manager.size > min_position:
+            return False
+        limit = self.scheduler.capacity.get(priority)
+        if limit is not None and \
+                len(self.follower.parked) + self.scheduler.depth(priority) >= limit:
+            raise queue.Full
+        
+        def expired():
+            response = {"status": "error",
+                        "message": f"La réplica no alcanzó la posición {min_position} "
+                                   f"en {REPLICA_WAIT_TIMEOUT}s"}
+            reply(response)
+            self._finish_span(span, response)
+        
+        return self.follower.parked.park(min_position + 1,
+                                         functools.partial(self._call_in_loop,
+                                                           self._enqueue, put, entry),
+                                         functools.partial(self._call_in_loop, expired))
+    
+    def _call_in_loop(self, function: Callable, *args):
+        """Llama a `function` en el bucle de eventos en modo asyncio, o aquí en modo threads"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(function, *args)
+        else:
+            function(*args)
+    
+    def _replication_status(self) -> Dict:
+        """Respuesta de `replication_status`: rol del servidor y retraso"""
+        if self.follower is not None:
+            return {"status": "success", "role": "replica", **self.follower.status()}
+        size = self.product_manager.size if isinstance(self.product_manager,
+                                                       ProductManager) else None
+        return {
+            "status": "success",
+            "role": "primary",
+            "size": size,
+            "replicas": [{"address": str(stream.address), "sent": stream.sent,
+                          "lag_entries": size - stream.sent}
+                         for stream in self._replication_streams],
+        }
+    
+    def _start_replication(self, connection: FramedConnection, request_id: int,
+                           params: Dict, client_address: Tuple[str, int]):
+        """
+        Suscribe una réplica: sus entradas se envían desde un thread propio
+        con mensajes sucesivos para `request_id` (ver `replicacion.py`)
+        """
+        if self.follower is not None or not isinstance(self.product_manager, ProductManager):
+            raise ValueError("Este servidor no puede actuar de primario")
+        start = int(params.get("from", 0))
+        if start > self.product_manager.size or \
+                (start > 0 and self.product_manager.id_at(start - 1) != params.get("last_id")):
+            raise ValueError("La réplica diverge del primario; hay que reconstruirla")
+        
+        reply = functools.partial(connection.reply, request_id,
+                                  {"status": "success", "entries": [], "end": True})
+        push = functools.partial(connection.push, request_id)
+        if self._loop is not None:
+            # En modo asyncio solo el bucle de eventos puede escribir en la conexión
+            loop = self._loop
+            
+            async def push_drained(message: Dict, _push=push) -> bool:
+                if not _push(message):
+                    return False
+                await connection.drain()
+                return True
+            
+            def push(message: Dict) -> bool:
+                # Esperar al drenaje: una réplica lenta frena su propio envío
+                # en lugar de acumular mensajes en el búfer del primario
+                try:
+                    sent = asyncio.run_coroutine_threadsafe(
+                        push_drained(message), loop).result(SEND_TIMEOUT * 2)
+                except (ConnectionError, FutureTimeoutError) as e:
+                    log(f"[REPLICA] Réplica {client_address} demasiado retrasada: {e}")
+                    return False
+                except RuntimeError:
+                    return False  # Bucle de eventos cerrado: el servidor se detiene
+                return sent and self.running
+            
+            def reply(_reply=reply):
+                loop.call_soon_threadsafe(_reply)
+        
+        def finish():
+            self._replication_streams.remove(stream)
+            log(f"[REPLICA] Réplica {client_address} desconectada")
+            reply()
+        
+        stream = ReplicationStream(self.product_manager, start, push, finish,
+                                   client_address, log)
+        self._replication_streams.append(stream)
+        connection.on_finish(stream.stop)
+        log(f"[REPLICA] Réplica {client_address} suscrita desde la posición {start}")
+        stream.start()
+    
+    
+    def _process_request(self, request: Dict, client_address: Tuple[str, int]) -> Dict:
         """
         Procesa una solicitud RPC y devuelve la respuesta
         
         Args:
-            request_data: Datos de la solicitud en formato JSON
+            request: Solicitud ya decodificada
             client_address: Dirección del cliente
-            
+        
         Returns:
-            Respuesta en formato JSON como bytes
+            Respuesta como diccionario
         """
         try:
-            request = json.loads(request_data.decode('utf-8'))
             operation = request.get("operation")
             params = request.get("params", {})
             
+            if self.follower is not None and operation in INSERT_OPERATIONS:
+                return {"status": "error",
+                        "message": f"Réplica de solo lectura; inserte en el primario "
+                                   f"{self.follower.primary}"}
+            
             if operation == "insert":
                 product_id = params.get("id")
                 nombre = params.get("nombre")
-                precio = params.get("precio")
+                precio = validate_product(product_id, nombre, params.get("precio"))
                 position = self.product_manager.insert_product(product_id, nombre, precio)
                 response = {"status": "success", "position": position}
-                
+            
             elif operation == "query":
+                self._wait_replicated(params)
                 product_id = params.get("id")
                 position = self.product_manager.query_product(product_id)
                 response = {"status": "success", "position": position}
-                
+            
+            elif operation == "insert_many":
+                products = [(p.get("id"), p.get("nombre"),
+                             validate_product(p.get("id"), p.get("nombre"), p.get("precio")))
+                            for p in params.get("products", [])]
+                positions = self.product_manager.insert_products(products)
+                response = {"status": "success", "positions": positions}
+            
+            elif operation == "query_many":
+                self._wait_replicated(params)
+                positions = self.product_manager.query_products(params.get("ids", []))
+                response = {"status": "success", "positions": positions}
+            
+            elif operation == "query_price_range":
+                self._wait_replicated(params)
+                positions, more = self.product_manager.query_price_range(
+                    params.get("min"), params.get("max"), params.get("offset", 0),
+                    params.get("limit", DEFAULT_RANGE_LIMIT))
+                response = {"status": "success", "positions": positions, "more": more}
+            
+            elif operation == "query_name_prefix":
+                self._wait_replicated(params)
+                positions, more = self.product_manager.query_name_prefix(
+                    params.get("prefix"), params.get("offset", 0),
+                    params.get("limit", DEFAULT_RANGE_LIMIT))
+                response = {"status": "success", "positions": positions, "more": more}
+            
+            elif operation == "stats":
+                response = self._stats_response()
+            
+            elif operation == "ping":
+                response = {"status": "success"}
+            
+            elif operation == "replication_status":
+                response = self._replication_status()
+            
             else:
                 response = {"status": "error", "message": f"Operación desconocida: {operation}"}
-                
+        
+        except ServerBusy as e:
+            # Sin esperar en el worker: el cliente reintenta tras `retry_after`
+            self._rejected[e.reason, self._get_priority(operation)].inc()
+            response = e.response()
+        
         except Exception as e:
             response = {"status": "error", "message": str(e)}
         
-        return json.dumps(response).encode('utf-8')
+        return response
     
-    def _worker_thread(self):
-        """Thread worker que procesa solicitudes de la cola de prioridades"""
-        while self.running:
+    def _handle_entry(self, entry: Tuple[int, tuple, float]):
+        """Procesa una solicitud desencolada por un worker del pool y responde"""
+        priority, (request, client_address, reply, span), enqueued = entry
+        start = time.perf_counter()
+        self._queue_wait[priority].observe(start - enqueued)
+        if span is not None:
+            span.mark("dequeued")
+        followers = self._take_followers(priority, request, start)
+        if self._expired(priority, request, enqueued, start, reply, span):
+            return
+        log(f"[WORKER] Procesando solicitud con prioridad {priority} de {client_address}")
+        response = self._process_traced(request, client_address, span)
+        self._service_time[priority].observe(time.perf_counter() - start)
+        
+        # Enviar respuesta al cliente (y a las consultas idénticas agrupadas)
+        try:
+            reply(response)
+            self._finish_span(span, response)
+        finally:
+            self._reply_followers(followers, response)
+    
+    @staticmethod
+    def _get_priority(operation: Optional[str]) -> int:
+        """Determina la prioridad de una operación (inserciones primero)"""
+        if operation in INSERT_OPERATIONS:
+            return PRIORITY_INSERT
+        return PRIORITY_QUERY  # Consultas y operaciones desconocidas
+    
+    def _prioritize(self, request: Dict, client_address: Tuple[str, int],
+                    reply: Callable[[Dict], None], received: Optional[float] = None,
+                    accepted: Optional[float] = None) -> Optional[Tuple[int, tuple]]:
+        """
+        Construye la entrada de cola de una solicitud ya decodificada
+        
+        Si el cliente superó su límite de solicitudes responde `busy` de
+        inmediato y no la encola.
+        
+        Args:
+            received: Instante (`time.monotonic`) en que se leyó la solicitud
+            accepted: Instante en que se aceptó su conexión (formato anterior)
+        
+        Returns:
+            Tupla (prioridad, (solicitud, dirección, función de respuesta,
+            traza o None)), o None si ya se respondió
+        """
+        operation = request.get("operation")
+        priority = self._get_priority(operation)
+        self._count_request(operation)
+        if received is None:
+            received = time.monotonic()
+        if self.capture is not None:
+            reply = self.capture.wrap(request, received, reply)
+        span = None
+        if self.tracer is not None:
+            span = self.tracer.start(operation, request.get("client_id"), received, accepted)
+            if span is not None:
+                span.priority = priority
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.acquire(str(request.get("client_id") or client_address[0]))
+            if wait:
+                self._rejected["rate_limited", priority].inc()
+                response = busy_response("rate_limited", wait,
+                                         "Límite de solicitudes del cliente superado")
+                reply(response)
+                self._finish_span(span, response)
+                return None
+        self._depth_at_enqueue.observe(self._queue_depth())
+        log(f"[SERVER] Solicitud {operation} de {client_address} agregada a cola con prioridad {priority}")
+        if span is not None:
+            span.mark("enqueued")
+        return priority, (request, client_address, reply, span)
+    
+    def _process_traced(self, request: Dict, client_address: Tuple[str, int],
+                        span: Optional[trazas.Span]) -> Dict:
+        """`_process_request` con `span` como traza activa del thread"""
+        if span is None:
+            return self._process_request(request, client_address)
+        with trazas.activate(span):
+            response = self._process_request(request, client_address)
+        span.mark("processed")
+        return response
+    
+    def _finish_span(self, span: Optional[trazas.Span], response: Dict):
+        """Cierra la traza de una solicitud ya respondida"""
+        if span is not None:
+            span.mark("sent")
+            self.tracer.finish(span, response.get("error") or response.get("status"))
+    
+    def _enqueue(self, put: Callable, entry: Optional[Tuple[int, tuple]]):
+        """
+        Encola una entrada de `_prioritize` con `put`; si su prioridad está
+        llena responde `busy` con una espera estimada
+        
+        En una réplica, una consulta con `min_position` aún no aplicado se
+        aparca hasta que llegue (`_park_replica_read`).
+        
+        Una consulta idéntica a otra que sigue en cola no se encola: espera
+        el resultado de aquella (single-flight). El grupo se cierra cuando
+        un worker desencola la primera, así que nadie recibe un resultado
+        calculado antes de que llegara su consulta.
+        """
+        if entry is None:
+            return
+        priority, (request, client_address, reply, span) = entry
+        try:
+            if self._park_replica_read(put, entry):
+                return
+        except queue.Full:
+            self._reject_full(priority, client_address, reply, span)
+            return
+        key = self._flight_key(request)
+        if key is not None:
+            with self._flights_lock:
+                followers = self._flights.get(key)
+                if followers is not None:
+                    followers.append((reply, span, time.perf_counter()))
+                    self._coalesced.inc()
+                    return
+                self._flights[key] = []
+        try:
+            put(*entry)
+        except queue.Full:
+            response = self._reject_full(priority, client_address, reply, span)
+            if key is not None:
+                with self._flights_lock:
+                    followers = self._flights.pop(key, [])
+                self._reply_followers(followers, response)
+    
+    def _reject_full(self, priority: int, client_address: Tuple[str, int],
+                     reply: Callable[[Dict], None], span: Optional[trazas.Span]) -> Dict:
+        """Responde `busy` a una solicitud que no cabe en su prioridad y devuelve la respuesta"""
+        self._rejected["queue_full", priority].inc()
+        log(f"[SERVER] Cola de prioridad {priority} llena; solicitud de "
+            f"{client_address} rechazada")
+        response = busy_response("queue_full", self._retry_after(priority),
+                                 f"Servidor saturado (cola de prioridad {priority} llena)")
+        reply(response)
+        self._finish_span(span, response)
+        return response
+    
+    @staticmethod
+    def _flight_key(request: Dict) -> Optional[Tuple]:
+        """
+        Clave con la que se agrupan las consultas idénticas, o None si la
+        solicitud no se agrupa (solo `query` sin plazo propio)
+        """
+        if request.get("operation") != "query" or "deadline_ms" in request:
+            return None
+        params = request.get("params", {})
+        product_id = params.get("id")
+        if not isinstance(product_id, str) or not set(params) <= {"id", "min_position"}:
+            return None
+        return product_id, params.get("min_position")
+    
+    def _take_followers(self, priority: int, request: Dict, now: float) -> List[Tuple]:
+        """Cierra el grupo de una consulta recién desencolada y devuelve las agrupadas"""
+        key = self._flight_key(request)
+        if key is None:
+            return []
+        with self._flights_lock:
+            followers = self._flights.pop(key, [])
+        for _, span, enqueued in followers:
+            self._queue_wait[priority].observe(now - enqueued)
+            if span is not None:
+                span.mark("dequeued")
+        return followers
+    
+    def _reply_followers(self, followers: List[Tuple], response: Dict):
+        """Envía a las consultas agrupadas la respuesta de la primera"""
+        for reply, span, _ in followers:
+            if span is not None:
+                span.mark("processed")
             try:
-                priority, (request_data, client_address, client_socket) = \
-                    self.priority_queue.get(timeout=1)
-                
-                print(f"[WORKER] Procesando solicitud con prioridad {priority} de {client_address}")
-                response = self._process_request(request_data, client_address)
-                
-                # Enviar respuesta al cliente
-                client_socket.sendall(response)
-                client_socket.close()
-                
-                self.priority_queue.task_done()
-                
-            except queue.Empty:
-                continue
+                reply(response)
             except Exception as e:
-                print(f"[ERROR] Error en worker thread: {e}")
+                log(f"[ERROR] Error respondiendo una consulta agrupada: {e}")
+            self._finish_span(span, response)
+    
+    def _retry_after(self, priority: int) -> float:
+        """Segundos estimados para vaciar la cola de `priority` con los workers actuales"""
+        service = self._service_time[priority]
+        mean = service.sum / service.count if service.count else 0.0
+        workers = self.num_workers
+        if self.pool is not None:
+            workers = self.pool.size + self.pool.reserved.get(priority, 0)
+        return clamp_retry_after(self.scheduler.depth(priority) * mean / max(1, workers))
+    
+    def _expired(self, priority: int, request: Dict, enqueued: float, now: float,
+                 reply: Callable[[Dict], None], span: Optional[trazas.Span] = None) -> bool:
+        """
+        Descarta (respondiendo el error) una solicitud cuyo `deadline_ms`
+        venció mientras esperaba en cola
+        """
+        deadline_ms = request.get("deadline_ms")
+        if deadline_ms is None or now - enqueued <= deadline_ms / 1e3:
+            return False
+        self._rejected["deadline", priority].inc()
+        log(f"[WORKER] Solicitud {request.get('operation')} descartada: plazo de "
+            f"{deadline_ms} ms vencido en cola")
+        response = deadline_response(now - enqueued)
+        reply(response)
+        self._finish_span(span, response)
+        return True
+    
+    def _on_frame(self, connection: FramedConnection, request_id: int, data: bytes,
+                  client_address: Tuple[str, int]) -> Optional[Tuple[int, tuple]]:
+        """
+        Decodifica un mensaje enmarcado (una sola vez) y prepara su respuesta
+        
+        La negociación de códec (`hello`), la consulta de métricas (`stats`),
+        el chequeo de salud (`ping`) y los mensajes inválidos se responden de
+        inmediato, sin pasar por la cola, de modo que responden aunque la
+        cola esté saturada.
+        
+        Returns:
+            Entrada para la cola de prioridades, o None si ya se respondió
+        """
+        received = time.monotonic()
+        self._bytes_in.inc(FRAME_HEADER.size + len(data))
+        connection.register()
+        reply = functools.partial(connection.reply, request_id)
+        try:
+            request = connection.codec.decode(data)
+            operation = request.get("operation")
+            if operation == "hello":
+                self._count_request(operation)
+                codec = choose_codec(request.get("params", {}).get("codecs", []))
+                reply({"status": "success", "codec": codec.name, "storage": APPEND_ONLY})
+                connection.codec = codec
+                return None
+            if operation == "stats":
+                self._count_request(operation)
+                reply(self._stats_response())
+                return None
+            if operation == "ping":
+                self._count_request(operation)
+                reply({"status": "success"})
+                return None
+            if operation == "replication_status":
+                self._count_request(operation)
+                reply(self._replication_status())
+                return None
+            if operation == "replicate":
+                self._count_request(operation)
+                self._start_replication(connection, request_id,
+                                        request.get("params", {}), client_address)
+                return None
+            return self._prioritize(request, client_address, reply, received)
+        except Exception as e:
+            reply({"status": "error", "message": str(e)})
+            return None
     
-    def _handle_client(self, client_socket: socket.socket, client_address: Tuple[str, int]):
+    @staticmethod
+    def _try_decode(data: bytes) -> Optional[Dict]:
+        """Decodifica una solicitud JSON, o None si todavía está incompleta"""
+        try:
+            return JSONCodec.decode(data)
+        except ValueError:
+            return None
+    
+    def _read_legacy_request(self, client_socket: socket.socket) -> Dict:
+        """Lee y decodifica una solicitud en el formato anterior (un JSON por conexión)"""
+        data = b""
+        while True:
+            chunk = client_socket.recv(4096)
+            if not chunk:
+                request = JSONCodec.decode(data)
+                break
+            data += chunk
+            request = self._try_decode(data)
+            if request is not None:
+                break
+        self._bytes_in.inc(len(data))
+        return request
+    
+    def _handle_client(self, client_socket: socket.socket, client_address: Tuple[str, int],
+                       accepted: Optional[float] = None):
         """
         Maneja la conexión de un cliente
         
+        Una conexión en el formato anterior lleva una única solicitud y se
+        cierra tras responder; una conexión enmarcada se mantiene abierta y
+        puede llevar muchas solicitudes en curso a la vez.
+        
         Args:
             client_socket: Socket del cliente
             client_address: Dirección del cliente
+            accepted: Instante (`time.monotonic`) en que se aceptó la conexión
         """
         try:
-            # Recibir datos del cliente
-            data = client_socket.recv(4096)
-            if not data:
+            # Detectar el formato sin consumir datos
+            first_byte = client_socket.recv(1, socket.MSG_PEEK)
+            if not first_byte:
+                client_socket.close()
                 return
             
-            request = json.loads(data.decode('utf-8'))
-            operation = request.get("operation")
+            if is_legacy(first_byte):
+                request = self._read_legacy_request(client_socket)
+                received = time.monotonic()
+                
+                def reply(response: Dict):
+                    try:
+                        payload = JSONCodec.encode(response)
+                        client_socket.sendall(payload)
+                        self._bytes_out.inc(len(payload))
+                    finally:
+                        client_socket.close()
+                
+                self._enqueue(self.priority_queue.put,
+                              self._prioritize(request, client_address, reply, received, accepted))
+                return
             
-            # Determinar prioridad (inserciones tienen mayor prioridad)
-            if operation == "insert":
-                priority = PRIORITY_INSERT
-            elif operation == "query":
-                priority = PRIORITY_QUERY
-            else:
-                priority = PRIORITY_QUERY  # Default
+            # Un cliente que no lee sus respuestas no debe retener a los workers
+            set_send_timeout(client_socket, SEND_TIMEOUT)
             
-            # Agregar a la cola de prioridades
-            self.priority_queue.put((priority, (data, client_address, client_socket)))
-            print(f"[SERVER] Solicitud {operation} de {client_address} agregada a cola con prioridad {priority}")
+            def send(data: bytes):
+                # SO_SNDTIMEO limita cada `send`; el plazo total evita que un cliente
+                # que lee con cuentagotas retenga al worker indefinidamente
+                deadline = time.monotonic() + SEND_TIMEOUT
+                view = memoryview(data)
+                try:
+                    while view:
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"El cliente no leyó su respuesta en "
+                                               f"{SEND_TIMEOUT}s")
+                        view = view[client_socket.send(view):]
+                except OSError as e:
+                    log(f"[SERVER] Conexión con {client_address} cortada al responder: {e}")
+                    try:
+                        client_socket.shutdown(socket.SHUT_RDWR)  # Despierta al lector
+                    except OSError:
+                        pass
+                    raise
             
+            connection = FramedConnection(send, client_socket.close, self._bytes_out)
+            try:
+                while self.running:
+                    # Contrapresión: con demasiadas respuestas pendientes, dejar de leer
+                    if not connection.wait_for_room(MAX_IN_FLIGHT):
+                        break
+                    frame = read_frame(client_socket)
+                    if frame is None:
+                        break
+                    self._enqueue(self.priority_queue.put,
+                                  self._on_frame(connection, *frame, client_address))
+            finally:
+                connection.finish_reading()
+        
         except Exception as e:
-            print(f"[ERROR] Error manejando cliente {client_address}: {e}")
+            log(f"[ERROR] Error manejando cliente {client_address}: {e}")
             client_socket.close()
     
-    def start(self, num_workers: int = 3):
+    def start(self, num_workers: int = 3, max_workers: Optional[int] = None,
+              reserved: Optional[Dict[int, int]] = None, **scaling):
         """
         Inicia el servidor con workers para procesar solicitudes
         
         Args:
-            num_workers: Número de threads worker para procesar solicitudes
+            num_workers: Número mínimo de threads worker generales
+            max_workers: Máximo al que crece el pool con la cola llena
+                (None: pool fijo de `num_workers`)
+            reserved: Workers adicionales dedicados a cada prioridad
+            **scaling: Umbrales de `WorkerPool` (scale_up_depth, scale_up_wait,
+                idle_timeout)
         """
         self.running = True
+        self.num_workers = num_workers
+        if self.follower is not None:
+            self.follower.start()
         
-        # Crear threads worker
-        for i in range(num_workers):
-            worker = threading.Thread(target=self._worker_thread, daemon=True)
-            worker.start()
-            self.worker_threads.append(worker)
-            print(f"[SERVER] Worker thread {i+1} iniciado")
+        # Crear el pool de workers
+        self.pool = WorkerPool(self.priority_queue, self._handle_entry, num_workers,
+                               max_workers, reserved, metrics=self.metrics, log=log,
+                               **scaling)
+        self.pool.start()
         
         # Crear socket del servidor
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -235,41 +1770,287 @@ class RPCServer:
         server_socket.bind((self.host, self.port))
         server_socket.listen(5)
         
-        print(f"[SERVER] Servidor RPC iniciado en {self.host}:{self.port}")
-        print(f"[SERVER] Esperando conexiones...")
+        log(f"[SERVER] Servidor RPC iniciado en {self.host}:{self.port}")
+        log(f"[SERVER] Esperando conexiones...")
         
         try:
             while self.running:
                 client_socket, client_address = server_socket.accept()
-                print(f"[SERVER] Nueva conexión de {client_address}")
+                accepted = time.monotonic()
+                log(f"[SERVER] Nueva conexión de {client_address}")
                 
                 # Crear thread para manejar cada cliente
                 client_thread = threading.Thread(
                     target=self._handle_client,
-                    args=(client_socket, client_address),
+                    args=(client_socket, client_address, accepted),
                     daemon=True
                 )
                 client_thread.start()
+        
+        except KeyboardInterrupt:
+            log("\n[SERVER] Deteniendo servidor...")
+            self.stop()
+    
+    async def _handle_client_async(self, reader: asyncio.StreamReader,
+                                   writer: asyncio.StreamWriter):
+        """
+        Maneja la conexión de un cliente en el modo asyncio
+        
+        Args:
+            reader: Flujo de lectura de la conexión
+            writer: Flujo de escritura de la conexión
+        """
+        accepted = time.monotonic()
+        client_address = writer.get_extra_info("peername")
+        log(f"[SERVER] Nueva conexión de {client_address}")
+        try:
+            first_byte = await reader.read(1)
+            if not first_byte:
+                writer.close()
+                return
+            
+            if is_legacy(first_byte):
+                data = first_byte
+                request = self._try_decode(data)
+                while request is None:
+                    chunk = await reader.read(4096)
+                    if not chunk:
+                        request = JSONCodec.decode(data)
+                        break
+                    data += chunk
+                    request = self._try_decode(data)
+                self._bytes_in.inc(len(data))
+                received = time.monotonic()
+                
+                def reply(response: Dict):
+                    payload = JSONCodec.encode(response)
+                    writer.write(payload)
+                    self._bytes_out.inc(len(payload))
+                    writer.close()
                 
+                self._enqueue(self._async_queue.put_nowait,
+                              self._prioritize(request, client_address, reply, received, accepted))
+                return
+            
+            async def drain():
+                try:
+                    await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+                except asyncio.TimeoutError:
+                    writer.transport.abort()  # Descarta el búfer y corta también la lectura
+                    raise ConnectionError(f"El cliente no leyó sus respuestas "
+                                          f"en {SEND_TIMEOUT}s") from None
+            
+            connection = FramedConnection(writer.write, writer.close, self._bytes_out, drain)
+            prefix = first_byte
+            try:
+                while self.running:
+                    # Contrapresión: si el cliente no lee sus respuestas y el búfer de
+                    # escritura supera su límite, dejar de leer solicitudes suyas
+                    await connection.drain()
+                    frame = await read_frame_async(reader, prefix)
+                    prefix = b""
+                    if frame is None:
+                        break
+                    self._enqueue(self._async_queue.put_nowait,
+                                  self._on_frame(connection, *frame, client_address))
+            finally:
+                connection.finish_reading()
+        
+        except Exception as e:
+            log(f"[ERROR] Error manejando cliente {client_address}: {e}")
+            writer.close()
+    
+    async def _async_worker(self):
+        """Corrutina worker que procesa solicitudes de la cola de prioridades"""
+        loop = asyncio.get_running_loop()
+        while self.running:
+            priority, (request, client_address, reply, span), enqueued = \
+                await self._async_queue.get()
+            try:
+                start = time.perf_counter()
+                self._queue_wait[priority].observe(start - enqueued)
+                if span is not None:
+                    span.mark("dequeued")
+                followers = self._take_followers(priority, request, start)
+                if self._expired(priority, request, enqueued, start, reply, span):
+                    continue
+                log(f"[WORKER] Procesando solicitud con prioridad {priority} de {client_address}")
+                # El trabajo bloqueante de ProductManager se delega al executor
+                response = await loop.run_in_executor(
+                    self._executor, self._process_traced, request, client_address, span)
+                self._service_time[priority].observe(time.perf_counter() - start)
+                try:
+                    reply(response)
+                    self._finish_span(span, response)
+                finally:
+                    self._reply_followers(followers, response)
+            except Exception as e:
+                log(f"[ERROR] Error en worker asyncio: {e}")
+    
+    async def _serve_async(self, num_workers: int):
+        """Bucle principal del modo asyncio"""
+        self._loop = asyncio.get_running_loop()
+        self._async_queue = AsyncSchedulerQueue(self.scheduler)
+        self._executor = ThreadPoolExecutor(max_workers=num_workers,
+                                            thread_name_prefix="rpc-worker")
+        workers = [asyncio.create_task(self._async_worker()) for _ in range(num_workers)]
+        log(f"[SERVER] {num_workers} workers asyncio iniciados")
+        
+        server = await asyncio.start_server(self._handle_client_async, self.host, self.port,
+                                            backlog=ASYNC_BACKLOG)
+        log(f"[SERVER] Servidor RPC (asyncio) iniciado en {self.host}:{self.port}")
+        log(f"[SERVER] Esperando conexiones...")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self._executor.shutdown(wait=False)
+    
+    def start_async(self, num_workers: int = 3):
+        """
+        Inicia el servidor sobre un bucle de eventos asyncio
+        
+        La lectura, la planificación por prioridad y la escritura de
+        respuestas ocurren en el bucle de eventos; el trabajo sobre
+        ProductManager se ejecuta en un executor de `num_workers` threads.
+        
+        Args:
+            num_workers: Número de solicitudes procesadas en paralelo
+        """
+        self.running = True
+        self.num_workers = num_workers
+        if self.follower is not None:
+            self.follower.start()
+        try:
+            asyncio.run(self._serve_async(num_workers))
         except KeyboardInterrupt:
-            print("\n[SERVER] Deteniendo servidor...")
+            log("\n[SERVER] Deteniendo servidor...")
             self.stop()
     
     def stop(self):
         """Detiene el servidor"""
         self.running = False
-        print("[SERVER] Servidor detenido")
+        if self.pool is not None:
+            self.pool.stop()
+        if self.follower is not None:
+            self.follower.stop()
+        for stream in list(self._replication_streams):
+            stream.stop()
+        self.product_manager.close()
+        if self.tracer is not None:
+            self.tracer.close()
+        if self.capture is not None:
+            self.capture.close()
+        log("[SERVER] Servidor detenido")
 
 
 def main():
     """Función principal del servidor"""
-    server = RPCServer(HOST, PORT, XML_FILE)
+    global VERBOSE
+    parser = argparse.ArgumentParser(description="Servidor RPC asíncrono de productos")
+    parser.add_argument("--modo", choices=["threads", "asyncio"], default="threads",
+                        help="threads: un thread por conexión; asyncio: bucle de eventos")
+    parser.add_argument("--workers", type=int, default=3,
+                        help="Número de workers que procesan solicitudes")
+    parser.add_argument("--workers-max", type=int, default=None,
+                        help="Máximo de workers al que crece el pool con la cola cargada "
+                             "(por defecto, --workers: pool fijo; solo modo threads)")
+    parser.add_argument("--reserva", default=None,
+                        help="Workers adicionales dedicados a una prioridad, p. ej. '2:1' "
+                             "(solo modo threads)")
+    parser.add_argument("--umbral-cola", type=int, default=SCALE_UP_DEPTH,
+                        help="Solicitudes en cola por cada worker que se añade")
+    parser.add_argument("--umbral-espera", type=float, default=SCALE_UP_WAIT,
+                        help="Segundos de espera en cola que hacen crecer el pool")
+    parser.add_argument("--host", default=HOST, help="Dirección de escucha")
+    parser.add_argument("--puerto", type=int, default=PORT, help="Puerto de escucha")
+    parser.add_argument("--xml", default=XML_FILE, help="Archivo XML de productos")
+    parser.add_argument("--retardo", type=float, default=INSERTION_DELAY,
+                        help="Segundos de carga simulada por inserción")
+    parser.add_argument("--sincronizar", action="store_true",
+                        help="fsync del diario tras cada escritura; activa el group commit "
+                             "(ver --ventana-grupo y --lote-grupo)")
+    parser.add_argument("--ventana-grupo", type=float, default=GROUP_COMMIT_WINDOW,
+                        help="Segundos que se esperan inserciones para escribirlas juntas "
+                             "en el diario (por defecto 0: se agrupan las que llegan "
+                             "mientras se escribe el grupo anterior)")
+    parser.add_argument("--lote-grupo", type=int, default=None,
+                        help=f"Máximo de inserciones por escritura agrupada (por defecto "
+                             f"{GROUP_COMMIT_MAX_BATCH} con --sincronizar y 1, sin agrupar, "
+                             f"sin él; la columna \"agrupado\" de bench_group_commit.py sin "
+                             f"fsync equivale a --lote-grupo {GROUP_COMMIT_MAX_BATCH})")
+    parser.add_argument("--verificar", action="store_true",
+                        help="Validar el índice persistido (.idx) con el crc32 del XML "
+                             "completo; por defecto solo se comprueban el tamaño, la "
+                             "fecha y el final del XML")
+    parser.add_argument("--silencioso", action="store_true",
+                        help="No imprimir una traza por solicitud")
+    parser.add_argument("--espera-maxima", type=float, default=MAX_QUEUE_WAIT,
+                        help="Segundos en cola tras los que una solicitud adelanta a las "
+                             "más prioritarias (0 o negativo: prioridad estricta)")
+    parser.add_argument("--pesos", default=None,
+                        help="Reparto ponderado entre prioridades, p. ej. '1:4,2:1'")
+    parser.add_argument("--capacidad", default=None,
+                        help="Máximo de solicitudes en cola por prioridad, p. ej. '1:5000,2:5000' "
+                             f"(0: sin límite; por defecto {QUEUE_CAPACITY} en cada una)")
+    parser.add_argument("--limite-cliente", default=None, metavar="TASA[:RÁFAGA]",
+                        help="Solicitudes por segundo admitidas a cada client_id")
+    parser.add_argument("--trazas", nargs="?", const=trazas.TRACE_FILE, default=None,
+                        metavar="ARCHIVO",
+                        help=f"Escribir trazas por solicitud en JSONL (por defecto "
+                             f"{trazas.TRACE_FILE}; resumen con `python3 trazas.py`)")
+    parser.add_argument("--muestreo", type=float, default=trazas.SAMPLE_RATE,
+                        help="Fracción de solicitudes trazadas (0 a 1)")
+    parser.add_argument("--captura", nargs="?", const=trazas.CAPTURE_FILE, default=None,
+                        metavar="ARCHIVO",
+                        help=f"Guardar las solicitudes recibidas en JSONL para `replay.py` "
+                             f"(por defecto {trazas.CAPTURE_FILE})")
+    parser.add_argument("--particiones", type=int, default=0,
+                        help="Repartir el catálogo entre N procesos (0: un solo proceso)")
+    parser.add_argument("--replica-de", default=None, metavar="HOST:PUERTO",
+                        help="Actuar como réplica de solo lectura de ese primario")
+    parser.add_argument("--puerto-metricas", type=int, default=None,
+                        help="Puerto HTTP donde exponer las métricas en texto plano")
+    args = parser.parse_args()
+    VERBOSE = not args.silencioso
+    
+    weights = None
+    if args.pesos:
+        weights = {int(priority): float(weight) for priority, weight in
+                   (pair.split(":") for pair in args.pesos.split(","))}
+    max_wait = args.espera_maxima if args.espera_maxima > 0 else None
+    capacity = None
+    if args.capacidad:
+        capacity = {int(priority): int(size) for priority, size in
+                    (pair.split(":") for pair in args.capacidad.split(","))}
+    rate_limit = parse_rate(args.limite_cliente) if args.limite_cliente else None
+    reserved = parse_reserved(args.reserva) if args.reserva else None
+    if args.modo == "asyncio" and (args.workers_max or reserved):
+        parser.error("--workers-max y --reserva solo se admiten en modo threads")
+    tracer = trazas.Tracer(args.trazas, args.muestreo) if args.trazas else None
+    capture = trazas.RequestCapture(args.captura) if args.captura else None
+    
+    server = RPCServer(args.host, args.puerto, args.xml, insertion_delay=args.retardo,
+                       max_wait=max_wait, weights=weights, shards=args.particiones,
+                       primary=args.replica_de, capacity=capacity, rate_limit=rate_limit,
+                       tracer=tracer, capture=capture, sync_journal=args.sincronizar,
+                       group_commit_window=args.ventana_grupo,
+                       group_commit_max_batch=args.lote_grupo, verify_index=args.verificar)
+    if args.puerto_metricas is not None:
+        start_metrics_server(server.metrics, args.host, args.puerto_metricas)
+        log(f"[SERVER] Métricas en http://{args.host}:{args.puerto_metricas}/metrics")
     try:
-        server.start(num_workers=3)
+        if args.modo == "asyncio":
+            server.start_async(num_workers=args.workers)
+        else:
+            server.start(num_workers=args.workers, max_workers=args.workers_max,
+                         reserved=reserved, scale_up_depth=args.umbral_cola,
+                         scale_up_wait=args.umbral_espera)
     except KeyboardInterrupt:
         server.stop()
 
 
 if __name__ == "__main__":
     main()
-
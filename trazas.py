@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Trazas por solicitud del servidor RPC y su analizador
+
+Con trazas activas (`servidor.py --trazas`), el servidor anota para una
+muestra de las solicitudes el instante (`time.monotonic()`) en que pasa
+por cada etapa:
+
+    accepted   conexión aceptada (solo formato anterior, una solicitud
+               por conexión)
+    received   mensaje completo leído del socket
+    decoded    solicitud decodificada
+    enqueued   admitida en la cola de prioridades
+    dequeued   tomada por un worker
+    processed  respuesta calculada por ProductManager
+    sent       respuesta escrita en el socket
+
+y, dentro del procesamiento, el tiempo acumulado en la espera del lock
+del catálogo (`lock_wait`), la escritura del diario (`journal_write`) y
+la carga simulada de las inserciones (`simulated_load`). Cada traza lleva
+la operación, el `client_id`, la prioridad y el resultado (`success`,
+`error`, `busy`, `deadline_exceeded`).
+
+Las trazas terminadas se dejan en una cola en memoria y un thread las
+escribe en JSONL cada `FLUSH_INTERVAL` segundos, de modo que el camino
+de la solicitud no espera al disco; si la cola llega a `MAX_PENDING`
+trazas se descartan (y se cuentan) en lugar de bloquear.
+
+Resumen de un archivo de trazas (dónde se va el tiempo por etapa y por
+operación, y las solicitudes más lentas):
+
+    python3 trazas.py [trazas.jsonl]
+
+`RequestCapture` (`servidor.py --captura`) usa el mismo escritor para
+guardar cada solicitud recibida (operación, parámetros, `client_id`,
+instante de llegada) junto con su latencia y su resultado, de modo que
+`replay.py` pueda reproducir el tráfico real contra otro servidor.
+"""
+
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+TRACE_FILE = "trazas.jsonl"  # Archivo de trazas por defecto
+CAPTURE_FILE = "captura.jsonl"  # Archivo de captura de tráfico por defecto
+SAMPLE_RATE = 1.0  # Fracción de solicitudes trazadas
+FLUSH_INTERVAL = 0.5  # Segundos entre escrituras del archivo de trazas
+MAX_PENDING = 100_000  # Trazas en memoria antes de empezar a descartar
+SLOWEST = 5  # Solicitudes más lentas que muestra el analizador
+
+# Etapas entre dos marcas consecutivas: (nombre, marca inicial, marca final)
+STAGES = (
+    ("read", "accepted", "received"),
+    ("decode", "received", "decoded"),
+    ("admission", "decoded", "enqueued"),
+    ("queue", "enqueued", "dequeued"),
+    ("process", "dequeued", "processed"),
+    ("send", "processed", "sent"),
+)
+# Tiempos anotados dentro de la etapa `process`
+PROCESS_TIMES = ("lock_wait", "journal_write", "simulated_load")
+
+_local = threading.local()  # Traza activa en el thread que procesa la solicitud
+
+
+class Span:
+    """Marcas de tiempo de una solicitud trazada"""
+    
+    __slots__ = ("operation", "client_id", "priority", "status", "marks", "times", "wall")
+    
+    def __init__(self, operation: Optional[str], client_id: Optional[str], received: float,
+                 accepted: Optional[float] = None):
+        self.operation = operation
+        self.client_id = client_id
+        self.priority: Optional[int] = None
+        self.status: Optional[str] = None
+        self.marks: Dict[str, float] = {"received": received}
+        if accepted is not None:
+            self.marks["accepted"] = accepted
+        self.times: Dict[str, float] = {}
+        self.wall = time.time()
+    
+    def mark(self, stage: str):
+        """Anota el instante actual como marca `stage`"""
+        self.marks[stage] = time.monotonic()
+    
+    def add(self, name: str, seconds: float):
+        """Acumula un tiempo medido dentro del procesamiento"""
+        self.times[name] = self.times.get(name, 0.0) + seconds
+    
+    def to_dict(self) -> Dict:
+        return {"ts": self.wall, "operation": self.operation, "client_id": self.client_id,
+                "priority": self.priority, "status": self.status, "marks": self.marks,
+                "times": self.times}
+
+
+@contextmanager
+def activate(span: Span):
+    """Hace de `span` la traza activa del thread (ver `add_time`)"""
+    previous = getattr(_local, "span", None)
+    _local.span = span
+    try:
+        yield span
+    finally:
+        _local.span = previous
+
+
+def add_time(name: str, seconds: float):
+    """Acumula `seconds` en la traza activa del thread, si la hay"""
+    span = getattr(_local, "span", None)
+    if span is not None:
+        span.add(name, seconds)
+
+
+class JsonlWriter:
+    """
+    Añade objetos a un archivo JSONL desde un thread propio
+    
+    `write` solo deja el objeto en una cola en memoria; la serialización
+    y la escritura ocurren en el thread escritor cada `flush_interval`
+    segundos. Con `max_pending` objetos en cola los nuevos se descartan.
+    """
+    
+    def __init__(self, path: str, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING,
+                 serialize: Callable[[Any], Dict] = lambda item: item):
+        """
+        Args:
+            path: Archivo JSONL donde se añaden los objetos
+            flush_interval: Segundos entre escrituras
+            max_pending: Objetos en memoria antes de descartar los nuevos
+            serialize: Convierte cada objeto en un diccionario (en el
+                thread escritor)
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._serialize = serialize
+        self._pending: Deque[Any] = deque()
+        self._file = open(path, "a", encoding="utf-8")
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def write(self, item: Any):
+        """Encola un objeto para escribirlo (sin bloquear)"""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(item)
+    
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self._flush()
+    
+    def _flush(self):
+        lines = []
+        while self._pending:
+            lines.append(json.dumps(self._serialize(self._pending.popleft()),
+                                    ensure_ascii=False) + "\n")
+        if lines:
+            self._file.write("".join(lines))
+            self._file.flush()
+            self.written += len(lines)
+    
+    def close(self):
+        """Escribe los objetos pendientes y cierra el archivo"""
+        self._stopped.set()
+        self._thread.join()
+        self._flush()
+        self._file.close()
+
+
+class Tracer:
+    """Muestrea solicitudes y escribe sus trazas en JSONL desde un thread propio"""
+    
+    def __init__(self, path: str = TRACE_FILE, sample_rate: float = SAMPLE_RATE,
+                 flush_interval: float = FLUSH_INTERVAL, max_pending: int = MAX_PENDING):
+        """
+        Args:
+            path: Archivo JSONL donde se añaden las trazas
+            sample_rate: Fracción de solicitudes trazadas (0 a 1)
+            flush_interval: Segundos entre escrituras
+            max_pending: Trazas en memoria antes de descartar las nuevas
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError("La tasa de muestreo debe estar entre 0 (excluido) y 1")
+        self.path = path
+        self.sample_rate = sample_rate
+        self._writer = JsonlWriter(path, flush_interval, max_pending, Span.to_dict)
+    
+    @property
+    def written(self) -> int:
+        return self._writer.written
+    
+    @property
+    def dropped(self) -> int:
+        return self._writer.dropped
+    
+    def start(self, operation: Optional[str], client_id: Optional[str], received: float,
+              accepted: Optional[float] = None) -> Optional[Span]:
+        """
+        Empieza la traza de una solicitud recién decodificada
+        
+        Returns:
+            La traza, o None si la solicitud no entra en la muestra
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+        span = Span(operation, client_id, received, accepted)
+        span.mark("decoded")
+        return span
+    
+    def finish(self, span: Span, status: Optional[str]):
+        """Entrega una traza terminada al thread escritor (sin bloquear)"""
+        span.status = status
+        self._writer.write(span)
+    
+    def close(self):
+        """Escribe las trazas pendientes y cierra el archivo"""
+        self._writer.close()
+
+
+class RequestCapture:
+    """
+    Captura del tráfico recibido para reproducirlo con `replay.py`
+    
+    Cada línea es una solicitud:
+    
+        {"ts": llegada (epoch), "operation": ..., "params": {...},
+         "client_id": ..., "latency_ms": ..., "status": ...}
+    
+    Las líneas se escriben al responder (en orden de respuesta, no de
+    llegada); la latencia va de la lectura de la solicitud a su respuesta
+    y permite estimar la concurrencia original.
+    """
+    
+    def __init__(self, path: str = CAPTURE_FILE, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING):
+        self.path = path
+        self._writer = JsonlWriter(path, flush_interval, max_pending)
+        # Reloj de pared equivalente a time.monotonic() (los intervalos no saltan)
+        self._epoch = time.time() - time.monotonic()
+    
+    @property
+    def written(self) -> int:
+        return self._writer.written
+    
+    @property
+    def dropped(self) -> int:
+        return self._writer.dropped
+    
+    def wrap(self, request: Dict, received: float,
+             reply: Callable[[Dict], None]) -> Callable[[Dict], None]:
+        """Devuelve `reply` de modo que registre la solicitud al responderla"""
+        def captured_reply(response: Dict):
+            reply(response)
+            self._writer.write({
+                "ts": round(self._epoch + received, 6),
+                "operation": request.get("operation"),
+                "params": request.get("params", {}),
+                "client_id": request.get("client_id"),
+                "latency_ms": round((time.monotonic() - received) * 1e3, 3),
+                "status": response.get("error") or response.get("status"),
+            })
+        
+        return captured_reply
+    
+    def close(self):
+        """Escribe las solicitudes pendientes y cierra el archivo"""
+        self._writer.close()
+
+
+def read_traces(path: str) -> Iterator[Dict]:
+    """Recorre las trazas de un archivo JSONL (ignora las líneas inválidas)"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                trace = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(trace, dict) and "marks" in trace:
+                yield trace
+
+
+def stage_times(trace: Dict) -> Dict[str, float]:
+    """
+    Segundos de cada etapa de una traza
+    
+    La etapa `process` se reparte entre los tiempos anotados
+    (`lock_wait`, ...) y el resto (`process`). `total` va de la primera
+    marca a la última.
+    """
+    marks, stages = trace["marks"], {}
+    for name, begin, end in STAGES:
+        if begin in marks and end in marks:
+            stages[name] = marks[end] - marks[begin]
+    if "process" in stages:
+        for name in PROCESS_TIMES:
+            seconds = trace.get("times", {}).get(name)
+            if seconds:
+                stages[name] = seconds
+                stages["process"] -= seconds
+        stages["process"] = max(0.0, stages["process"])
+    stages["total"] = max(marks.values()) - min(marks.values())
+    return stages
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def summarize(traces: Iterator[Dict]) -> Dict:
+    """
+    Resume un conjunto de trazas
+    
+    Returns:
+        {"count", "by_status", "stages": {etapa: segundos}, "by_operation":
+        {operación: {etapa: segundos}}, "slowest": [(total, traza)]}
+    """
+    stages: Dict[str, List[float]] = defaultdict(list)
+    by_operation: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+    by_status: Dict[str, int] = defaultdict(int)
+    slowest: List = []
+    count = 0
+    for trace in traces:
+        count += 1
+        by_status[trace.get("status") or "?"] += 1
+        times = stage_times(trace)
+        for name, seconds in times.items():
+            stages[name].append(seconds)
+            by_operation[trace.get("operation") or "?"][name].append(seconds)
+        slowest.append((times["total"], trace))
+        if len(slowest) > 4 * SLOWEST:
+            slowest = sorted(slowest, key=lambda item: -item[0])[:SLOWEST]
+    return {"count": count, "by_status": dict(by_status), "stages": stages,
+            "by_operation": by_operation,
+            "slowest": sorted(slowest, key=lambda item: -item[0])[:SLOWEST]}
+
+
+def _stage_order(names) -> List[str]:
+    order = [name for name, _, _ in STAGES]
+    order[order.index("process") + 1:order.index("process") + 1] = list(PROCESS_TIMES)
+    return [name for name in order + ["total"] if name in names]
+
+
+def print_summary(summary: Dict):
+    """Imprime el resumen de `summarize`"""
+    print(f"[TRAZAS] {summary['count']} solicitudes trazadas: "
+          + ", ".join(f"{status}={n}" for status, n in sorted(summary["by_status"].items())))
+    if not summary["count"]:
+        return
+    stages = summary["stages"]
+    total_time = sum(stages["total"]) or 1.0
+    print(f"\n{'Etapa':<15} {'N':>7} {'Media ms':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'Máx ms':>8} {'% tiempo':>9}")
+    print("-" * 79)
+    for name in _stage_order(stages):
+        values = sorted(stages[name])
+        share = "" if name == "total" else f"{sum(values) / total_time * 100:>8.1f}%"
+        print(f"{name:<15} {len(values):>7} {sum(values) / len(values) * 1e3:>9.3f} "
+              f"{percentile(values, 0.5) * 1e3:>8.3f} {percentile(values, 0.95) * 1e3:>8.3f} "
+              f"{percentile(values, 0.99) * 1e3:>8.3f} {values[-1] * 1e3:>8.3f} {share:>9}")
+    
+    print(f"\n{'Operación':<20} {'N':>7} {'Total p50 ms':>13} {'Total p99 ms':>13}  "
+          f"Etapa dominante")
+    print("-" * 79)
+    for operation, op_stages in sorted(summary["by_operation"].items()):
+        totals = sorted(op_stages["total"])
+        dominant = max((name for name in op_stages if name != "total"),
+                       key=lambda name: sum(op_stages[name]), default="-")
+        print(f"{operation:<20} {len(totals):>7} {percentile(totals, 0.5) * 1e3:>13.3f} "
+              f"{percentile(totals, 0.99) * 1e3:>13.3f}  {dominant}")
+    
+    print(f"\nSolicitudes más lentas:")
+    for total, trace in summary["slowest"]:
+        times = stage_times(trace)
+        dominant = max((name for name in times if name != "total"), key=times.get, default="-")
+        print(f"  {total * 1e3:9.3f} ms  {trace.get('operation')} de {trace.get('client_id')} "
+              f"({trace.get('status')}); sobre todo en {dominant} "
+              f"({times.get(dominant, 0.0) * 1e3:.3f} ms)")
+
+
+def main():
+    """Resume el archivo de trazas indicado (por defecto `TRACE_FILE`)"""
+    path = sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE
+    try:
+        print_summary(summarize(read_traces(path)))
+    except FileNotFoundError:
+        print(f"Error: El archivo {path} no existe.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
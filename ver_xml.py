@@ -1,54 +1,252 @@
 #!/usr/bin/env python3
 """
 Script auxiliar para visualizar el contenido del archivo XML de productos
+
+El catálogo del servidor no está solo en el XML: las inserciones
+posteriores a la última compactación siguen en `<xml>.journal`, y con
+`--particiones N` los productos viven en `<base>.shard<i>.xml` (cada uno
+con su diario). Los productos se leen de todos esos archivos, con las
+mismas posiciones que publica el servidor (globales con particiones).
+
+Sin opciones muestra la tabla de productos y el XML formateado; el XML
+formateado es la última instantánea compactada de `--xml` y se carga
+completo (solo apto para catálogos pequeños).
+
+Con `--formato tabla|csv|jsonl` recorre el XML de forma incremental
+(`ET.iterparse`): escribe cada producto en cuanto lo lee y libera los
+elementos ya procesados, de modo que la memoria no crece con el tamaño
+del catálogo (solo con el del diario sin compactar). Admite paginación
+(`--offset`, `--limite`) y filtro por prefijo de ID (`--prefijo`); la
+paginación se aplica tras el filtro y la lectura se detiene al completar
+la página.
+
+Uso:
+    python3 ver_xml.py
+    python3 ver_xml.py --formato csv > productos.csv
+    python3 ver_xml.py --formato jsonl --prefijo PROD-1- --offset 100 --limite 50
 """
 
-import xml.etree.ElementTree as ET
+import argparse
+import csv
+import json
+import os
 import sys
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, Optional, Tuple
+
+from particiones import journal_entries, saved_shard_count, shard_file
 
 XML_FILE = "productos.xml"
+FIELDS = ("id", "nombre", "precio")  # Atributos exportados de cada producto
+STREAM_FORMATS = ("tabla", "csv", "jsonl")
+
+
+def _iter_store(xml_file: str) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """
+    Productos de un XML seguidos de los de su diario sin compactar
+    
+    Cada hijo directo de la raíz ocupa una posición, como en el servidor;
+    las entradas del diario ocupan las siguientes (las de IDs que ya
+    están en el XML se ignoran, como al reaplicar el diario).
+    """
+    pending: Dict[str, Tuple[str, str, str]] = {}
+    for entry in journal_entries(xml_file):
+        pending.setdefault(entry[0], entry)
+    position = 0
+    if os.path.exists(xml_file):
+        depth = 0
+        root = None
+        for event, element in ET.iterparse(xml_file, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            attrs = element.attrib
+            pending.pop(attrs.get("id"), None)
+            yield position, {field: attrs.get(field, "N/A") for field in FIELDS}
+            position += 1
+            root.clear()  # Libera los productos ya procesados
+    elif not pending:
+        raise FileNotFoundError(xml_file)
+    for product_id, nombre, precio in pending.values():
+        yield position, {"id": product_id, "nombre": nombre, "precio": precio}
+        position += 1
+
+
+def iter_catalog(xml_file: str) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """
+    Productos del catálogo completo en orden de posición
+    
+    Con particiones recorre los archivos de todas a la vez: la posición
+    `offset` de la partición `shard` es la global `offset * N + shard`.
+    """
+    num_shards = saved_shard_count(xml_file)
+    if not num_shards:
+        yield from _iter_store(xml_file)
+        return
+    shards = [_iter_store(shard_file(xml_file, shard)) for shard in range(num_shards)]
+    active = list(range(num_shards))
+    while active:
+        remaining = []
+        for shard in active:
+            row = next(shards[shard], None)
+            if row is None:
+                continue
+            offset, product = row
+            yield offset * num_shards + shard, product
+            remaining.append(shard)
+        active = remaining
+
+
+def catalog_exists(xml_file: str) -> bool:
+    """Si hay productos que leer: XML, particiones o diario"""
+    return (os.path.exists(xml_file) or saved_shard_count(xml_file) > 0
+            or next(journal_entries(xml_file), None) is not None)
+
+
+def iter_products(xml_file: str, prefix: str = "", offset: int = 0,
+                  limit: Optional[int] = None) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """
+    Recorre los productos del catálogo sin cargar el documento completo
+    
+    Args:
+        xml_file: Archivo XML de productos (ver `iter_catalog`)
+        prefix: Solo los productos cuyo ID empieza por este prefijo
+        offset: Productos (ya filtrados) que se saltan
+        limit: Máximo de productos devueltos (None: todos)
+    
+    Yields:
+        Tuplas (posición, atributos del producto)
+    """
+    if limit is not None and limit <= 0:
+        return
+    matched = 0
+    emitted = 0
+    for position, product in iter_catalog(xml_file):
+        if not product["id"].startswith(prefix):
+            continue
+        if matched >= offset:
+            yield position, product
+            emitted += 1
+            if limit is not None and emitted >= limit:
+                return
+        matched += 1
+
+
+def write_table(rows: Iterator[Tuple[int, Dict[str, str]]], out) -> int:
+    """Escribe los productos como tabla legible; devuelve cuántos se escribieron"""
+    out.write(f"{'Pos':<5} {'ID':<20} {'Nombre':<25} {'Precio':<10}\n")
+    out.write("-" * 60 + "\n")
+    count = 0
+    for position, product in rows:
+        out.write(f"{position:<5} {product['id']:<20} {product['nombre']:<25} "
+                  f"{product['precio']:<10}\n")
+        count += 1
+    out.write("-" * 60 + "\n")
+    out.write(f"Productos mostrados: {count}\n")
+    return count
+
+
+def write_csv(rows: Iterator[Tuple[int, Dict[str, str]]], out) -> int:
+    """Escribe los productos en CSV con cabecera posicion,id,nombre,precio"""
+    writer = csv.writer(out)
+    writer.writerow(("posicion",) + FIELDS)
+    count = 0
+    for position, product in rows:
+        writer.writerow((position,) + tuple(product[field] for field in FIELDS))
+        count += 1
+    return count
+
+
+def write_jsonl(rows: Iterator[Tuple[int, Dict[str, str]]], out) -> int:
+    """Escribe un objeto JSON por producto y línea (el precio tal como está en el XML)"""
+    count = 0
+    for position, product in rows:
+        out.write(json.dumps({"posicion": position, **product}, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+WRITERS = {"tabla": write_table, "csv": write_csv, "jsonl": write_jsonl}
+
+
+def show_document(xml_file: str):
+    """Muestra el catálogo completo y el XML de la última instantánea de forma legible"""
+    products = list(iter_catalog(xml_file))
+    
+    print("=" * 60)
+    print(f"CONTENIDO DEL ARCHIVO {xml_file}")
+    print("=" * 60)
+    print(f"\nTotal de productos: {len(products)}\n")
+    
+    if len(products) == 0:
+        print("El archivo está vacío (sin productos).")
+    else:
+        print(f"{'Pos':<5} {'ID':<20} {'Nombre':<25} {'Precio':<10}")
+        print("-" * 60)
+        
+        for idx, producto in products:
+            print(f"{idx:<5} {producto['id']:<20} {producto['nombre']:<25} "
+                  f"{producto['precio']:<10}")
+    
+    print("\n" + "=" * 60)
+    
+    if not os.path.exists(xml_file):
+        return
+    # Mostrar XML formateado (sin el diario ni las particiones)
+    tree = ET.parse(xml_file)
+    root = tree.getroot()
+    print("\nXML Formateado (última instantánea compactada):")
+    print("-" * 60)
+    ET.indent(tree, space="  ")
+    print(ET.tostring(root, encoding='unicode'))
+
 
 def main():
-    """Muestra el contenido del archivo XML de forma legible"""
+    """Muestra o exporta el contenido del archivo XML"""
+    parser = argparse.ArgumentParser(description="Visualiza o exporta el catálogo de productos")
+    parser.add_argument("--xml", default=XML_FILE, help="Archivo XML de productos")
+    parser.add_argument("--formato", choices=STREAM_FORMATS, default=None,
+                        help="Exportar en streaming, con memoria constante "
+                             "(sin esta opción se muestra el documento completo)")
+    parser.add_argument("--offset", type=int, default=0,
+                        help="Productos que se saltan (tras aplicar el prefijo)")
+    parser.add_argument("--limite", type=int, default=None,
+                        help="Máximo de productos que se muestran")
+    parser.add_argument("--prefijo", default="", help="Solo los IDs con este prefijo")
+    args = parser.parse_args()
+    if args.formato is None and (args.offset or args.limite is not None or args.prefijo):
+        args.formato = "tabla"  # Paginar o filtrar solo tiene sentido en streaming
+    if args.offset < 0 or (args.limite is not None and args.limite < 0):
+        parser.error("--offset y --limite no pueden ser negativos")
+    
     try:
-        tree = ET.parse(XML_FILE)
-        root = tree.getroot()
-        
-        print("=" * 60)
-        print("CONTENIDO DEL ARCHIVO productos.xml")
-        print("=" * 60)
-        print(f"\nTotal de productos: {len(root)}\n")
-        
-        if len(root) == 0:
-            print("El archivo está vacío (sin productos).")
+        if not catalog_exists(args.xml):
+            raise FileNotFoundError(args.xml)
+        if args.formato is None:
+            show_document(args.xml)
         else:
-            print(f"{'Pos':<5} {'ID':<20} {'Nombre':<25} {'Precio':<10}")
-            print("-" * 60)
-            
-            for idx, producto in enumerate(root):
-                product_id = producto.get("id", "N/A")
-                nombre = producto.get("nombre", "N/A")
-                precio = producto.get("precio", "N/A")
-                print(f"{idx:<5} {product_id:<20} {nombre:<25} {precio:<10}")
-        
-        print("\n" + "=" * 60)
-        
-        # Mostrar XML formateado
-        print("\nXML Formateado:")
-        print("-" * 60)
-        ET.indent(tree, space="  ")
-        print(ET.tostring(root, encoding='unicode'))
-        
+            rows = iter_products(args.xml, args.prefijo, args.offset, args.limite)
+            WRITERS[args.formato](rows, sys.stdout)
+            sys.stdout.flush()
+    
     except FileNotFoundError:
-        print(f"Error: El archivo {XML_FILE} no existe.")
+        print(f"Error: El archivo {args.xml} no existe.", file=sys.stderr)
         sys.exit(1)
     except ET.ParseError as e:
-        print(f"Error al parsear el XML: {e}")
+        print(f"Error al parsear el XML: {e}", file=sys.stderr)
         sys.exit(1)
+    except BrokenPipeError:
+        # El consumidor (p. ej. `head`) cerró la tubería: no es un error
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(0)
     except Exception as e:
-        print(f"Error: {e}")
+        print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
 if __name__ == "__main__":
     main()
-